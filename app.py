@@ -1,13 +1,32 @@
 import streamlit as st
-import json
 import streamlit.components.v1 as components
 from openai import OpenAI
-import threading
 import time
 import random
-import urllib.request
-import urllib.parse
-import re
+import functools
+import hashlib
+import os
+import logging
+import threading
+
+import metrics
+import planner
+from result_cache import ItineraryCache, TripStore
+from retrieval import ContentRetriever, gazetteer_place_lookup
+from search_cache import SearchContextCache
+from wiki_images import WikiThumbnailResolver
+from poi_enrich import PoiEnricher
+from renderer import generate_html_template
+from itinerary_model import Itinerary
+from offline_bundle import BUNDLE_FAILED_NOTE, OfflineBundler, mark_online_only
+from gazetteer import Gazetteer, check_itinerary
+from tile_proxy import TileCache, start_tile_proxy
+from image_proxy import PILLOW_AVAILABLE, ImageCache, start_image_proxy
+from llm_pool import ProviderPool, request_profile
+from resilience import CircuitBreaker, Deadline
+from generation import GenerationExecutor, GenerationProgress, QueueFullError
+
+logger = logging.getLogger(__name__)
 
 # --- 页面配置 ---
 st.set_page_config(
@@ -17,121 +36,57 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# 修复 iframe 滚动导致 sticky-topnav 无法吸顶的问题
-st.markdown("""
-<style>
-/* 强制 iframe 不被撑开，使其能产生内部滚动条，激活内部 position: sticky */
-iframe {
-    height: 85vh !important;
-    border-radius: 12px;
-    box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-}
-/* 隐藏主页多余内边距，使视图更沉浸 */
-.block-container {
-    padding-top: 2rem;
-    padding-bottom: 5rem;
-}
-/* 隐藏右上角的 Streamlit 作者/Deploy 按钮及顶部留白 */
-header[data-testid="stHeader"] {
-    display: none !important;
-}
-/* 彻底隐藏右下角的 footer 'Manage App' 占位及其它官方残余 */
-footer[data-testid="stFooter"],
-div[data-testid="stDecoration"],
-[data-testid="stStatusWidget"],
-[data-testid="stToolbar"],
-[data-testid="stAppDeployButton"],
-#MainMenu {
-    display: none !important;
-    visibility: hidden !important;
-}
-
-/* 强歼 Streamlit Cloud 内部使用强注入样式与 iframe 生成的底层徽章（Git/纸船图标） */
-.viewerBadge_container__1JCIV,
-.viewerBadge_link__1S137,
-.viewerBadge_container__KVmBv,
-[class^="viewerBadge_"],
-[class*="viewerBadge"] {
-    display: none !important;
-    visibility: hidden !important;
-}
-/* 必杀技：根除所有移动端/官方自带的附加上下文锚点与链接 */
-a[href*="share.streamlit.io"], 
-a[href*="github.com"], 
-a[href*="streamlit.io/cloud"],
-a[title="Manage app"],
-a[title="Deploy"],
-button[title="Manage app"],
-button[title="Deploy"],
-.stDeployButton,
-div[data-testid="stAppDeployButton"],
-img[src*="github"],
-svg[title="GitHub"] {
-    display: none !important;
-    opacity: 0 !important;
-    visibility: hidden !important;
-    pointer-events: none !important;
-}
-
-/* 拦截所有以 iframe 形式注入的云端悬浮窗 */
-iframe[src*="badges"],
-iframe[title="streamlitApp"] {
-    display: none !important;
-    visibility: hidden !important;
-    opacity: 0 !important;
-    pointer-events: none !important;
-}
-/* 新版 Streamlit 在移动端底部右侧强行生成的绝对定位悬浮框 */
-div[style*="position: fixed"][style*="bottom:"][style*="right:"] {
-    display: none !important;
-    pointer-events: none !important;
-    z-index: -9999 !important;
-}
-</style>
-""", unsafe_allow_html=True)
-
-# 动态反制 Streamlit Cloud 的跨域 iframe 父级徽章 (解决移动端去不掉 Github 图标的问题)
-components.html(
-    """
-    <script>
-    function forceRemoveCloudBadges() {
-        try {
-            const parentDoc = window.parent.document;
-            if (parentDoc) {
-                // 植入针对 Streamlit Cloud 顶层宿主的隐藏样式
-                const styles = `
-                    .viewerBadge_container__1JCIV, .viewerBadge_link__1S137, 
-                    [class^="viewerBadge_"], [class*="viewerBadge"],
-                    .stDeployButton, [data-testid="stAppDeployButton"] {
-                        display: none !important;
-                        visibility: hidden !important;
-                        opacity: 0 !important;
-                        pointer-events: none !important;
-                    }
-                    /* 最新版部分流式容器右下角固定框 */
-                    div[style*="position: fixed"][style*="bottom"] {
-                        display: none !important;
-                    }
-                `;
-                let styleNode = parentDoc.getElementById('kill-streamlit-badges');
-                if (!styleNode) {
-                    styleNode = parentDoc.createElement('style');
-                    styleNode.id = 'kill-streamlit-badges';
-                    styleNode.innerHTML = styles;
-                    parentDoc.head.appendChild(styleNode);
-                }
-            }
-        } catch (e) {
-            console.log("Cross-origin frame protections prevented badge removal.");
-        }
-    }
-    // 不断轮询确保其刚生成就被强行干掉
-    setInterval(forceRemoveCloudBadges, 800);
-    forceRemoveCloudBadges();
-    </script>
-    """,
-    height=0, width=0,
-)
+# --- 页面外壳 ---
+# 外壳样式（iframe 吸顶修复、官方元素与 Cloud 徽章隐藏、首页标题、结果页全屏）与徽章处理脚本放在 static/ 下，
+# 由 Streamlit 静态文件服务（.streamlit/config.toml 中 enableStaticServing）提供，URL 带内容哈希，内容一变地址就变。
+# Streamlit 的 /app/static/ 不发 Cache-Control，只带 Last-Modified（浏览器按启发式缓存）；
+# 前面有反向代理时可对该路径加 "Cache-Control: public, max-age=31536000, immutable"。
+# 每次 rerun 只发送下面这段很小且内容不变的加载器，
+# 前端看到相同的元素不会重建 iframe，加载器在每个页面生命周期内只执行一次，
+# 把 <link> 与 <script> 注入宿主页面（已注入则跳过）；徽章处理由 shell.js 中的 MutationObserver 完成，不再轮询。
+SHELL_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SHELL_STATIC_URL = "app/static"   # 相对宿主页面地址解析，兼容 server.baseUrlPath
+SHELL_ASSETS = ("shell.css", "shell.js")
+
+
+@st.cache_resource
+def get_shell_loader():
+    digest = hashlib.blake2b(digest_size=6)
+    for name in SHELL_ASSETS:
+        try:
+            with open(os.path.join(SHELL_STATIC_DIR, name), "rb") as f:
+                digest.update(f.read())
+        except OSError as e:
+            # 缺少外壳资源时页面退回 Streamlit 默认外观，不影响行程生成
+            logger.warning("shell asset %s unavailable: %s", name, e)
+    version = digest.hexdigest()
+    return f"""<script>
+(function () {{
+    try {{
+        const doc = window.parent.document;
+        const url = (name) => new URL('{SHELL_STATIC_URL}/' + name + '?v={version}', doc.baseURI).href;
+        if (!doc.getElementById('travel-shell-css')) {{
+            const link = doc.createElement('link');
+            link.id = 'travel-shell-css';
+            link.rel = 'stylesheet';
+            link.href = url('shell.css');
+            doc.head.appendChild(link);
+        }}
+        if (!doc.getElementById('travel-shell-js')) {{
+            const script = doc.createElement('script');
+            script.id = 'travel-shell-js';
+            script.src = url('shell.js');
+            script.dataset.css = url('shell.css');
+            doc.head.appendChild(script);
+        }}
+    }} catch (e) {{
+        console.log("Cross-origin frame protections prevented shell injection.");
+    }}
+}})();
+</script>"""
+
+
+components.html(get_shell_loader(), height=0, width=0)
 
 
 # --- API 配置 ---
@@ -139,591 +94,321 @@ api_key = "sk-060b0e0759944181920f42d90aa3012a"
 base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 model_name = "deepseek-v3.2"
 
+# --- 指标配置 ---
+METRICS_PORT = 9464              # 本地 Prometheus 指标端点 http://127.0.0.1:9464/metrics，设为 None 关闭
+METRICS_EVENTS_PATH = None       # 设为文件路径时，每次观测追加一行 JSONL 事件
+
+
+# 指标导出只在进程内启动一次
+@st.cache_resource
+def start_metrics_exporter():
+    metrics.configure_events(METRICS_EVENTS_PATH)
+    if METRICS_PORT:
+        try:
+            return metrics.start_http_server(METRICS_PORT)
+        except OSError as e:
+            logger.warning("metrics endpoint not started on port %s: %s", METRICS_PORT, e)
+    return None
+
+
+start_metrics_exporter()
+
+# --- 生成执行器配置 ---
+GENERATION_MAX_CONCURRENCY = 4   # 同时进行的大模型生成上限
+GENERATION_MAX_QUEUE = 32        # 排队上限，超出后立即拒绝新的生成请求
+LONG_TRIP_MIN_DAYS = 5           # 达到该天数的行程改为“骨架 + 按天并发”生成
+FANOUT_MAX_WORKERS = 4           # 单个长行程同时生成（或单次生成后补生成）的天数上限
+FANOUT_DAY_RETRIES = 2           # 单天生成失败后的重试次数，只重试这一天
+COMPACT_LLM_OUTPUT = True        # 单次流式生成使用紧凑输出格式（短键 + 位置数组），减少输出 token 与生成耗时
+
+# --- 大模型端点池（对冲请求）---
+# 按顺序为首选与备份端点：首选端点超过其近期 p90 延迟仍未给出结果时，向下一个端点发备份请求，先给出有效行程者胜出；
+# 只配置一个端点时不对冲，与单端点行为一致
+LLM_PROVIDERS = [
+    {"name": "dashscope", "base_url": base_url, "api_key": api_key, "model": model_name},
+    # {"name": "deepseek", "base_url": "https://api.deepseek.com/v1", "api_key": "sk-...", "model": "deepseek-chat"},
+]
+LLM_HEDGE_QUANTILE = 0.9         # 以各端点近期延迟的该分位数作为对冲延迟
+LLM_HEDGE_DEFAULT_TTFT = 6.0     # 样本不足时：首 token 超过该秒数仍未到达即对冲
+LLM_HEDGE_DEFAULT_TOTAL = 90.0   # 样本不足时：总耗时超过该秒数仍未完成即对冲
+LLM_MAX_ATTEMPTS = 2             # 单次生成最多同时请求的端点数（含首选）
+LLM_REQUEST_TIMEOUT = 45.0       # 大模型客户端的连接 / 单次读取超时（秒），防止连接挂死；总时长由 REQUEST_DEADLINE 约束
+LLM_MAX_RETRIES = 1              # 客户端内部重试次数（端点间的切换由对冲与熔断负责）
+
+# --- 上游熔断 ---
+# DuckDuckGo、各大模型端点、Wikipedia 与 Nominatim 各一个熔断器：连续失败达到阈值后，冷却期内直接跳过该上游，
+# 状态导出为 travel_agenda_upstream_breaker_state
+BREAKER_FAILURE_THRESHOLD = 5    # 同一上游连续失败这么多次后熔断
+BREAKER_COOLDOWN = 30.0          # 熔断后的冷却期（秒），期满放行一次试探请求
+
+
+@st.cache_resource
+def get_breakers():
+    return {name: CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+            for name in ("duckduckgo", "wikipedia", "nominatim")}
+
+
+# 各端点的大模型客户端与其 HTTP 连接池、延迟统计在所有会话间复用
+@st.cache_resource
+def get_llm_pool():
+    return ProviderPool(
+        LLM_PROVIDERS,
+        client_factory=lambda config: OpenAI(api_key=config["api_key"], base_url=config["base_url"],
+                                             timeout=LLM_REQUEST_TIMEOUT, max_retries=LLM_MAX_RETRIES),
+        hedge_quantile=LLM_HEDGE_QUANTILE,
+        default_delays={"ttft": LLM_HEDGE_DEFAULT_TTFT, "total": LLM_HEDGE_DEFAULT_TOTAL},
+        max_attempts=LLM_MAX_ATTEMPTS,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        cooldown_seconds=BREAKER_COOLDOWN,
+    )
+
+
+@st.cache_resource
+def get_generation_executor():
+    return GenerationExecutor(max_concurrency=GENERATION_MAX_CONCURRENCY, max_queue=GENERATION_MAX_QUEUE)
+
+
+# --- 缓存配置 ---
+ITINERARY_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "itineraries.sqlite3")
+ITINERARY_CACHE_TTL = 7 * 24 * 3600  # 行程缓存有效期（秒）
+ITINERARY_CACHE_MAX_ENTRIES = 500    # 超出后按最近访问时间淘汰
+CACHE_RENDERED_HTML = True           # 同时缓存渲染好的 HTML，命中时连模板拼装也省掉
+
+
+# 全局共享一份缓存实例，跨会话复用同一个 SQLite 连接
+@st.cache_resource
+def get_itinerary_cache():
+    return ItineraryCache(ITINERARY_CACHE_PATH, ttl_seconds=ITINERARY_CACHE_TTL, max_entries=ITINERARY_CACHE_MAX_ENTRIES)
+
+
+TRIP_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "trips.sqlite3")
+TRIP_STORE_TTL = 90 * 24 * 3600           # 分享链接在最后一次访问后的保留期（秒）
+TRIP_STORE_MAX_ENTRIES = 5000
+TRIP_STORE_MAX_BYTES = 500 * 1024 * 1024  # 行程 JSON + HTML 的总体积上限，超出后按最近访问时间淘汰
+
+
+@st.cache_resource
+def get_trip_store():
+    return TripStore(TRIP_STORE_PATH, ttl_seconds=TRIP_STORE_TTL, max_entries=TRIP_STORE_MAX_ENTRIES,
+                     max_bytes=TRIP_STORE_MAX_BYTES)
+
+
+SEARCH_CONTEXT_DEADLINE = 2.0            # 等待攻略摘要的最长时间（秒），超时不阻塞大模型调用
+SEARCH_CONTEXT_FRESH = 6 * 3600          # 摘要新鲜期（秒），过期后先用旧摘要并后台刷新
+SEARCH_CONTEXT_MAX_AGE = 3 * 24 * 3600   # 摘要最长保留期（秒）
+SEARCH_CONTEXT_MAX_ENTRIES = 1000
+SEARCH_URL = planner.DUCKDUCKGO_HTML_URL  # DuckDuckGo HTML 搜索页地址（压测时指向本地假服务）
+RETRIEVAL_DEADLINE = 1.8                 # 多路检索与网页抓取的截止时间（秒），略短于摘要等待时间，留出排序与交付的余量
+RETRIEVAL_FETCH_PAGES = True             # 抓取排名靠前的结果页并抽取正文；关闭则只用搜索结果摘要
+RETRIEVAL_PAGE_CONCURRENCY = 4           # 同时抓取的网页数上限
+RETRIEVAL_TOKEN_BUDGET = 1200            # 送入大模型的参考资料 token 上限
+
+
+@st.cache_resource
+def get_search_cache():
+    # 多路检索：多个查询变体并发检索 DuckDuckGo（整次检索向熔断器记一次结果），可选抓取结果页正文，去重排序后装入 token 预算；
+    # 内置地名表之外的目的地用本地地名索引判断（未构建索引时只用内置表）
+    gazetteer = get_gazetteer()
+    retriever = ContentRetriever(
+        search=functools.partial(planner.scrape_results, search_url=SEARCH_URL), breaker=get_breakers()["duckduckgo"],
+        fetch_pages=RETRIEVAL_FETCH_PAGES, page_concurrency=RETRIEVAL_PAGE_CONCURRENCY,
+        token_budget=RETRIEVAL_TOKEN_BUDGET, deadline_seconds=RETRIEVAL_DEADLINE,
+        place_lookup=gazetteer_place_lookup(gazetteer) if gazetteer is not None else None)
+    return SearchContextCache(fetcher=retriever.retrieve,
+                              fresh_seconds=SEARCH_CONTEXT_FRESH, max_age_seconds=SEARCH_CONTEXT_MAX_AGE,
+                              max_entries=SEARCH_CONTEXT_MAX_ENTRIES)
+
+
+RESOLVE_IMAGES_SERVER_SIDE = True        # 服务端批量解析维基配图并写入页面，关闭则退回浏览器逐个查询
+TIP_ROTATE_SECONDS = 3                   # 加载页旅行小知识的轮换间隔（秒）
+RESULT_DELIVERY_BUDGET_MS = 100          # 结果就绪 -> 开始渲染的延迟预算，超出时记录告警
+MAP_MODE = "day"                         # "day" 每天一张地图 + 全程聚合总览；"activity" 每个活动一张小地图
+LAZY_ROOT_MARGIN = "600px 0px"           # 卡片距视口这么近时才加载照片、地图与 POI，远离后销毁地图；None 为打开即全部加载
+
+
+@st.cache_resource
+def get_wiki_resolver():
+    return WikiThumbnailResolver(breaker=get_breakers()["wikipedia"])
+
+
+ENRICH_POIS_SERVER_SIDE = True           # 服务端经限速队列统一补全周边 POI，关闭则退回浏览器逐个查询 Nominatim
+POI_ENRICH_DEADLINE = 3.0                # 等待 POI 补全的最长时间（秒）；到期后仍在排队、已无人等待的网格直接丢弃，
+                                         # 不会回填缓存（只有已开始查询的网格会写入缓存）
+
+
+# 全进程共享一条限速队列，保证对 Nominatim 不超过 1 次/秒
+@st.cache_resource
+def get_poi_enricher():
+    return PoiEnricher(breaker=get_breakers()["nominatim"])
 
 
-# --- 核心逻辑：HTML 生成器 ---
-def generate_html_template(json_data):
+# --- 请求截止时间 ---
+# 一次请求（检索 -> 大模型生成 -> 配图与 POI）共用一个总截止时间，各阶段的可用时间取“阶段预算”与“剩余时间”的较小者；
+# 大模型阶段没有单独预算，可用检索之后的全部剩余时间
+REQUEST_DEADLINE = 150.0                 # 单次请求的总截止时间（秒），从提交输入开始计（含排队）
+IMAGE_RESOLVE_DEADLINE = 4.0             # 服务端解析维基配图的时间预算（秒）
+
+
+def new_request_deadline():
+    return Deadline(REQUEST_DEADLINE, {
+        "search": SEARCH_CONTEXT_DEADLINE,
+        "images": IMAGE_RESOLVE_DEADLINE,
+        "pois": POI_ENRICH_DEADLINE,
+    })
+
+
+TILE_PROXY_ENABLED = False              # 地图瓦片经本地缓存代理加载（磁盘 LRU + 合并并发请求）
+TILE_PROXY_PORT = 8765
+TILE_PROXY_PUBLIC_URL = "http://localhost:8765"   # 浏览器访问代理的地址，部署在反向代理后面时改成对外路径
+TILE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tiles")
+TILE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+@st.cache_resource
+def start_tile_proxy_server():
+    cache = TileCache(TILE_CACHE_DIR, max_bytes=TILE_CACHE_MAX_BYTES)
     try:
-        data = json_data
-        if isinstance(data, str):
-            data = json.loads(data)
-    except:
-        return "<h3>JSON 解析失败，请重试</h3>"
-
-    trip_title = data.get("trip_title", "MY JOURNEY")
-    trip_subtitle = data.get("trip_subtitle", "Travel Itinerary")
-    overview = data.get("overview", "")
-    highlights = data.get("highlights", [])
-    days_data = data.get("days", [])
-
-    # 封面图：用 AI 返回的 cover_search 关键词 + 标题哈希种子，确保同一行程始终用同一张图
-    cover_search = data.get("cover_search", trip_title).replace(" ", "+")
-    # 封面图关键词：利用 Bing Thumbnail 接口作为绝对备用抓取源，彻底弃用 Unsplash
-    cover_url = f"https://tse1.mm.bing.net/th?q={cover_search}+travel+scenery&w=1080&h=1600&c=7&rs=1&p=0"
-
-
-    # 生成日期快捷跳转按钮 HTML
-    nav_buttons_html = ""
-    for i, day in enumerate(days_data):
-        date_label = day.get("date", f"Day {i+1}")
-        city_label = day.get("city", "")
-        nav_buttons_html += f"""<a onclick="document.getElementById('day-{i}').scrollIntoView({{behavior:'smooth', block:'start'}}); return false;" class="nav-pill" href="javascript:void(0)">{date_label}<span class="nav-city">{city_label}</span></a>"""
-
-    # 亮点 HTML
-    highlights_html = ""
-    if highlights:
-        highlights_html = '<div class="highlights-grid">'
-        highlight_icons = ["🏛️", "🍜", "🌸", "🎭", "🛕", "🌊", "🏔️", "🎉", "🎨", "🚂"]
-        for idx, h in enumerate(highlights):
-            icon = highlight_icons[idx % len(highlight_icons)]
-            highlights_html += f'<div class="highlight-chip"><span class="highlight-icon">{icon}</span><span contenteditable="true">{h}</span></div>'
-        highlights_html += '</div>'
-
-    # 生成 HTML
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
-        <link href="https://fonts.googleapis.com/css2?family=Italiana&family=Cinzel:wght@700&family=Noto+Serif+SC:wght@500;700&family=Inter:wght@400;500;600&display=swap" rel="stylesheet">
-        <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" />
-        <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
-        <!-- Leaflet Fullscreen Plugin -->
-        <script src='https://api.mapbox.com/mapbox.js/plugins/leaflet-fullscreen/v1.0.1/Leaflet.fullscreen.min.js'></script>
-        <link href='https://api.mapbox.com/mapbox.js/plugins/leaflet-fullscreen/v1.0.1/leaflet.fullscreen.css' rel='stylesheet' />
-        <style>
-            :root {{
-                --bg-color: #f0ebe3;
-                --card-bg: #fdfbf7;
-                --primary-dark: #2c2418;
-                --accent-color: #b8860b;
-                --accent-light: #daa520;
-                --text-muted: #7a6e5f;
-                --border-soft: rgba(74, 59, 42, 0.12);
-            }}
-            * {{ box-sizing: border-box; }}
-            body {{ margin: 0; font-family: 'Noto Serif SC', serif; background-color: var(--bg-color); color: var(--primary-dark); overflow-x: clip; }}
-            
-            /* ===== 海报区域 ===== */
-            .header-container {{ position: relative; width: 100%; height: 50vh; min-height: 350px; overflow: hidden; background: #1a1a1a; }}
-            .header-poster {{ width: 100%; height: 100%; object-fit: cover; position: absolute; z-index: 1; opacity: 0; transition: opacity 1s ease; }}
-            .header-poster.loaded {{ opacity: 1; }}
-            .poster-overlay {{ position: absolute; top: 0; left: 0; width: 100%; height: 100%; background: linear-gradient(to bottom, rgba(0,0,0,0.1) 0%, rgba(0,0,0,0) 30%, rgba(0,0,0,0.65) 80%, rgba(0,0,0,0.9) 100%); z-index: 2; }}
-            .header-title-box {{ position: absolute; bottom: 50px; width: 100%; text-align: center; color: #fff; z-index: 5; text-shadow: 0 3px 15px rgba(0,0,0,0.7); }}
-            .main-title {{ font-family: 'Italiana', serif; font-size: 48px; margin: 0; text-transform: uppercase; letter-spacing: 6px; animation: fadeUp 1.2s ease; }}
-            .sub-title {{ font-family: 'Cinzel', serif; font-size: 14px; letter-spacing: 4px; border-top: 1px solid rgba(255,255,255,0.5); display: inline-block; padding-top: 12px; margin-top: 14px; opacity: 0.9; }}
-            @keyframes fadeUp {{ from {{ opacity: 0; transform: translateY(30px); }} to {{ opacity: 1; transform: translateY(0); }} }}
-            
-            /* ===== 顶部固定导航栏 ===== */
-            .sticky-topnav {{
-                position: sticky; top: 0; z-index: 200;
-                background: rgba(240,235,227,0.96);
-                backdrop-filter: blur(8px);
-                -webkit-backdrop-filter: blur(8px);
-                border-bottom: 1px solid var(--border-soft);
-                padding: 10px 16px;
-                display: flex; gap: 8px; align-items: center; justify-content: center;
-                overflow-x: auto; white-space: nowrap;
-                -webkit-overflow-scrolling: touch;
-                scrollbar-width: none;
-            }}
-            .sticky-topnav::-webkit-scrollbar {{ display: none; }}
-            .nav-pill {{
-                display: inline-flex; flex-direction: column; align-items: center; flex-shrink: 0;
-                padding: 6px 14px; border-radius: 20px;
-                background: var(--card-bg); border: 1.5px solid var(--border-soft);
-                color: var(--primary-dark); text-decoration: none; cursor: pointer;
-                font-family: 'Cinzel', serif; font-size: 12px; font-weight: 700;
-                transition: all 0.2s ease; box-shadow: 0 1px 4px rgba(0,0,0,0.05);
-                white-space: nowrap;
-            }}
-            .nav-pill:hover, .nav-pill.active {{
-                background: var(--accent-color); color: #fff;
-                border-color: var(--accent-color); box-shadow: 0 3px 10px rgba(184,134,11,0.3);
-            }}
-            .nav-pill .nav-city {{ font-family: 'Noto Serif SC', serif; font-size: 9px; opacity: 0.7; margin-top: 2px; }}
-            .nav-pill:hover .nav-city, .nav-pill.active .nav-city {{ opacity: 1; }}
-            .nav-divider {{ width: 1px; height: 24px; background: var(--border-soft); flex-shrink: 0; margin: 0 2px; }}
-
-            .overview-label {{ font-family: 'Cinzel', serif; font-size: 11px; letter-spacing: 3px; text-transform: uppercase; color: var(--accent-color); margin-bottom: 8px; }}
-            .overview-text {{ font-size: 15px; line-height: 1.9; color: var(--text-muted); text-align: justify; margin-bottom: 20px; }}
-            
-            .highlights-grid {{ display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 10px; }}
-            .highlight-chip {{
-                display: inline-flex; align-items: center; gap: 6px;
-                background: var(--card-bg); border: 1px solid var(--border-soft);
-                padding: 8px 14px; border-radius: 20px; font-size: 13px;
-                transition: all 0.2s ease;
-            }}
-            .highlight-chip:hover {{ background: #fff8e7; border-color: var(--accent-light); }}
-            .highlight-icon {{ font-size: 16px; }}
-            
-            .section-divider {{ height: 1px; background: linear-gradient(to right, transparent, var(--border-soft), var(--accent-color), var(--border-soft), transparent); margin: 24px 0; }}
-            
-            /* ===== 弹窗模态框 ===== */
-            .modal-overlay {{
-                position: fixed; top: 0; left: 0; width: 100vw; height: 100vh;
-                background: rgba(0,0,0,0.6); backdrop-filter: blur(4px); -webkit-backdrop-filter: blur(4px);
-                z-index: 1000; display: none; align-items: center; justify-content: center;
-                opacity: 0; transition: opacity 0.3s ease;
-            }}
-            .modal-overlay.show {{ display: flex; opacity: 1; }}
-            .overview-modal {{
-                width: 90%; max-width: 600px; max-height: 80vh; overflow-y: auto;
-                background: var(--bg-color); border-radius: 20px; padding: 30px 24px;
-                box-shadow: 0 10px 40px rgba(0,0,0,0.2); position: relative;
-                transform: translateY(20px); transition: transform 0.3s ease;
-            }}
-            .modal-overlay.show .overview-modal {{ transform: translateY(0); }}
-            .close-modal-btn {{
-                position: absolute; top: 16px; right: 16px;
-                background: rgba(0,0,0,0.05); border: none; font-size: 18px; color: var(--text-muted);
-                width: 32px; height: 32px; border-radius: 50%; cursor: pointer;
-                display: flex; align-items: center; justify-content: center; transition: all 0.2s;
-            }}
-            .close-modal-btn:hover {{ background: #ff4d4f; color: #fff; }}
-
-            /* ===== 时间线 ===== */
-            .timeline-container {{ max-width: 640px; margin: 0 auto; padding: 0 16px 60px; }}
-            .day-header {{
-                position: sticky; top: 53px; z-index: 100;
-                background: linear-gradient(to bottom, var(--bg-color) 80%, rgba(240,235,227,0));
-                padding: 18px 0 12px; display: flex; justify-content: space-between; align-items: baseline;
-                margin-bottom: 20px; border-bottom: 2px solid var(--primary-dark);
-            }}
-            .day-num {{ font-family: 'Cinzel', serif; font-size: 24px; font-weight: 800; letter-spacing: 1px; }}
-            .day-city {{ font-family: 'Inter', sans-serif; font-size: 12px; font-weight: 600; letter-spacing: 2px; color: var(--accent-color); text-transform: uppercase; }}
-            
-            .timeline-item {{ position: relative; padding-left: 20px; margin-bottom: 35px; border-left: 2px dashed rgba(74, 59, 42, 0.2); margin-left: 60px; }}
-            .timeline-item::before {{ content: ''; position: absolute; left: -8px; top: 6px; width: 14px; height: 14px; background: var(--accent-light); border-radius: 50%; border: 3px solid var(--bg-color); z-index: 2; }}
-            .time-label {{ position: absolute; left: -65px; top: 3px; width: 45px; text-align: right; font-family: 'Inter', sans-serif; font-size: 13px; font-weight: 700; color: var(--primary-dark); }}
-            
-            .card {{ background: var(--card-bg); border-radius: 12px; box-shadow: 0 4px 20px rgba(0,0,0,0.06); overflow: hidden; margin-top: 8px; transition: transform 0.2s ease, box-shadow 0.2s ease; position: relative; }}
-            .card:hover {{ transform: translateY(-2px); box-shadow: 0 8px 30px rgba(0,0,0,0.1); }}
-            .location-name {{ font-size: 17px; font-weight: bold; margin-bottom: 6px; display: inline-block; padding-right: 30px; }}
-            
-            /* 删除按钮 (大卡片层级) - 轻量优雅 */
-            .delete-btn {{
-                position: absolute; top: 10px; right: 10px; z-index: 600;
-                width: 26px; height: 26px; border-radius: 50%;
-                background: rgba(0,0,0,0.04); border: none;
-                color: #999; font-size: 14px;
-                display: flex; align-items: center; justify-content: center;
-                cursor: pointer; transition: all 0.2s ease; text-decoration: none;
-            }}
-            .delete-btn:hover {{ background: #ff4d4f; color: #fff; transform: scale(1.1); }}
-            
-            /* 删除局部媒体 (地图/图片) */
-            .remove-media-btn {{
-                position: absolute; top: 8px; right: 8px; z-index: 600;
-                width: 22px; height: 22px; border-radius: 50%;
-                background: rgba(0,0,0,0.5); border: none;
-                color: #fff; font-size: 10px; font-weight: normal;
-                display: flex; align-items: center; justify-content: center;
-                cursor: pointer; transition: background 0.2s; backdrop-filter: blur(2px);
-            }}
-            .remove-media-btn:hover {{ background: #ff4d4f; }}
-            
-            /* 地图 */
-            .map-section {{ height: 160px; width: 100%; position: relative; z-index: 1; border-bottom: 2px solid var(--border-soft); }}
-            .nav-to-btn-group {{ position: absolute; bottom: 10px; right: 10px; z-index: 500; display: flex; gap: 6px; }}
-            .nav-btn {{
-                background: rgba(255,255,255,0.9); color: #333; border: 1px solid #ddd;
-                padding: 6px 12px; border-radius: 20px; font-size: 11px; font-weight: 600;
-                cursor: pointer; text-decoration: none; box-shadow: 0 2px 6px rgba(0,0,0,0.15); transition: background 0.2s;
-            }}
-            .nav-btn:hover {{ background: #fff; }}
-            .nav-btn.amap {{ color: #2577e3; border-color: #2577e3; }}
-            
-            /* 景点照片（留足间距） */
-            .photo-wrapper {{ height: 220px; width: 100%; position: relative; background: linear-gradient(135deg, #e8e0d4, #d4cbbe); overflow: hidden; margin-top: 32px; border-radius: 8px 8px 0 0; border-top: 2px solid var(--border-soft); }}
-            .photo-wrapper img {{ width: 100%; height: 100%; object-fit: cover; opacity: 0; transition: opacity 0.6s ease; }}
-            .photo-wrapper img.loaded {{ opacity: 1; }}
-            .photo-placeholder {{ position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-size: 14px; color: var(--text-muted); }}
-            
-            /* 备注设计 */
-            .remark-box {{ padding: 16px; background: #fff; border-top: 1px solid var(--border-soft); }}
-            .remark-label {{ font-family: 'Cinzel', serif; font-size: 10px; letter-spacing: 2px; color: var(--accent-color); margin-bottom: 6px; display: flex; align-items: center; gap: 4px; }}
-            .remark-text {{ font-size: 14px; line-height: 1.75; color: #555; }}
-            
-            /* 可编辑样式 */
-            [contenteditable="true"]:hover {{ background: rgba(255, 235, 59, 0.15); cursor: text; outline: 1px dashed #ccc; border-radius: 4px; }}
-            [contenteditable="true"]:focus {{ background: rgba(255, 235, 59, 0.25); outline: 2px solid var(--accent-light); border-radius: 4px; }}
-            
-            /* 打印按钮 */
-            .print-btn {{
-                position: fixed; bottom: 24px; right: 24px;
-                background: linear-gradient(135deg, var(--accent-color), var(--accent-light));
-                color: white; border: none; padding: 14px 24px; border-radius: 30px;
-                box-shadow: 0 6px 20px rgba(184,134,11,0.4); z-index: 1000; cursor: pointer;
-                font-weight: bold; font-size: 14px; letter-spacing: 0.5px;
-                transition: transform 0.2s, box-shadow 0.2s;
-            }}
-            .print-btn:hover {{ transform: translateY(-2px); box-shadow: 0 8px 25px rgba(184,134,11,0.5); }}
-            
-            /* 回到顶部 */
-            .top-btn {{
-                position: fixed; bottom: 24px; left: 24px;
-                background: var(--primary-dark); color: #fff; border: none;
-                padding: 12px 16px; border-radius: 50%; font-size: 18px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.2); z-index: 1000; cursor: pointer;
-                transition: transform 0.2s;
-            }}
-            .top-btn:hover {{ transform: translateY(-3px); }}
-            
-            @media print {{
-                .print-btn, .top-btn, .nav-to-btn, .sticky-topnav, .delete-btn, .remove-media-btn {{ display: none; }}
-                .header-container {{ height: 45vh; }}
-                body {{ -webkit-print-color-adjust: exact; print-color-adjust: exact; }}
-            }}
-            
-            /* ===== 手机端自适应 (max-width: 600px) ===== */
-            @media (max-width: 600px) {{
-                /* 海报标题变小 */
-                .main-title {{ font-size: 28px; letter-spacing: 3px; }}
-                .sub-title {{ font-size: 11px; letter-spacing: 2px; }}
-                .header-container {{ height: 40vh; min-height: 250px; }}
-                .header-title-box {{ bottom: 30px; }}
-
-                /* 总览區内边距变小 */
-                .overview-section {{ padding: 20px 14px 10px; }}
-                .overview-text {{ font-size: 14px; }}
-                .highlight-chip {{ padding: 6px 10px; font-size: 12px; }}
-                .nav-pill {{ padding: 7px 12px; font-size: 12px; }}
-
-                /* 时间线：小屏上保留时间，使其嵌入行内并可编辑，减小 margin */
-                .timeline-container {{ padding: 0 12px 60px; }}
-                .timeline-item {{ margin-left: 0; padding-left: 18px; }}
-                .time-label {{ position: static; display: inline-block; padding-right: 6px; font-size: 14px; text-align: left; width: auto; color: var(--accent-light); }}
-                .timeline-item::before {{ left: -7px; width: 12px; height: 12px; }}
-                .location-name {{ font-size: 15px; display: inline; }}
-                .day-num {{ font-size: 20px; }}
-
-                /* 地图和图片 */
-                .map-section {{ height: 140px; }}
-                .photo-wrapper {{ height: 180px; }}
-                .remark-box {{ font-size: 13px; padding: 12px; }}
-
-                /* 导航按钮加大点击区域 */
-                .nav-btn {{ padding: 8px 14px; font-size: 12px; }}
-                
-                /* 打印和回顶按钮移动下方避免遮住内容 */
-                .print-btn {{ bottom: 16px; right: 12px; padding: 10px 16px; font-size: 13px; }}
-                .top-btn {{ bottom: 16px; left: 12px; padding: 10px 13px; font-size: 16px; }}
-            }}
-
-            html {{ scroll-behavior: smooth; scroll-padding-top: 65px; }}
-        </style>
-    </head>
-    <body>
-        <!-- 海报区 -->
-        <div class="header-container">
-            <!-- 动态加载封面：摒弃 Unsplash, 这里用 JS 异步通过 Wiki/Bing 抓取 -->
-            <img id="main-cover-img" src="" class="header-poster" onload="this.classList.add('loaded')" onerror="this.src='https://tse1.mm.bing.net/th?q={trip_title}+travel&w=1080&h=1600&c=7&rs=1&p=0'; this.classList.add('loaded');">
-            <div class="poster-overlay"></div>
-            <div class="header-title-box">
-                <h1 class="main-title" contenteditable="true">{trip_title}</h1>
-                <p class="sub-title" contenteditable="true">{trip_subtitle}</p>
-            </div>
-        </div>
+        start_tile_proxy(cache, TILE_PROXY_PORT)
+    except OSError as e:
+        logger.warning("tile proxy not started on port %s: %s", TILE_PROXY_PORT, e)
+        return None
+    return cache
 
-        <!-- 顶部固定快捷导航栏 -->
-        <div class="sticky-topnav">
-            <a class="nav-pill" onclick="openModal('section-overview'); return false;" href="javascript:void(0)">总览<span class="nav-city">Overview</span></a>
-            <a class="nav-pill" onclick="openModal('section-highlights'); return false;" href="javascript:void(0)">亮点<span class="nav-city">Highlights</span></a>
-            <div class="nav-divider"></div>
-            {nav_buttons_html}
-        </div>
 
-        <!-- 弹窗模态框：总览 + 亮点 -->
-        <div class="modal-overlay" id="info-modal" onclick="if(event.target===this) closeModal();">
-            <div class="overview-modal">
-                <button class="close-modal-btn" onclick="closeModal()">✖</button>
-                <div id="section-overview">
-                    <p class="overview-label">✦ Trip Overview</p>
-                    <p class="overview-text" contenteditable="true">{overview}</p>
-                </div>
-                <div class="section-divider"></div>
-                <div id="section-highlights">
-                    <p class="overview-label">✦ Highlights</p>
-                    {highlights_html}
-                </div>
-            </div>
-        </div>
-        
-        <!-- 时间线 -->
-        <div class="timeline-container">
-            <button class="print-btn" onclick="window.print()">🖨️ 保存行程 (PDF)</button>
-            <button class="top-btn" onclick="window.scrollTo({{top:0, behavior:'smooth'}})">↑</button>
-    """
-    
-    js_map_data = []
-    map_counter = 0
-
-    for day_idx, day in enumerate(days_data):
-        date = day.get("date", "Day")
-        city = day.get("city", "").upper()
-        html += f"""<div id="day-{day_idx}" class="day-header"><span class="day-num" contenteditable="true">{date}</span><span class="day-city" contenteditable="true">{city}</span></div>"""
-        
+if TILE_PROXY_ENABLED:
+    start_tile_proxy_server()
+
+
+IMAGE_PROXY_ENABLED = False             # 配图经本地代理按卡片 / 封面尺寸缩放并转为 WebP/AVIF（需配合 RESOLVE_IMAGES_SERVER_SIDE）
+IMAGE_PROXY_PORT = 8766
+IMAGE_PROXY_PUBLIC_URL = "http://localhost:8766"  # 浏览器访问代理的地址，部署在反向代理后面时改成对外路径
+IMAGE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "images")
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+@st.cache_resource
+def start_image_proxy_server():
+    if not PILLOW_AVAILABLE:
+        # 只在启动时提示一次：缺 Pillow 时代理仍可用，但只透传原图，不缩放也不转 WebP/AVIF
+        logger.warning("Pillow is not installed: image proxy will pass originals through without resizing")
+    cache = ImageCache(IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES)
+    try:
+        start_image_proxy(cache, IMAGE_PROXY_PORT)
+    except OSError as e:
+        logger.warning("image proxy not started on port %s: %s", IMAGE_PROXY_PORT, e)
+        return None
+    return cache
+
+
+if IMAGE_PROXY_ENABLED:
+    start_image_proxy_server()
+
+
+# 由 `python gazetteer.py build <GeoNames 文件>` 生成；文件不存在时跳过坐标校验
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "gazetteer.idx")
+GEO_SNAP_KM = 1.0                        # 同名地点偏离超过该距离时吸附过去
+GEO_SEARCH_KM = 30.0                     # 只在原坐标（或当天城市）附近这么远的范围内认同名地点
+GEO_MAX_JUMP_KM = 300.0                  # 同一天相邻两站超过该距离时记录告警
+
+
+@st.cache_resource
+def get_gazetteer():
+    return Gazetteer(GAZETTEER_PATH) if os.path.exists(GAZETTEER_PATH) else None
+
+
+OFFLINE_BUNDLE_ENABLED = True           # 结果页提供“离线版”下载：前端库、字体子集与配图全部内联进单个 HTML
+
+
+@st.cache_resource
+def get_offline_bundler():
+    return OfflineBundler()
+
+
+# --- 流式预览：行程逐天到达时的轻量 Markdown 展示 ---
+def render_stream_preview(partial):
+    md = f"### {partial.get('trip_title', '')}\n\n"
+    if partial.get("overview"):
+        md += f"{partial['overview']}\n\n"
+    if partial.get("highlights"):
+        md += " · ".join(f"✦ {h}" for h in partial["highlights"]) + "\n\n"
+    for i, day in sorted(partial.get("days", {}).items()):
+        md += f"**{day.get('date', f'Day {i+1}')} · {day.get('city', '')}**\n\n"
         for act in day.get("activities", []):
-            map_counter += 1
-            map_id = f"map-{map_counter}"
-            
-            time = act.get("time", "")
-            name = act.get("name", "")
-            desc = act.get("desc", "")
-            lat = act.get("lat", 0)
-            lng = act.get("lng", 0)
-            # Wikipedia 图片 ID（程序详见 JS 部分动态加载）
-            wiki_query = act.get("img_keyword", name)
-            photo_id = f"photo-{map_id}"
-            fallback_url = f"https://tse1.mm.bing.net/th?q={wiki_query}+travel&w=600&h=400&c=7&rs=1&p=0"
-            
-            # 导航链接
-            nav_google = f"https://www.google.com/maps/search/?api=1&query={lat},{lng}"
-            nav_amap = f"https://uri.amap.com/navigation?to={lng},{lat},{name}"
-            
-            js_map_data.append({"id": map_id, "lat": lat, "lng": lng, "name": name, "wiki_query": wiki_query, "photo_id": photo_id})
-            
-            html += f"""
-            <div class="timeline-item">
-                <span class="time-label" contenteditable="true">{time}</span>
-                <span class="location-name" contenteditable="true">{name}</span>
-                <div class="card">
-                    <button class="delete-btn" title="删除此行程" onclick="this.closest('.timeline-item').remove()">✖</button>
-                    <div class="map-section" id="{map_id}">
-                        <button class="remove-media-btn" title="删除地图" onclick="this.parentElement.remove()">✖</button>
-                        <div class="nav-to-btn-group">
-                            <a href="{nav_amap}" target="_blank" class="nav-btn amap">高德</a>
-                            <a href="{nav_google}" target="_blank" class="nav-btn">Google</a>
-                        </div>
-                    </div>
-                    <div class="photo-wrapper">
-                        <button class="remove-media-btn" title="删除照片" onclick="this.parentElement.remove()">✖</button>
-                        <span class="photo-placeholder">📷 加载中...</span>
-                        <img id="{photo_id}" src="" onload="this.classList.add('loaded'); this.previousElementSibling.style.display='none';" onerror="this.src='{fallback_url}'; this.classList.add('loaded'); this.previousElementSibling.style.display='none';">
-                    </div>
-                    <div class="remark-box">
-                        <div class="remark-label">💡 TIPS</div>
-                        <div class="remark-text" contenteditable="true">{desc}</div>
-                    </div>
-                </div>
-            </div>
-            """
+            md += f"- `{act.get('time', '')}` {act.get('name', '')}\n"
+        md += "\n"
+    md += "_更多天数正在生成中……_"
+    return md
+
+
+# --- 结果页：渲染并全屏展示行程 ---
+def render_itinerary_html(json_data, deadline=None):
+    # deadline 为本次请求的截止时间；打开已保存的行程时单独计时
+    deadline = deadline or new_request_deadline()
+    image_urls = pois = None
+    if RESOLVE_IMAGES_SERVER_SIDE:
+        image_urls = get_wiki_resolver().resolve_itinerary(json_data, deadline_seconds=deadline.budget("images"))
+    if ENRICH_POIS_SERVER_SIDE:
+        pois = get_poi_enricher().enrich_itinerary(json_data, deadline_seconds=deadline.budget("pois"))
+    with metrics.STAGE_SECONDS.time(stage="render"):
+        html_code = generate_html_template(json_data, image_urls, map_mode=MAP_MODE, pois=pois,
+                                           tile_proxy_url=TILE_PROXY_PUBLIC_URL if TILE_PROXY_ENABLED else None,
+                                           image_proxy_url=IMAGE_PROXY_PUBLIC_URL if IMAGE_PROXY_ENABLED else None,
+                                           lazy_root_margin=LAZY_ROOT_MARGIN)
+    metrics.HTML_BYTES.observe(len(html_code.encode("utf-8")))
+    image_cache = start_image_proxy_server() if IMAGE_PROXY_ENABLED else None
+    if image_cache is not None and image_urls:
+        # 后台预生成本行程的配图（首位访客即命中缓存），并记录页面总重量
+        threading.Thread(target=report_page_weight, args=(image_cache, image_urls, html_code),
+                         name="image-report", daemon=True).start()
+    return html_code
+
+
+def report_page_weight(image_cache, image_urls, html_code):
+    report = image_cache.trip_report(image_urls, html_code)
+    metrics.PAGE_WEIGHT_BYTES.observe(report["image_bytes"], part="images")
+    metrics.PAGE_WEIGHT_BYTES.observe(report["source_bytes"], part="source_images")
+    metrics.PAGE_WEIGHT_BYTES.observe(report["page_bytes"], part="page")
+    logger.info("page weight: %s", report)
+
+
+def show_itinerary(json_data, html_code, message="✨ 生成成功！您可以在下方直接编辑文字，点击右下角按钮保存为 PDF。"):
+    st.success(message)
+    total_days = len(json_data.days)
+    total_acts = json_data.activity_count
+    # 只要给一个基础 height 让内部能生出滚动条（CSS已经通过 100vh 进行覆盖接管全屏高度） 
+    components.html(html_code, height=800, scrolling=True)
+
+    if OFFLINE_BUNDLE_ENABLED:
+        offline_bundler = get_offline_bundler()
+        wiki_resolver = get_wiki_resolver()
+        poi_enricher = get_poi_enricher()
+
+        # 打包放在 download_button 的 data 回调里：首次渲染结果页时不执行，点击下载时才同步打包，需等待打包完成
+        def build_offline_bundle():
+            try:
+                bundle = offline_bundler.build(
+                    json_data, wiki_resolver.resolve_itinerary(json_data),
+                    pois=poi_enricher.enrich_itinerary(json_data, deadline_seconds=POI_ENRICH_DEADLINE),
+                    map_mode=MAP_MODE)
+            except Exception:
+                # 打包失败时仍给出可用的文件：当前页面（资源走 CDN），顶部提示需联网打开
+                logger.exception("offline bundle build failed, serving the online page instead")
+                return mark_online_only(html_code, BUNDLE_FAILED_NOTE)
+            metrics.STAGE_SECONDS.observe(bundle["report"]["build_seconds"], stage="offline_bundle")
+            logger.info("offline bundle built: %s", bundle["report"])
+            return bundle["html"]
+
+        st.download_button("📦 下载离线版", data=build_offline_bundle, file_name="itinerary.html",
+                           mime="text/html", key="offline_bundle", on_click="ignore")
+    
+    # 行程生成展示成功后，输出全屏标记：static/shell.css 中以 .stApp:has(.itinerary-fullscreen) 限定的规则随之生效，
+    # 隐藏底部输入框与底座黑框，并让行程单 iframe 铺满屏幕
+    st.markdown('<div class="itinerary-fullscreen"></div>', unsafe_allow_html=True)
 
-    # JS 注入 — 地图 + 附近 POI
-    js_data = json.dumps(js_map_data, ensure_ascii=False)
-    html += f"""
-        </div>
-        <script>
-            const mapPoints = {js_data};
-            const coverSearchQuery = "{cover_search}";
-            
-            document.addEventListener("DOMContentLoaded", function () {{
-                
-                // --- 1. 动态加载首页大图 (使用 Wikipedia API 或备用 Bing API) ---
-                var coverImgEl = document.getElementById('main-cover-img');
-                var genericFallback = 'https://tse1.mm.bing.net/th?q=' + encodeURIComponent(coverSearchQuery + " travel scenery") + '&w=1080&h=1600&c=7&rs=1&p=0';
-                fetch('https://en.wikipedia.org/w/api.php?action=query&titles=' + encodeURIComponent(coverSearchQuery.split(' ')[0]) + '&prop=pageimages&format=json&pithumbsize=1600&origin=*')
-                    .then(r => r.json())
-                    .then(d => {{
-                        var pages = d.query.pages;
-                        var page = pages[Object.keys(pages)[0]];
-                        if (page && page.thumbnail) {{
-                            coverImgEl.src = page.thumbnail.source;
-                        }} else {{
-                            // 如果 Wiki 没找到，使用 Bing 缩略图接口 (绝对彻底弃用 Unsplash)
-                            coverImgEl.src = genericFallback;
-                        }}
-                    }}).catch(() => {{ coverImgEl.src = genericFallback; }});
-
-
-                // --- 2. 加载行程地图与景点图片 ---
-                mapPoints.forEach(pt => {{
-                        // Google Map 全球层源 (更稳定更丰富)
-                        var googleLayer = L.tileLayer('https://mt1.google.com/vt/lyrs=m&x={{x}}&y={{y}}&z={{z}}', {{ maxZoom: 19 }});
-                        // 高德地图 HTTPS 兼容版：使用 wprd 子域名，确保能够正常加载显示
-                        var amapLayer = L.tileLayer('https://wprd01.is.autonavi.com/appmaptile?x={{x}}&y={{y}}&z={{z}}&lang=zh_cn&size=1&scl=1&style=7', {{ maxZoom: 19 }});
-
-                        // 智能判断：将经纬度转为浮点数并判定中国大致范围
-                        var lat = parseFloat(pt.lat);
-                        var lng = parseFloat(pt.lng);
-                        var isChina = (lat > 18.0 && lat < 54.0 && lng > 73.0 && lng < 135.0);
-                        var defaultLayer = isChina ? amapLayer : googleLayer;
-
-                        var map = L.map(pt.id, {{
-                            zoomControl: true, scrollWheelZoom: false, attributionControl: false,
-                            fullscreenControl: true,
-                            layers: [defaultLayer]
-                        }}).setView([lat, lng], 14);
-                        
-                        // 图层控制菜单
-                        if (isChina) {{
-                            L.control.layers({{"🗺️ 高德地图(默认)": amapLayer, "🌍 Google地图": googleLayer}}, null, {{position: 'topleft'}}).addTo(map);
-                        }} else {{
-                            L.control.layers({{"🌍 Google地图(海外默认)": googleLayer, "🗺️ 高德地图": amapLayer}}, null, {{position: 'topleft'}}).addTo(map);
-                        }}
-                        
-                        L.control.scale({{ position: 'bottomleft', metric: true, imperial: false }}).addTo(map);
-
-                        // Wikipedia API 动态加载景点真实图片
-                        (function(photoId, wikiQuery) {{
-                            var imgEl = document.getElementById(photoId);
-                            var fallback = 'https://tse1.mm.bing.net/th?q=' + encodeURIComponent(wikiQuery + " landmark") + '&w=600&h=400&c=7&rs=1&p=0';
-                            fetch('https://en.wikipedia.org/w/api.php?action=query&titles=' + encodeURIComponent(wikiQuery) + '&prop=pageimages&format=json&pithumbsize=800&origin=*')
-                                .then(function(r) {{ return r.json(); }})
-                                .then(function(d) {{
-                                    var pages = d.query.pages;
-                                    var page = pages[Object.keys(pages)[0]];
-                                    if (page && page.thumbnail) {{
-                                        imgEl.src = page.thumbnail.source;
-                                    }} else {{
-                                        // fallback: 运用 Bing 图片缩略图服务，彻底摆脱 Unsplash
-                                        imgEl.src = fallback;
-                                    }}
-                                }}).catch(function() {{ imgEl.src = fallback; }});
-                        }})(pt.photo_id, pt.wiki_query);
-
-                        // 主标记 — 红色
-                        var mainIcon = L.divIcon({{
-                            className: 'custom-marker',
-                            html: '<div style="background:#e74c3c;width:14px;height:14px;border-radius:50%;border:3px solid #fff;box-shadow:0 2px 6px rgba(0,0,0,0.4);"></div>',
-                            iconSize: [14, 14],
-                            iconAnchor: [7, 7]
-                        }});
-                        L.marker([pt.lat, pt.lng], {{icon: mainIcon}}).addTo(map).bindPopup('<b>' + pt.name + '</b>');
-
-                        // 使用 Nominatim 查询周边 POI
-                        fetch('https://nominatim.openstreetmap.org/search?format=json&limit=6&viewbox=' + 
-                            (pt.lng - 0.015) + ',' + (pt.lat + 0.015) + ',' + (pt.lng + 0.015) + ',' + (pt.lat - 0.015) + 
-                            '&bounded=1&q=tourism+OR+restaurant+OR+museum+OR+temple+OR+park+OR+hotel')
-                        .then(res => res.json())
-                        .then(places => {{
-                            places.forEach(p => {{
-                                if(Math.abs(p.lat - pt.lat) > 0.0005 || Math.abs(p.lon - pt.lng) > 0.0005) {{
-                                    var poiIcon = L.divIcon({{
-                                        className: 'poi-marker',
-                                        html: '<div style="background:#3498db;width:8px;height:8px;border-radius:50%;border:2px solid #fff;box-shadow:0 1px 3px rgba(0,0,0,0.3);"></div>',
-                                        iconSize: [8, 8],
-                                        iconAnchor: [4, 4]
-                                    }});
-                                    L.marker([parseFloat(p.lat), parseFloat(p.lon)], {{icon: poiIcon}}).addTo(map)
-                                        .bindPopup('<small>' + p.display_name.split(',')[0] + '</small>');
-                                }}
-                            }});
-                        }}).catch(function(){{}});
-                }}); // 结束 mapPoints.forEach
-            }}); // 结束 DOMContentLoaded
-
-            // ======================================
-            // 控制全局弹窗 (必须在全局作用域申明，方可供 HTML onclick 调用)
-            // ======================================
-            function openModal(targetId) {{
-                var modal = document.getElementById('info-modal');
-                if(!modal) return;
-                modal.classList.add('show');
-                setTimeout(function() {{
-                    var target = document.getElementById(targetId);
-                    if(target) target.scrollIntoView({{behavior: 'smooth', block: 'start'}});
-                }}, 100);
-            }}
-            
-            function closeModal() {{
-                var modal = document.getElementById('info-modal');
-                if(modal) modal.classList.remove('show');
-            }}
-
-            // 监听键盘 ESC 关闭弹窗
-            document.addEventListener('keydown', function(event) {{
-                if (event.key === "Escape") {{
-                    closeModal();
-                }}
-            }});
-        </script>
-    </body>
-    </html>
-    """
-    return html
 
 # --- 主界面 ---
-# 使用自定义 HTML 替换原有 st.title 以实现精确的手机端响应式排版
+# 使用自定义 HTML 替换原有 st.title 以实现精确的手机端响应式排版（样式见 static/shell.css）
 st.markdown("""
-<style>
-.main-intro-box {
-    text-align: left;
-    margin-bottom: 30px;
-}
-.main-intro-title {
-    font-size: 2.5rem;
-    font-weight: 800;
-    margin-bottom: 8px;
-}
-.main-intro-subtitle {
-    font-size: 1.15rem;
-    font-style: italic;
-    opacity: 0.7;
-}
-
-/* 手机端：标题和副标题变小 */
-@media (max-width: 600px) {
-    .main-intro-box {
-        margin-bottom: 15px;
-    }
-    .main-intro-title {
-        font-size: 1.6rem;
-    }
-    .main-intro-subtitle {
-        font-size: 0.85rem;
-    }
-}
-
-/* chat 输入框容器 */
-[data-testid="stChatInput"] {
-    padding-bottom: 20px;
-}
-/* 撑高文本域：增加上下左右四周边距，让文字更有呼吸感 */
-[data-testid="stChatInput"] textarea {
-    min-height: 72px !important;
-    max-height: 110px !important;
-    line-height: 1.6 !important;
-    padding: 22px 24px !important; 
-    font-size: 16px !important;
-    overflow-y: auto !important;
-    border-radius: 12px !important;
-}
-/* 发送按钮稍微往下一点对齐中间 */
-[data-testid="stChatInput"] button {
-    height: 100% !important;
-    display: flex !important;
-    align-items: center !important;
-    justify-content: center !important;
-}
-/* 确保占位文字不被截断，且带有呼吸感 */
-[data-testid="stChatInput"] textarea::placeholder {
-    line-height: 1.6;
-    white-space: pre-wrap;
-    opacity: 0.6;
-}
-
-/* ===== 手机端：修复 chat_input 对齐与字体大小 ===== */
-@media (max-width: 600px) {
-    [data-testid="stChatInput"] textarea {
-        min-height: 54px !important;
-        padding: 14px 16px !important; /* 缩小上下边距，使光标水平居中 */
-        font-size: 14.5px !important;
-        line-height: 1.4 !important;
-    }
-    [data-testid="stChatInput"] button {
-        padding-top: 0 !important;
-        align-self: center !important;
-    }
-    [data-testid="stChatInput"] {
-        padding-bottom: 10px;
-    }
-}
-</style>
-
 <div class="main-intro-box">
     <div class="main-intro-title">✈️ 你的旅程，我来安排</div>
     <div class="main-intro-subtitle">读万卷书，行万里路 · 愿每一段旅途，皆成值得珍藏的诗章</div>
@@ -733,6 +418,9 @@ st.markdown("""
 # 聊天输入框 - 官方原生吸底输入框
 prompt_text = st.chat_input("你想去哪里？玩几天？什么风格？例如：我想去日本京都玩3天，喜欢古建筑和美食")
 
+# 没有新输入时，按分享链接 ?trip=<id> 或本会话当前的行程直接从存储中恢复，不检索也不调用大模型
+requested_trip = None if prompt_text else (st.query_params.get("trip") or st.session_state.get("trip_id"))
+
 if prompt_text:
     # 旅行趣知识小贴士列表
     TRAVEL_TIPS = [
@@ -752,177 +440,173 @@ if prompt_text:
         ("🍿", "寻找景点付费停车位的小技巧：选择附近超市停车场，常常免费时达两小时"),
     ]
 
-    result_store = {}
+    search_cache = get_search_cache()
+    llm_pool = get_llm_pool()
+    gazetteer = get_gazetteer()
 
-    def call_api():
+    # 先查行程结果缓存：同一归一化输入 + 模型 + Prompt 版本（含输出格式），直接复用，不再检索与调用大模型
+    itinerary_cache = get_itinerary_cache()
+    prompt_version = f"{planner.SYSTEM_PROMPT_VERSION}{'c' if COMPACT_LLM_OUTPUT else ''}"
+    cache_key = itinerary_cache.make_key(prompt_text, "|".join(p.model_name for p in llm_pool.providers), prompt_version)
+    cached = itinerary_cache.get(cache_key)
+    request_deadline = new_request_deadline()
+
+    def call_api(progress):
         try:
-            client = OpenAI(api_key=api_key, base_url=base_url)
-            system_prompt = """
-你的主要受众是中国游客。行程表的所有可视文本必须优先使用优美的中文，如果名字有知名的外语，请放在中文后面的括号里。
-请严格只输出 JSON 数据，不要包含 ```json 或其他 markdown 标记。
-输出结构：
-{
-  "trip_title": "主标题(优先中文大气格调，外文放括号。如：京都秘境寻幽 (Kyoto Exploration) )",
-  "trip_subtitle": "副标题(中文，诗意或生动的副标题)",
-  "overview": "行程总览，用2-3句话介绍这趟旅行的整体安排和亮点(中文)",
-  "highlights": ["亮点1", "亮点2", "亮点3", "亮点4", "亮点5"],
-  "days": [
-    {
-      "date": "Day 1",
-      "city": "城市名(中文)",
-      "activities": [
-        { "time": "10:00", "name": "景点名(优先中文，外语可放括号)", "desc": "丰富生动的介绍和游玩建议，不少于50字(中文)", "lat": 0.0, "lng": 0.0, "img_keyword": "必须使用景点全称英文+所在城市名，如 Eiffel Tower Paris" }
-      ]
-    }
-  ]
-}
-注意：
-1. 所有的对外展示标题(trip_title, trip_subtitle)与活动标题(name)优先采用中文。
-2. 保持给后端抓图用的 cover_search 和 img_keyword 为精准的英文。
-3. highlights 至少5条，每条10字以内，中文
-4. img_keyword 必须精准，景点英文全称+城市名，用于Wikipedia搜图
-5. desc 要生动俏皮，可以加网络用语，不要死板，不少于60字
-6. lat/lng 坐标必须准确
-"""
-            # 在向大模型发送请求前，先去全网检索最新的优质攻略（如马蜂窝，穷游，小红书，Tripadvisor）
-            search_context = ""
-            try:
-                # 构造特定的站内检索词
-                search_query = f"{prompt_text} 旅游 攻略 (site:mafengwo.cn OR site:qyer.com OR site:xiaohongshu.com OR site:tripadvisor.com)"
-                
-                # 纯原生、无依赖安全搜索方案，兼容所有云部署环境
-                url = "https://html.duckduckgo.com/html/?q=" + urllib.parse.quote(search_query)
-                req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Android 14)'})
-                html_resp = urllib.request.urlopen(req, timeout=6).read().decode('utf-8', errors='ignore')
-                
-                # 用原生正则优雅提取搜索摘要
-                snippets = re.findall(r'<a class="result__snippet[^>]*>(.*?)</a>', html_resp, flags=re.IGNORECASE|re.DOTALL)
-                
-                if snippets:
-                    search_context = "\\n\\n【系统附加最新网络参考资讯】\\n以下是来自全网各大旅游平台（小红书/马蜂窝/穷游/TripAdvisor）最新的攻略与旅行建议，请在排版行程以及撰写 desc 时参考这些真实、时效性强的内容，使其更有干货和借鉴意义：\\n"
-                    # 取前6条清洗后的纯净文本
-                    for snip in snippets[:6]:
-                        clean_text = re.sub(r'<[^>]+>', '', snip).strip()
-                        search_context += f"- 参考摘要：{clean_text}\\n"
-            except Exception as e:
-                # 如果因为网络问题抓取失败，静默通过，直接依靠大模型原本的知识生成
-                pass
-
-            user_msg = prompt_text + search_context
-
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_msg}
-                ],
-                temperature=0.7
-            )
-            content = response.choices[0].message.content
-            content = content.replace("```json", "").replace("```", "").strip()
-            result_store["data"] = json.loads(content)
+            # 攻略摘要走目的地级缓存，且最多只等检索阶段的预算，超时或 DuckDuckGo 熔断中以缓存或空摘要直接放行
+            search_context = search_cache.get_context(prompt_text, deadline_seconds=request_deadline.budget("search"))
+
+            # 长行程走“骨架 + 按天并发”的扇出模式，其余走单次流式生成；两者产出相同的事件序列
+            # 由端点池对冲执行：首选端点过慢或报错时向备份端点请求，只产出胜出一路的事件
+            trip_days = planner.estimate_trip_days(prompt_text)
+            if trip_days >= LONG_TRIP_MIN_DAYS:
+                profile = request_profile("fanout", trip_days)
+
+                def make_events(client, model, cancel):
+                    return planner.generate_itinerary_fanout(client, model, prompt_text, search_context,
+                                                             max_workers=FANOUT_MAX_WORKERS,
+                                                             day_retries=FANOUT_DAY_RETRIES, cancel=cancel)
+            else:
+                profile = request_profile("stream", trip_days)
+
+                def make_events(client, model, cancel):
+                    return planner.stream_itinerary(client, model, prompt_text, search_context,
+                                                    compact=COMPACT_LLM_OUTPUT, max_workers=FANOUT_MAX_WORKERS,
+                                                    day_retries=FANOUT_DAY_RETRIES, cancel=cancel)
+            # 对冲延迟按请求类型与天数档位分别统计，短行程不会被长行程的总耗时拖慢对冲
+            events = llm_pool.run(make_events, validate=planner.is_valid_itinerary, deadline=request_deadline,
+                                  profile=profile)
+
+            # 每闭合一个顶层字段或一天的行程，立即通知主线程渐进展示
+            for kind, key, value in events:
+                if kind == "field":
+                    progress.add_field(key, value)
+                elif kind == "day":
+                    progress.add_day(key, value)
+                elif kind == "done":
+                    # 唯一一次校验与类型归一，之后地名校验、渲染、缓存与导出都只读 Itinerary
+                    itinerary = Itinerary.from_dict(value)
+                    if gazetteer is not None:
+                        # 用本地地名索引补全缺失坐标、吸附偏离的坐标，并记录相邻两站的异常跳跃（作用于归一后的坐标）
+                        with metrics.STAGE_SECONDS.time(stage="geo_check"):
+                            report = check_itinerary(gazetteer, itinerary, snap_km=GEO_SNAP_KM,
+                                                     search_km=GEO_SEARCH_KM, max_jump_km=GEO_MAX_JUMP_KM)
+                        for result in ("filled", "snapped"):
+                            metrics.GEO_CORRECTIONS.inc(report[result], result=result)
+                        metrics.GEO_CORRECTIONS.inc(len(report["flagged"]), result="flagged")
+                        if report["flagged"]:
+                            logger.warning("suspicious jumps between stops: %s", report["flagged"])
+                    progress.finish(itinerary)
         except Exception as e:
-            result_store["error"] = str(e)
-
-    # 启动后台线程调用 API
-    api_thread = threading.Thread(target=call_api)
-    api_thread.start()
-
-    # 诗意加载提示语列表
-    POETIC_STATUSES = [
-        "晓看天色暮看云，正为您将沿途星辰与风物，细细描摹……",
-        "落霞与孤鹜齐飞，秋水共长天一色，正在为您铺展绝美画卷……",
-        "长风破浪会有时，直挂云帆济沧海，正在为您规划破浪之旅……",
-        "星垂平野阔，月涌大江流，正在为您寻觅天地间最辽阔的风景……",
-        "春风得意马蹄疾，一日看尽长安花，正在为您编排最畅快的行程……",
-        "白日放歌须纵酒，青春作伴好还乡，正在为您酿造旅途的醇厚回味……",
-        "大漠孤烟直，长河落日圆，正在为您捕捉天地间最震撼的瞬间……",
-        "海内存知己，天涯若比邻，正在为您丈量世界的每一个角落……"
-    ]
+            progress.fail(str(e))
 
-    # 主线程展示动态旅行趣知识提示与诗意状态
-    status_box = st.empty()
-    tip_box = st.empty()
-    anim_box = st.empty()  # 移至最后，使动画渲染在小知识下方
+    # 缓存命中则直接毫秒级渲染；未命中时交给全局共享的生成执行器（并发上限 + 排队 + 相同请求合并）
+    generation_executor = get_generation_executor()
+    if cached:
+        progress = GenerationProgress()
+        progress.finish(Itinerary.from_dict(cached["data"]), cached["html"])
+    else:
+        try:
+            progress = generation_executor.submit(cache_key, call_api)
+        except QueueFullError:
+            st.warning("🚦 当前规划行程的旅人太多啦，排队已满，请稍后再试～")
+            st.stop()
+
+    if not progress.done:
+        # 诗意加载提示语列表
+        POETIC_STATUSES = [
+            "晓看天色暮看云，正为您将沿途星辰与风物，细细描摹……",
+            "落霞与孤鹜齐飞，秋水共长天一色，正在为您铺展绝美画卷……",
+            "长风破浪会有时，直挂云帆济沧海，正在为您规划破浪之旅……",
+            "星垂平野阔，月涌大江流，正在为您寻觅天地间最辽阔的风景……",
+            "春风得意马蹄疾，一日看尽长安花，正在为您编排最畅快的行程……",
+            "白日放歌须纵酒，青春作伴好还乡，正在为您酿造旅途的醇厚回味……",
+            "大漠孤烟直，长河落日圆，正在为您捕捉天地间最震撼的瞬间……",
+            "海内存知己，天涯若比邻，正在为您丈量世界的每一个角落……"
+        ]
+
+        # 主线程展示动态旅行趣知识提示与诗意状态
+        status_box = st.empty()
+        tip_box = st.empty()
+        anim_box = st.empty()  # 移至最后，使动画渲染在小知识下方
     
-    # 注入加载状态中的奔跑旅人动画 (无闪烁，节奏放缓)
-    anim_box.markdown("""
-    <div style="width: 100%; overflow: hidden; font-size: 32px; white-space: nowrap; margin-top: 15px;">
-        <div style="display: inline-block; animation: run 5s linear infinite;">
-            🧳 <div style="display: inline-block; transform: scaleX(-1);">🏃‍♂️</div>
+        # 注入加载状态中的奔跑旅人动画 (无闪烁，节奏放缓)
+        anim_box.markdown("""
+        <div style="width: 100%; overflow: hidden; font-size: 32px; white-space: nowrap; margin-top: 15px;">
+            <div style="display: inline-block; animation: run 5s linear infinite;">
+                🧳 <div style="display: inline-block; transform: scaleX(-1);">🏃‍♂️</div>
+            </div>
         </div>
-    </div>
-    <style>
-    @keyframes run {
-        0% { transform: translateX(-50px); }
-        100% { transform: translateX(100vw); }
-    }
-    </style>
-    """, unsafe_allow_html=True)
+        <style>
+        @keyframes run {
+            0% { transform: translateX(-50px); }
+            100% { transform: translateX(100vw); }
+        }
+        </style>
+        """, unsafe_allow_html=True)
     
-    # 每次生成随机抽取一句诗意状态，保持在整个 generation 过程中不变
-    current_status = random.choice(POETIC_STATUSES)
-    shuffled_tips = random.sample(TRAVEL_TIPS, len(TRAVEL_TIPS))
-    tip_index = 0
+        # 每次生成随机抽取一句诗意状态，保持在整个 generation 过程中不变
+        current_status = random.choice(POETIC_STATUSES)
+        shuffled_tips = random.sample(TRAVEL_TIPS, len(TRAVEL_TIPS))
+        tip_index = 0
+        next_tip_at = 0.0
+        preview_box = st.empty()  # 流式到达的行程在此逐天预览
+        preview_updates = -1
+        seen_version = -1
     
-    while api_thread.is_alive():
-        emoji, tip = shuffled_tips[tip_index % len(shuffled_tips)]
-        status_box.markdown(f"#### ⏳ {current_status}")
-        tip_box.info(f"**{emoji} 旅行小知识**\n\n{tip}")
-        tip_index += 1
-        time.sleep(3)
-
-    api_thread.join()
-    status_box.empty()
-    tip_box.empty()
-    anim_box.empty()
-
-    if "error" in result_store:
-        st.error(f"发生错误: {result_store['error']}")
+        # 事件驱动：在 Condition 上等待后台线程的通知，结果一就绪立即跳出；
+        # 小知识按自己的 3 秒节奏轮换，仅作为等待超时，从不推迟结果交付
+        while not progress.done:
+            if time.monotonic() >= next_tip_at:
+                emoji, tip = shuffled_tips[tip_index % len(shuffled_tips)]
+                tip_box.info(f"**{emoji} 旅行小知识**\n\n{tip}")
+                tip_index += 1
+                next_tip_at = time.monotonic() + TIP_ROTATE_SECONDS
+            if progress.version != seen_version:
+                seen_version = progress.version
+                queue_position = generation_executor.position(progress)
+                if queue_position:
+                    status_box.markdown(f"#### 🚦 当前排队中，前方还有 {queue_position - 1} 位旅人，请稍候……")
+                else:
+                    status_box.markdown(f"#### ⏳ {current_status}")
+                partial = progress.partial
+                if partial.get("trip_title") and progress.day_updates != preview_updates:
+                    preview_updates = progress.day_updates
+                    preview_box.markdown(render_stream_preview(partial))
+            progress.wait_for_update(seen_version, timeout=max(0.0, next_tip_at - time.monotonic()))
+
+        delivery_ms = progress.delivery_latency_ms()
+        if delivery_ms is not None and delivery_ms > RESULT_DELIVERY_BUDGET_MS:
+            logger.warning("result delivery took %.1f ms (budget %d ms)", delivery_ms, RESULT_DELIVERY_BUDGET_MS)
+
+        status_box.empty()
+        tip_box.empty()
+        anim_box.empty()
+        preview_box.empty()
+
+    if progress.error is not None:
+        st.error(f"发生错误: {progress.error}")
         st.info("建议重试一次。")
     else:
-        json_data = result_store["data"]
-        html_code = generate_html_template(json_data)
-        st.success("✨ 生成成功！您可以在下方直接编辑文字，点击右下角按钮保存为 PDF。")
-        total_days = len(json_data.get("days", []))
-        total_acts = sum(len(d.get("activities", [])) for d in json_data.get("days", []))
-        # 只要给一个基础 height 让内部能生出滚动条（CSS已经通过 100vh 进行覆盖接管全屏高度） 
-        components.html(html_code, height=800, scrolling=True)
-        
-        # 行程生成展示成功后，注入强效 CSS
-        # 1. 废除外层的所有包裹干扰，屏蔽底座黑框
-        # 2. 将包含详细行程的 iframe 直接拔出，强制全局 fixed 定位铺满屏幕
-        st.markdown("""
-        <style>
-        /* 隐藏底部输入框及其巨大的黑色底座（彻底根绝底部黑块）*/
-        [data-testid="stChatInput"],
-        [data-testid="stBottomBlockContainer"],
-        div.stBottom { 
-            display: none !important; 
-            visibility: hidden !important;
-            height: 0 !important;
-            padding: 0 !important;
-            margin: 0 !important;
-        }
-        
-        /* 彻底切断最外层 Streamlit 全屏框架的滚动能力 */
-        .main { overflow: hidden !important; height: 100vh !important; }
-        
-        /* 强行独立化我们的行程单组件，完全接管屏幕，遮蔽所有原生 Streamlit 外壳元素 */
-        div[data-testid="stHtml"] iframe,
-        div.stHtml iframe,
-        iframe {
-            position: fixed !important;
-            top: 0 !important;
-            left: 0 !important;
-            height: 100vh !important;
-            width: 100vw !important;
-            border-radius: 0 !important;
-            border: none !important;
-            margin: 0 !important;
-            padding: 0 !important;
-            z-index: 99999 !important;
-            background-color: #f0ebe3 !important; /* 同步底层米色，杜绝任何黑白边 */
-        }
-        </style>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        json_data = progress.data
+        html_code = progress.html or render_itinerary_html(json_data, request_deadline)
+        if not cached:
+            itinerary_cache.put(cache_key, json_data.to_dict(), html_code if CACHE_RENDERED_HTML else None)
+        # 落盘为可分享的短链接，之后的重跑、刷新与分享都直接从存储中读取
+        trip_id = get_trip_store().put(json_data.to_dict(), html_code if CACHE_RENDERED_HTML else None, prompt_text)
+        st.session_state["trip_id"] = trip_id
+        st.query_params["trip"] = trip_id
+        show_itinerary(json_data, html_code)
+elif requested_trip:
+    with metrics.STAGE_SECONDS.time(stage="trip_load"):
+        trip = get_trip_store().get(requested_trip)
+    if trip is None:
+        st.session_state.pop("trip_id", None)
+        if "trip" in st.query_params:
+            del st.query_params["trip"]
+        st.warning("这个行程链接已过期或不存在，重新规划一次吧～")
+    else:
+        st.session_state["trip_id"] = requested_trip
+        itinerary = Itinerary.from_dict(trip["data"])
+        show_itinerary(itinerary, trip["html"] or render_itinerary_html(itinerary),
+                       message="✨ 已为您打开保存的行程，可直接编辑文字或保存为 PDF。")
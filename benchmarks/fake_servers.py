@@ -0,0 +1,125 @@
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 本地假服务 ---
+# 兼容 OpenAI 协议的假大模型（支持流式 SSE）、假 DuckDuckGo HTML 搜索页与假攻略网页，
+# 延迟均可配置，用于在无外网、无 API Key 的环境下端到端压测流水线。
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已超时放弃或关闭连接（如熔断、截止时间到期），不再打印异常
+            pass
+
+
+def _serve(handler_cls, port):
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler_cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_fake_llm(itinerary, first_token_latency=0.5, chunk_latency=0.005, chunk_chars=24, port=0):
+    # itinerary 可以是 dict（序列化为 JSON 回复）或 callable(request_body) -> 回复文本
+    # first_token_latency 可以是秒数或 callable() -> 秒数（模拟长尾延迟）
+    class Handler(_QuietHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            content = itinerary(request) if callable(itinerary) else json.dumps(itinerary, ensure_ascii=False)
+            time.sleep(first_token_latency() if callable(first_token_latency) else first_token_latency)
+            if not request.get("stream"):
+                time.sleep(chunk_latency * (len(content) // chunk_chars))
+                body = json.dumps({
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": request.get("model", "fake"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(json.dumps(request.get("messages", []))) // 4,
+                              "completion_tokens": len(content) // 2, "total_tokens": 0},
+                }).encode("utf-8")
+                self._send(200, body, "application/json")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                for i in range(0, len(content), chunk_chars):
+                    chunk = {
+                        "id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": request.get("model", "fake"),
+                        "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_chars]}, "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if chunk_latency:
+                        time.sleep(chunk_latency)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端中途关闭连接（如对冲请求取消了落败的一路）
+                pass
+
+    return _serve(Handler, port)
+
+
+def start_fake_search(latency=0.3, results=8, port=0, page_url=None):
+    # page_url 指向 start_fake_pages 时，每条结果带上与真实 DuckDuckGo 相同的 //duckduckgo.com/l/?uddg= 跳转链接
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).get("q", [""])[0]
+            slug = hashlib.blake2b(query.encode("utf-8"), digest_size=4).hexdigest()
+            items = "".join(
+                f'<div class="result"><a class="result__snippet" href="{_result_href(page_url, slug, i)}">'
+                f'第 {i + 1} 条攻略摘要：<b>必去</b>景点与小众美食推荐。</a></div>'
+                for i in range(results)
+            )
+            self._send(200, f"<html><body>{items}</body></html>".encode("utf-8"), "text/html; charset=utf-8")
+
+    return _serve(Handler, port)
+
+
+def _result_href(page_url, slug, index):
+    if not page_url:
+        return f"https://example.com/{index}"
+    return "//duckduckgo.com/l/?uddg=" + urllib.parse.quote(f"{page_url}/{slug}/{index}", safe="") + "&amp;rut=fake"
+
+
+_PAGE_TOPICS = [
+    ("景点", "老城区的几座寺庙建议清晨前往，人少光线好，沿着河边步道一路走下去还能顺路看到两处历史街区。"),
+    ("交通", "机场快线直达市中心约四十分钟，市内以地铁加步行为主，热门线路早晚高峰拥挤，尽量避开通勤时段。"),
+    ("美食", "本地人常去的早市在火车站后面的小巷里，招牌是现做的米粉和炭烤小吃，人均花费不到五十元。"),
+    ("住宿", "第一次来建议住在地铁换乘站附近，去各个景点都方便；想要安静一点可以选河对岸的民宿区。"),
+    ("购物", "传统手工艺品集中在步行街两侧，价格可以适当还价，机场免税店的同款商品往往更贵。"),
+    ("天气", "春秋两季最舒服，夏天午后常有雷阵雨，出门记得带伞，冬天昼夜温差大需要准备外套。"),
+]
+
+
+def start_fake_pages(latency=0.2, paragraphs=6, port=0):
+    # 假攻略网页：正文段落之外带导航、脚本与页脚，各页正文互为转载（内容相同），用于验证正文抽取与去重；
+    # latency 可以是秒数或 callable(path) -> 秒数（模拟个别网页极慢）
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            time.sleep(latency(self.path) if callable(latency) else latency)
+            body = "".join(f"<p>{topic}：{text}</p>" for topic, text in (_PAGE_TOPICS * paragraphs)[:paragraphs])
+            page = (
+                "<html><head><script>var tracking = 1;</script><style>p { margin: 0 }</style></head><body>"
+                "<nav><a href='/'>首页</a> <a href='/hot'>热门目的地</a> <a href='/login'>登录</a></nav>"
+                f"<article><h1>攻略 {self.path}</h1>{body}</article>"
+                "<footer>版权所有 © 假攻略网 保留所有权利 联系我们 隐私政策 用户协议 网站地图</footer></body></html>"
+            )
+            self._send(200, page.encode("utf-8"), "text/html; charset=utf-8")
+
+    return _serve(Handler, port)
@@ -0,0 +1,250 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.fake_servers import start_fake_llm, start_fake_pages, start_fake_search
+from benchmarks.run_benchmarks import _git_commit
+from benchmarks.synthetic import make_itinerary
+from compact_schema import encode_compact
+
+# --- 多会话压测 ---
+# 用法：python -m benchmarks.load_test [--concurrency 1 2 4 8 16 32] [--output load_results.json]
+# 以 Streamlit AppTest 在同一进程内并发驱动 N 个 app.py 会话（共享 st.cache_resource，与单个副本一致），
+# 大模型、DuckDuckGo 与攻略网页换成本地假服务（延迟可配置），逐级提高并发，记录每级的：
+#   端到端延迟分位数（提交输入 -> 结果页渲染完成）、失败率（异常、报错或排队已满被拒）、
+#   峰值线程数、峰值 RSS 及折合每会话的 RSS 增量；
+# 最后给出满足 失败率为 0 且 p95 不超过 --slo-seconds 的最高并发，作为单副本容量参考。
+#
+# app.py 不做任何改动：压测前复制一份，把下列配置改写为指向假服务与临时目录，
+# 并关闭会访问外网的维基配图解析、POI 补全与指标端口。
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+SAMPLE_INTERVAL = 0.1   # 线程数与 RSS 的采样间隔（秒）
+
+
+def app_overrides(llm_url, search_url, workdir, max_concurrency=None, max_queue=None):
+    overrides = {
+        "base_url": llm_url,
+        "SEARCH_URL": search_url,
+        "METRICS_PORT": None,
+        "RESOLVE_IMAGES_SERVER_SIDE": False,
+        "ENRICH_POIS_SERVER_SIDE": False,
+        "ITINERARY_CACHE_PATH": os.path.join(workdir, "itineraries.sqlite3"),
+        "TRIP_STORE_PATH": os.path.join(workdir, "trips.sqlite3"),
+        "GAZETTEER_PATH": os.path.join(workdir, "gazetteer.idx"),
+        "SHELL_STATIC_DIR": os.path.join(os.path.dirname(APP_PATH), "static"),
+    }
+    if max_concurrency:
+        overrides["GENERATION_MAX_CONCURRENCY"] = max_concurrency
+    if max_queue:
+        overrides["GENERATION_MAX_QUEUE"] = max_queue
+    return overrides
+
+
+def write_app_copy(overrides, workdir):
+    with open(APP_PATH, encoding="utf-8") as f:
+        source = f.read()
+    for name, value in overrides.items():
+        source, count = re.subn(rf"^{name} = .*$", lambda _: f"{name} = {value!r}", source, flags=re.M)
+        if count != 1:
+            raise SystemExit(f"app.py 中找不到配置项 {name}，压测脚本需要同步更新")
+    path = os.path.join(workdir, "app_under_load.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+    return path
+
+
+def _rss_bytes():
+    # Linux 读 /proc 的当前 RSS；其他平台退回进程生命周期内的峰值
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _thread_count():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return threading.active_count()
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class ResourceSampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_threads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, _rss_bytes())
+            self.peak_threads = max(self.peak_threads, _thread_count())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_session(app_path, prompt_text, timeout):
+    # 一个会话：打开首页 -> 提交输入 -> 等到结果页渲染完成；返回 (结果, AppTest)，保留 AppTest 以模拟仍在线的会话
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    at.run()
+    start = time.perf_counter()
+    at.chat_input[0].set_value(prompt_text).run()
+    latency = time.perf_counter() - start
+    if at.exception:
+        return {"ok": False, "latency_s": latency, "reason": "exception"}, at
+    if any("排队已满" in w.value for w in at.warning):
+        return {"ok": False, "latency_s": latency, "reason": "rejected"}, at
+    if at.error or not at.success:
+        return {"ok": False, "latency_s": latency, "reason": "error"}, at
+    return {"ok": True, "latency_s": latency}, at
+
+
+def run_step(app_path, concurrency, days, timeout, step):
+    gc.collect()
+    baseline_rss = _rss_bytes()
+    baseline_threads = _thread_count()
+    results = [None] * concurrency
+    sessions = [None] * concurrency
+
+    def worker(i):
+        # 每个会话用不同的提示词，避免命中行程缓存与 single-flight 合并
+        try:
+            results[i], sessions[i] = run_session(app_path, f"压测{days}天 第{step}轮 会话{i}", timeout)
+        except Exception as e:
+            results[i] = {"ok": False, "latency_s": None, "reason": type(e).__name__}
+
+    started = time.perf_counter()
+    with ResourceSampler() as sampler:
+        threads = [threading.Thread(target=worker, args=(i,), name=f"load-session-{i}") for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - started
+
+    latencies = [r["latency_s"] for r in results if r["ok"]]
+    failures = {}
+    for r in results:
+        if not r["ok"]:
+            failures[r["reason"]] = failures.get(r["reason"], 0) + 1
+    row = {
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "ok": len(latencies),
+        "failure_rate": round(1 - len(latencies) / concurrency, 4),
+        "failures": failures,
+        "baseline_threads": baseline_threads,
+        "peak_threads": sampler.peak_threads,
+        "baseline_rss_mib": round(baseline_rss / 2 ** 20, 1),
+        "peak_rss_mib": round(sampler.peak_rss / 2 ** 20, 1),
+        "rss_per_session_kib": round(max(0, sampler.peak_rss - baseline_rss) / concurrency / 1024, 1),
+    }
+    for q in (50, 90, 95, 99):
+        value = _percentile(latencies, q)
+        row[f"latency_p{q}_s"] = round(value, 3) if value is not None else None
+    del sessions
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="旅程行程生成 多会话压测")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="逐级提高的并发会话数")
+    parser.add_argument("--days", type=int, default=3, help="假大模型返回的行程天数（单次流式生成路径，须小于 app.py 的 LONG_TRIP_MIN_DAYS）")
+    parser.add_argument("--llm-first-token", type=float, default=1.0, help="假大模型首 token 延迟（秒）")
+    parser.add_argument("--llm-chunk-latency", type=float, default=0.01, help="假大模型每个流式分片的间隔（秒）")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="假 DuckDuckGo 响应延迟（秒）")
+    parser.add_argument("--page-latency", type=float, default=0.2, help="假攻略网页响应延迟（秒）")
+    parser.add_argument("--max-concurrency", type=int, help="覆盖 app.py 的 GENERATION_MAX_CONCURRENCY")
+    parser.add_argument("--max-queue", type=int, help="覆盖 app.py 的 GENERATION_MAX_QUEUE")
+    parser.add_argument("--timeout", type=float, default=180, help="单个会话的超时（秒）")
+    parser.add_argument("--slo-seconds", type=float, default=30, help="容量判定使用的 p95 延迟上限（秒）")
+    parser.add_argument("--output", default="load_results.json")
+    args = parser.parse_args(argv)
+
+    data = make_itinerary(args.days)
+    texts = {
+        "verbose": json.dumps(data, ensure_ascii=False),
+        "compact": json.dumps(encode_compact(data), ensure_ascii=False, separators=(",", ":")),
+    }
+    llm_server = start_fake_llm(lambda request: texts["compact" if "\"d\"" in request["messages"][0]["content"] else "verbose"],
+                                first_token_latency=args.llm_first_token, chunk_latency=args.llm_chunk_latency)
+    page_server = start_fake_pages(latency=args.page_latency)
+    search_server = start_fake_search(latency=args.search_latency, page_url=f"http://127.0.0.1:{page_server.server_port}/page")
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="travel-agenda-load-") as workdir:
+            overrides = app_overrides(f"http://127.0.0.1:{llm_server.server_port}/v1",
+                                      f"http://127.0.0.1:{search_server.server_port}/html/", workdir,
+                                      args.max_concurrency, args.max_queue)
+            app_path = write_app_copy(overrides, workdir)
+            # 先跑一个会话预热 st.cache_resource 与模块导入，不计入结果
+            run_session(app_path, "压测预热 1天", args.timeout)
+            for step, concurrency in enumerate(args.concurrency):
+                row = run_step(app_path, concurrency, args.days, args.timeout, step)
+                rows.append(row)
+                print(f"load    sessions={concurrency:<3} p50={row['latency_p50_s']}s p95={row['latency_p95_s']}s "
+                      f"fail={row['failure_rate']:.0%} threads={row['peak_threads']} rss={row['peak_rss_mib']}MiB "
+                      f"(+{row['rss_per_session_kib']}KiB/session)")
+    finally:
+        llm_server.shutdown()
+        search_server.shutdown()
+        page_server.shutdown()
+
+    capacity = 0
+    for row in rows:
+        if row["failure_rate"] == 0 and row["latency_p95_s"] is not None and row["latency_p95_s"] <= args.slo_seconds:
+            capacity = max(capacity, row["concurrency"])
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "steps": rows,
+        "capacity_sessions": capacity,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"单副本容量（失败率 0 且 p95 ≤ {args.slo_seconds}s）：{capacity} 个并发会话")
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
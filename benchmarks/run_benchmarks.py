@@ -0,0 +1,618 @@
+import argparse
+import functools
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+import planner
+from benchmarks.fake_servers import start_fake_llm, start_fake_pages, start_fake_search
+from benchmarks.synthetic import TRIP_SIZES, make_itinerary
+from compact_schema import decode_compact, encode_compact
+from gazetteer import Gazetteer, build_index, check_itinerary
+from generation import GenerationProgress
+from itinerary_model import Itinerary
+from llm_pool import ProviderPool, request_profile
+from resilience import CircuitBreaker
+from retrieval import ContentRetriever, estimate_tokens
+from renderer import generate_html_template
+from search_cache import SearchContextCache
+
+# --- 离线基准测试 ---
+# 用法：python -m benchmarks.run_benchmarks [--suite render|pipeline|delivery|all] [--output bench_results.json]
+# render   : 1/7/30/90 天合成行程下 generate_html_template 的耗时、峰值内存与输出 HTML 字节数
+# pipeline : 对接本地假大模型与假 DuckDuckGo，端到端跑一遍 call_api 的流程（检索 -> 流式生成 -> 解析 -> 渲染）
+# delivery : 结果就绪 -> 页面主线程被唤醒 的交付延迟（预算 100 ms）
+# schema   : 详细格式与紧凑格式的输出体积、估算 token 与流式生成耗时对比；
+#            指定 --live-base-url 时改为对真实接口跑固定的提示词集合，记录 usage 中的 completion_tokens
+# model    : 每份行程的常驻内存（嵌套 dict + HTML 对比 Itinerary 模型）与一次校验归一的耗时
+# hedge    : 两个速度不同的本地假大模型端点（首选端点带长尾），对比单端点与对冲请求的端到端延迟分位数、
+#            对冲次数、各端点胜出与被取消的次数
+# breaker  : DuckDuckGo 假服务挂死（响应慢于抓取超时）时，有无熔断器下每个请求在检索阶段多等的时间
+# retrieval: 本地假搜索页与假攻略网页上，对比单次检索摘要与多路并发检索（仅摘要 / 抓取正文）的墙钟耗时、
+#            参考资料段落数与 token 数；另以极慢网页验证总耗时不超过截止时间
+# shell    : 首页（尚未输入）每次 rerun 发往浏览器的元素字节数（按元素类型细分）与脚本执行耗时，
+#            以及由静态文件服务一次性下发、之后走浏览器缓存的外壳资源字节数；
+#            baseline 模式把同样的 shell.css / shell.js 按旧方式每次 rerun 内联发送，作为对照
+# gazetteer: 合成 GeoNames 数据编译本地地名索引，测量按名匹配、最近邻查询与整趟行程坐标校验的吞吐
+# 结果写入机器可读的 JSON 文件，便于在版本之间对比回归。
+
+MAP_MODES = ["day", "activity"]
+
+# schema 对比使用的固定提示词集合，保证不同版本之间的结果可比
+SCHEMA_PROMPTS = [
+    "京都 3天 赏枫 深度游",
+    "巴黎 4天 博物馆与美食",
+    "成都 2天 吃货之旅",
+    "罗马 3天 古迹漫步",
+    "西安 2天 历史文化",
+]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def bench_render(sizes, repeats):
+    results = []
+    for days in sizes:
+        data = make_itinerary(days)
+        activities = sum(len(d["activities"]) for d in data["days"])
+        for map_mode in MAP_MODES:
+            durations = []
+            html = ""
+            for _ in range(repeats):
+                start = time.perf_counter()
+                html = generate_html_template(data, map_mode=map_mode)
+                durations.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            generate_html_template(data, map_mode=map_mode)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results.append({
+                "days": days,
+                "activities": activities,
+                "map_mode": map_mode,
+                "render_ms_median": round(statistics.median(durations) * 1000, 3),
+                "render_ms_min": round(min(durations) * 1000, 3),
+                "peak_memory_bytes": peak,
+                "html_bytes": len(html.encode("utf-8")),
+            })
+            print(f"render  days={days:<3} acts={activities:<4} mode={map_mode:<8} "
+                  f"median={results[-1]['render_ms_median']:.2f}ms peak={peak / 1024:.0f}KiB html={results[-1]['html_bytes'] / 1024:.0f}KiB")
+    return results
+
+
+def run_pipeline_once(client, model_name, prompt_text, search_cache, search_deadline):
+    # 与 app.py 中 call_api + 渲染分支保持同一流程
+    timings = {}
+    start = time.perf_counter()
+    search_context = search_cache.get_context(prompt_text, deadline_seconds=search_deadline)
+    timings["search_s"] = time.perf_counter() - start
+
+    llm_start = time.perf_counter()
+    data = None
+    for kind, _, value in planner.stream_itinerary(client, model_name, prompt_text, search_context):
+        if kind != "done" and "first_content_s" not in timings:
+            timings["first_content_s"] = time.perf_counter() - start
+        if kind == "day" and "first_day_s" not in timings:
+            timings["first_day_s"] = time.perf_counter() - start
+        if kind == "done":
+            data = value
+    timings["llm_s"] = time.perf_counter() - llm_start
+
+    render_start = time.perf_counter()
+    html = generate_html_template(data)
+    timings["render_s"] = time.perf_counter() - render_start
+    timings["total_s"] = time.perf_counter() - start
+    timings["html_bytes"] = len(html.encode("utf-8"))
+    timings["days"] = len(data.get("days", []))
+    return timings
+
+
+def bench_pipeline(sizes, repeats, llm_first_token, llm_chunk_latency, search_latency, search_deadline):
+    results = []
+    search_server = start_fake_search(latency=search_latency)
+    search_url = f"http://127.0.0.1:{search_server.server_port}/html/"
+    try:
+        for days in sizes:
+            data = make_itinerary(days)
+            llm_server = start_fake_llm(data, first_token_latency=llm_first_token, chunk_latency=llm_chunk_latency)
+            client = OpenAI(api_key="bench", base_url=f"http://127.0.0.1:{llm_server.server_port}/v1")
+            runs = []
+            try:
+                for i in range(repeats):
+                    # 每轮使用全新的摘要缓存，测量的是冷启动检索
+                    search_cache = SearchContextCache(fetcher=functools.partial(planner.scrape_snippets, search_url=search_url))
+                    runs.append(run_pipeline_once(client, "bench-model", f"基准测试{days}天 第{i}轮", search_cache, search_deadline))
+            finally:
+                llm_server.shutdown()
+            summary = {"days": days, "runs": len(runs), "html_bytes": runs[-1]["html_bytes"]}
+            for key in ("search_s", "first_content_s", "first_day_s", "llm_s", "render_s", "total_s"):
+                values = [r[key] for r in runs if key in r]
+                if values:
+                    summary[key + "_median"] = round(statistics.median(values), 4)
+            results.append(summary)
+            print(f"pipeline days={days:<3} first_content={summary.get('first_content_s_median', 0):.2f}s "
+                  f"first_day={summary.get('first_day_s_median', 0):.2f}s total={summary['total_s_median']:.2f}s")
+    finally:
+        search_server.shutdown()
+    return results
+
+
+def bench_delivery(samples, tip_seconds=3.0, budget_ms=100):
+    # 复刻 app.py 加载页的等待循环：后台线程在随机时刻交付结果，测量主线程被唤醒的延迟
+    rng = random.Random(42)
+    latencies = []
+    for _ in range(samples):
+        progress = GenerationProgress()
+        delay = rng.uniform(0.01, 0.2)
+        timer = threading.Timer(delay, progress.finish, args=({"days": []},))
+        timer.start()
+        next_tip_at = time.monotonic() + tip_seconds
+        seen_version = -1
+        while not progress.done:
+            seen_version = progress.version
+            progress.wait_for_update(seen_version, timeout=max(0.0, next_tip_at - time.monotonic()))
+        latencies.append(progress.delivery_latency_ms())
+        timer.join()
+    latencies.sort()
+    result = {
+        "samples": samples,
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "max_ms": round(latencies[-1], 3),
+        "budget_ms": budget_ms,
+    }
+    result["within_budget"] = result["max_ms"] < budget_ms
+    print(f"delivery p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms max={result['max_ms']:.2f}ms "
+          f"({'OK' if result['within_budget'] else 'OVER BUDGET'})")
+    return result
+
+
+def _schema_texts(data):
+    # 详细格式按模型通常的缩进输出序列化；紧凑格式按 Prompt 要求不带空白
+    verbose = json.dumps(data, ensure_ascii=False, indent=2)
+    compact = json.dumps(encode_compact(data), ensure_ascii=False, separators=(",", ":"))
+    return verbose, compact
+
+
+def bench_schema(sizes, repeats, llm_first_token, llm_chunk_latency):
+    # 假大模型按字符数分片匀速输出，耗时对比反映的是字符量；真实 token 耗时请用 --live-base-url
+    results = []
+    for days in sizes:
+        data = make_itinerary(days)
+        verbose, compact = _schema_texts(data)
+        texts = {"verbose": verbose, "compact": compact}
+        llm_server = start_fake_llm(lambda request: texts["compact" if "\"d\"" in request["messages"][0]["content"] else "verbose"],
+                                    first_token_latency=llm_first_token, chunk_latency=llm_chunk_latency)
+        client = OpenAI(api_key="bench", base_url=f"http://127.0.0.1:{llm_server.server_port}/v1")
+        row = {"days": days}
+        try:
+            for schema, text in texts.items():
+                durations = []
+                decoded = None
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    for kind, _, value in planner.stream_itinerary(client, "bench-model", f"基准测试{days}天",
+                                                                        compact=schema == "compact"):
+                        if kind == "done":
+                            decoded = value
+                    durations.append(time.perf_counter() - start)
+                row[schema] = {
+                    "chars": len(text),
+                    "bytes": len(text.encode("utf-8")),
+                    "est_tokens": estimate_tokens(text),
+                    "stream_s_median": round(statistics.median(durations), 4),
+                    "days_decoded": len(decoded.get("days", [])),
+                }
+        finally:
+            llm_server.shutdown()
+        # 紧凑格式解码后必须与原结构一致（坐标按 4 位小数取整）
+        expected = [
+            {**day, "activities": [{**act, "lat": round(act["lat"], 4), "lng": round(act["lng"], 4)} for act in day["activities"]]}
+            for day in data["days"]
+        ]
+        row["roundtrip_ok"] = decode_compact(json.loads(compact))["days"] == expected
+        row["token_saving"] = round(1 - row["compact"]["est_tokens"] / row["verbose"]["est_tokens"], 3)
+        row["time_saving"] = round(1 - row["compact"]["stream_s_median"] / row["verbose"]["stream_s_median"], 3)
+        results.append(row)
+        print(f"schema  days={days:<3} tokens {row['verbose']['est_tokens']} -> {row['compact']['est_tokens']} "
+              f"(-{row['token_saving']:.0%}) stream {row['verbose']['stream_s_median']:.2f}s -> "
+              f"{row['compact']['stream_s_median']:.2f}s (-{row['time_saving']:.0%})")
+    return results
+
+
+def bench_schema_live(base_url, api_key, model_name, prompts):
+    # 对真实接口逐条跑两种格式，completion_tokens 取接口返回的 usage
+    client = OpenAI(api_key=api_key, base_url=base_url)
+    results = []
+    for prompt_text in prompts:
+        row = {"prompt": prompt_text}
+        for schema, system_prompt in (("verbose", planner.SYSTEM_PROMPT), ("compact", planner.COMPACT_SYSTEM_PROMPT)):
+            start = time.perf_counter()
+            response = client.chat.completions.create(
+                model=model_name,
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt_text}],
+                temperature=0.7,
+            )
+            elapsed = time.perf_counter() - start
+            content = response.choices[0].message.content.replace("```json", "").replace("```", "").strip()
+            try:
+                data = json.loads(content)
+                days = len((decode_compact(data) if schema == "compact" else data).get("days", []))
+            except ValueError:
+                days = None
+            row[schema] = {
+                "completion_tokens": response.usage.completion_tokens if response.usage else None,
+                "wall_s": round(elapsed, 3),
+                "days": days,
+            }
+        results.append(row)
+        print(f"schema  live {prompt_text}: tokens {row['verbose']['completion_tokens']} -> {row['compact']['completion_tokens']}, "
+              f"{row['verbose']['wall_s']:.1f}s -> {row['compact']['wall_s']:.1f}s")
+    return results
+
+
+def bench_gazetteer(places, lookups):
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "geonames.txt")
+        with open(source, "w", encoding="utf-8") as f:
+            for i in range(places):
+                lat, lng = rng.uniform(-60, 70), rng.uniform(-180, 180)
+                f.write("\t".join(map(str, [i, f"Place {i}", f"Place {i}", f"地点{i}", lat, lng, rng.choice("PSL"), "X", "XX",
+                                             "", "", "", "", "", rng.randint(0, 100000), "", "", "", ""])) + "\n")
+        index_path = os.path.join(tmp, "gazetteer.idx")
+        start = time.perf_counter()
+        stats = build_index([source], index_path)
+        build_s = time.perf_counter() - start
+        gazetteer = Gazetteer(index_path)
+
+        queries = [(f"地点{rng.randrange(places)}", (rng.uniform(-60, 70), rng.uniform(-180, 180))) for _ in range(lookups)]
+        start = time.perf_counter()
+        for name, near in queries:
+            gazetteer.match([name], near=near, radius_km=30.0)
+        match_per_s = lookups / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _, (lat, lng) in queries:
+            gazetteer.nearest(lat, lng, radius_km=5.0)
+        nearest_per_s = lookups / (time.perf_counter() - start)
+
+        itinerary = Itinerary.from_dict(make_itinerary(30))
+        activities = itinerary.activity_count
+        start = time.perf_counter()
+        check_itinerary(gazetteer, itinerary)
+        check_ms = (time.perf_counter() - start) * 1000
+        gazetteer.close()
+
+    result = {
+        "places": stats["places"],
+        "index_bytes": stats["bytes"],
+        "build_s": round(build_s, 3),
+        "match_per_s": round(match_per_s),
+        "nearest_per_s": round(nearest_per_s),
+        "check_30_day_ms": round(check_ms, 3),
+        "check_activities": activities,
+    }
+    print(f"gazetteer places={result['places']} index={result['index_bytes'] / 1024 / 1024:.1f}MiB "
+          f"match={result['match_per_s']}/s nearest={result['nearest_per_s']}/s check(30 days)={result['check_30_day_ms']:.1f}ms")
+    return result
+
+
+def _retained_bytes(factory):
+    # 调用 factory() 后仍存活的内存（其间的临时对象已释放）
+    gc.collect()
+    tracemalloc.start()
+    value = factory()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, value
+
+
+def bench_model(sizes, repeats):
+    # 每份行程常驻内存：json.loads 的嵌套 dict + 渲染好的 HTML（旧形式）对比 Itinerary（__slots__ 对象）
+    results = []
+    for days in sizes:
+        text = json.dumps(make_itinerary(days), ensure_ascii=False)
+        dict_bytes, data = _retained_bytes(lambda: json.loads(text))
+        html_bytes, _ = _retained_bytes(lambda: generate_html_template(data))
+        model_bytes, model = _retained_bytes(lambda: Itinerary.from_dict(json.loads(text)))
+        durations = []
+        for _ in range(repeats):
+            parsed = json.loads(text)
+            start = time.perf_counter()
+            Itinerary.from_dict(parsed)
+            durations.append(time.perf_counter() - start)
+        row = {
+            "days": days,
+            "activities": model.activity_count,
+            "dict_bytes": dict_bytes,
+            "dict_plus_html_bytes": dict_bytes + html_bytes,
+            "model_bytes": model_bytes,
+            "model_vs_dict": round(model_bytes / dict_bytes, 3),
+            "model_vs_dict_plus_html": round(model_bytes / (dict_bytes + html_bytes), 3),
+            "validate_ms_median": round(statistics.median(durations) * 1000, 3),
+        }
+        results.append(row)
+        print(f"model   days={days:<3} dict+html={row['dict_plus_html_bytes'] / 1024:.0f}KiB dict={dict_bytes / 1024:.0f}KiB "
+              f"model={model_bytes / 1024:.0f}KiB validate={row['validate_ms_median']:.2f}ms")
+    return results
+
+
+def bench_hedge(requests, days=3, fast_first_token=0.3, tail_first_token=3.0, tail_ratio=0.05, backup_first_token=0.8,
+                chunk_latency=0.002):
+    # 首选端点：多数请求 fast_first_token 秒出首 token，tail_ratio 的请求拖到 tail_first_token 秒；备份端点稳定但更慢
+    data = make_itinerary(days)
+    rng = random.Random(42)
+    primary_server = start_fake_llm(data, first_token_latency=lambda: tail_first_token if rng.random() < tail_ratio else fast_first_token,
+                                    chunk_latency=chunk_latency)
+    backup_server = start_fake_llm(data, first_token_latency=backup_first_token, chunk_latency=chunk_latency)
+    providers = [
+        {"name": "primary", "base_url": f"http://127.0.0.1:{primary_server.server_port}/v1", "api_key": "bench", "model": "bench-primary"},
+        {"name": "backup", "base_url": f"http://127.0.0.1:{backup_server.server_port}/v1", "api_key": "bench", "model": "bench-backup"},
+    ]
+    results = {}
+    try:
+        for mode, configs in (("single", providers[:1]), ("hedged", providers)):
+            rng.seed(42)  # 两种模式下首选端点的长尾请求序列相同
+            pool = ProviderPool(configs, client_factory=lambda c: OpenAI(api_key=c["api_key"], base_url=c["base_url"]),
+                                default_delays={"ttft": 1.0, "total": 10.0})
+            durations = []
+            for i in range(requests):
+                start = time.perf_counter()
+                events = pool.run(lambda client, model, cancel: planner.stream_itinerary(
+                    client, model, f"对冲基准{days}天 第{i}轮", cancel=cancel), validate=planner.is_valid_itinerary,
+                    profile=request_profile("stream", days))
+                for kind, _, _ in events:
+                    pass
+                durations.append(time.perf_counter() - start)
+            ordered = sorted(durations)
+            row = {"requests": requests, **pool.stats()}
+            for q in (50, 90, 99):
+                row[f"latency_p{q}_s"] = round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))], 3)
+            results[mode] = row
+            wins = ", ".join(f"{p['name']}={p['wins']}" for p in row["providers"])
+            print(f"hedge   mode={mode:<7} p50={row['latency_p50_s']:.2f}s p90={row['latency_p90_s']:.2f}s "
+                  f"p99={row['latency_p99_s']:.2f}s hedged={row['hedged']} wins: {wins}")
+    finally:
+        primary_server.shutdown()
+        backup_server.shutdown()
+    return results
+
+
+def bench_breaker(requests, fetch_timeout=1.0, search_deadline=2.0):
+    # 每轮用不同的目的地（不命中摘要缓存），失败结果不缓存，每个请求都要面对挂死的上游
+    search_server = start_fake_search(latency=fetch_timeout * 4)
+    fetcher = functools.partial(planner.scrape_snippets, search_url=f"http://127.0.0.1:{search_server.server_port}/html/",
+                                timeout=fetch_timeout)
+    results = {}
+    try:
+        for mode in ("no_breaker", "breaker"):
+            breaker = CircuitBreaker(f"bench-{mode}", failure_threshold=3, cooldown_seconds=60) if mode == "breaker" else None
+            cache = SearchContextCache(fetcher=breaker.wrap(fetcher) if breaker else fetcher, failure_ttl_seconds=0)
+            durations = []
+            for i in range(requests):
+                start = time.perf_counter()
+                cache.get_context(f"熔断基准 城市{i}", deadline_seconds=search_deadline)
+                durations.append(time.perf_counter() - start)
+            row = {
+                "requests": requests,
+                "search_s_mean": round(statistics.mean(durations), 3),
+                "search_s_total": round(sum(durations), 3),
+                "rejected": breaker.rejected if breaker else 0,
+            }
+            results[mode] = row
+            print(f"breaker mode={mode:<10} mean={row['search_s_mean']:.3f}s total={row['search_s_total']:.1f}s "
+                  f"rejected={row['rejected']}")
+    finally:
+        search_server.shutdown()
+    return results
+
+
+RETRIEVAL_KEYS = ["京都 大阪 奈良 美食", "成都 重庆 火锅", "巴黎", "东京 亲子 博物馆", "西安 洛阳 历史 文化"]
+
+
+def bench_retrieval(repeats, search_latency=0.3, page_latency=0.2, deadline=1.8):
+    pages = start_fake_pages(latency=page_latency)
+    # 一半网页极慢（远超截止时间），检验到期即返回、不被慢网页拖住
+    slow_pages = start_fake_pages(latency=lambda path: deadline * 3 if path.endswith("/0") else page_latency)
+    servers = [pages, slow_pages]
+    search_urls = {}
+    for name, page_server in (("fast", pages), ("slow", slow_pages)):
+        search_server = start_fake_search(latency=search_latency, page_url=f"http://127.0.0.1:{page_server.server_port}/page")
+        servers.append(search_server)
+        search_urls[name] = f"http://127.0.0.1:{search_server.server_port}/html/"
+
+    modes = {
+        "single_query": None,
+        "multi_snippets": ("fast", False),
+        "multi_pages": ("fast", True),
+        "multi_pages_slow": ("slow", True),
+    }
+    results = {}
+    try:
+        for mode, config in modes.items():
+            if config is None:
+                fetch = functools.partial(planner.scrape_snippets, search_url=search_urls["fast"])
+            else:
+                server, fetch_pages = config
+                fetch = ContentRetriever(search=functools.partial(planner.scrape_results, search_url=search_urls[server]),
+                                         fetch_pages=fetch_pages, deadline_seconds=deadline).retrieve
+            durations, counts, tokens = [], [], []
+            for _ in range(repeats):
+                for key in RETRIEVAL_KEYS:
+                    start = time.perf_counter()
+                    passages = fetch(key)
+                    durations.append(time.perf_counter() - start)
+                    counts.append(len(passages))
+                    tokens.append(sum(estimate_tokens(p) for p in passages))
+            durations.sort()
+            row = {
+                "requests": len(durations),
+                "wall_s_p50": round(durations[len(durations) // 2], 3),
+                "wall_s_max": round(durations[-1], 3),
+                "passages_mean": round(statistics.mean(counts), 1),
+                "context_tokens_mean": round(statistics.mean(tokens), 1),
+            }
+            results[mode] = row
+            print(f"retrieval mode={mode:<16} p50={row['wall_s_p50']:.3f}s max={row['wall_s_max']:.3f}s "
+                  f"passages={row['passages_mean']} tokens={row['context_tokens_mean']}")
+    finally:
+        for server in servers:
+            server.shutdown()
+    results["deadline_s"] = deadline
+    return results
+
+
+def _element_bytes(node, totals):
+    # 按元素类型累计 AppTest 元素树中各元素 proto 的序列化字节数（即 rerun 时 ForwardMsg 中的元素负载）
+    proto = getattr(node, "proto", None)
+    if proto is not None and hasattr(proto, "ByteSize"):
+        name = type(node).__name__
+        totals[name] = totals.get(name, 0) + proto.ByteSize()
+    children = getattr(node, "children", None)
+    if isinstance(children, dict):
+        for child in children.values():
+            _element_bytes(child, totals)
+    return totals
+
+
+# 页面外壳改为静态资源之前的做法：每次 rerun 以 st.markdown 内联整段样式、以 components.html 内联整段脚本
+SHELL_LOADER_LINE = "components.html(get_shell_loader(), height=0, width=0)"
+SHELL_INLINE_BASELINE = """with open(os.path.join(SHELL_STATIC_DIR, "shell.css"), encoding="utf-8") as _f:
+    st.markdown("<style>" + _f.read() + "</style>", unsafe_allow_html=True)
+with open(os.path.join(SHELL_STATIC_DIR, "shell.js"), encoding="utf-8") as _f:
+    components.html("<script>" + _f.read() + "</script>", height=0, width=0)"""
+
+
+def _shell_app_copy(mode, workdir):
+    from benchmarks.load_test import app_overrides, write_app_copy
+
+    # 首页不会触发检索与生成，指向不可达的地址即可
+    app_path = write_app_copy(app_overrides("http://127.0.0.1:9/v1", "http://127.0.0.1:9/html/", workdir), workdir)
+    if mode == "baseline":
+        with open(app_path, encoding="utf-8") as f:
+            source = f.read()
+        if source.count(SHELL_LOADER_LINE) != 1:
+            raise SystemExit("app.py 中找不到外壳加载器，shell 基准需要同步更新")
+        with open(app_path, "w", encoding="utf-8") as f:
+            f.write(source.replace(SHELL_LOADER_LINE, SHELL_INLINE_BASELINE))
+    return app_path
+
+
+def bench_shell(repeats):
+    from streamlit.testing.v1 import AppTest
+
+    from benchmarks.load_test import APP_PATH
+
+    static_dir = os.path.join(os.path.dirname(APP_PATH), "static")
+    static_bytes = {name: os.path.getsize(os.path.join(static_dir, name))
+                    for name in sorted(os.listdir(static_dir))} if os.path.isdir(static_dir) else {}
+    results = {}
+    for mode in ("baseline", "static"):
+        with tempfile.TemporaryDirectory(prefix="travel-agenda-shell-") as workdir:
+            at = AppTest.from_file(_shell_app_copy(mode, workdir), default_timeout=60)
+            at.run()  # 首次运行含模块导入与 st.cache_resource 初始化，不计入
+            durations = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                at.run()
+                durations.append(time.perf_counter() - start)
+            elements = _element_bytes(at._tree, {})
+        row = {
+            "rerun_element_bytes": sum(elements.values()),
+            "rerun_element_bytes_by_type": elements,
+            "rerun_script_ms_median": round(statistics.median(durations) * 1000, 2),
+            "rerun_script_ms_p90": round(sorted(durations)[int(0.9 * (len(durations) - 1))] * 1000, 2),
+            # 静态模式下外壳资源只在首次访问时下载，之后走浏览器缓存
+            "static_asset_bytes": static_bytes if mode == "static" else {},
+        }
+        results[mode] = row
+        print(f"shell   mode={mode:<8} rerun={row['rerun_element_bytes']}B script={row['rerun_script_ms_median']:.1f}ms "
+              f"static={sum(row['static_asset_bytes'].values())}B (cached)")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="旅程行程生成 离线基准测试")
+    parser.add_argument("--suite", choices=["render", "pipeline", "delivery", "schema", "gazetteer", "model", "hedge", "breaker", "retrieval", "shell", "all"], default="all")
+    parser.add_argument("--sizes", type=int, nargs="+", default=TRIP_SIZES, help="合成行程天数")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--llm-first-token", type=float, default=0.5, help="假大模型首 token 延迟（秒）")
+    parser.add_argument("--llm-chunk-latency", type=float, default=0.002, help="假大模型每个流式分片的间隔（秒）")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="假 DuckDuckGo 响应延迟（秒）")
+    parser.add_argument("--search-deadline", type=float, default=2.0, help="等待攻略摘要的截止时间（秒）")
+    parser.add_argument("--gazetteer-places", type=int, default=200000, help="合成地名数量")
+    parser.add_argument("--live-base-url", help="schema 对比改为请求该 OpenAI 兼容接口")
+    parser.add_argument("--live-api-key", default=os.environ.get("OPENAI_API_KEY", ""))
+    parser.add_argument("--live-model", default="deepseek-v3.2")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+    }
+    if args.suite in ("render", "all"):
+        report["render"] = bench_render(args.sizes, args.repeats)
+    if args.suite in ("pipeline", "all"):
+        report["pipeline"] = bench_pipeline(args.sizes, min(args.repeats, 3), args.llm_first_token,
+                                            args.llm_chunk_latency, args.search_latency, args.search_deadline)
+
+    if args.suite in ("delivery", "all"):
+        report["delivery"] = bench_delivery(max(args.repeats * 10, 50))
+
+    if args.suite in ("schema", "all"):
+        if args.live_base_url:
+            report["schema"] = bench_schema_live(args.live_base_url, args.live_api_key, args.live_model, SCHEMA_PROMPTS)
+        else:
+            report["schema"] = bench_schema(args.sizes, min(args.repeats, 3), args.llm_first_token, args.llm_chunk_latency)
+
+    if args.suite in ("model", "all"):
+        report["model"] = bench_model(args.sizes, args.repeats)
+
+    if args.suite in ("hedge", "all"):
+        report["hedge"] = bench_hedge(max(args.repeats * 12, 60))
+
+    if args.suite in ("breaker", "all"):
+        report["breaker"] = bench_breaker(max(args.repeats * 4, 20))
+
+    if args.suite in ("retrieval", "all"):
+        report["retrieval"] = bench_retrieval(args.repeats, args.search_latency)
+
+    if args.suite in ("shell", "all"):
+        report["shell"] = bench_shell(max(args.repeats * 4, 20))
+
+    if args.suite in ("gazetteer", "all"):
+        report["gazetteer"] = bench_gazetteer(args.gazetteer_places, max(args.repeats * 2000, 5000))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import random
+
+# --- 合成行程 ---
+# 生成结构与大模型输出完全一致的行程 dict，用于离线压测模板渲染与整条流水线。
+# 固定随机种子，保证同一规格每次生成的内容一致，便于版本间对比。
+
+TRIP_SIZES = [1, 7, 30, 90]
+
+_CITIES = [
+    ("京都", "Kyoto", 35.0116, 135.7681),
+    ("大阪", "Osaka", 34.6937, 135.5023),
+    ("巴黎", "Paris", 48.8566, 2.3522),
+    ("罗马", "Rome", 41.9028, 12.4964),
+    ("成都", "Chengdu", 30.5728, 104.0668),
+    ("西安", "Xi'an", 34.3416, 108.9398),
+]
+_PLACES = ["古寺", "博物馆", "老街", "公园", "美食市场", "观景台", "神社", "古城墙", "美术馆", "夜市", "河畔步道", "茶室"]
+_DESC = "这里是当地人私藏的宝藏打卡点，清晨人少光线好，拍照出片率爆表；逛完别急着走，转角那家老字号小吃绝对值得排队，记得留足肚子哦～"
+
+
+def make_itinerary(days, min_acts=3, max_acts=12, seed=None):
+    rng = random.Random(seed if seed is not None else days)
+    trip_days = []
+    for d in range(days):
+        city_cn, city_en, lat, lng = _CITIES[(d // 3) % len(_CITIES)]
+        activities = []
+        for a in range(rng.randint(min_acts, max_acts)):
+            place = rng.choice(_PLACES)
+            activities.append({
+                "time": f"{8 + a % 14:02d}:{rng.choice(['00', '30'])}",
+                "name": f"{city_cn}{place}{a + 1}",
+                "desc": _DESC,
+                "lat": round(lat + rng.uniform(-0.05, 0.05), 6),
+                "lng": round(lng + rng.uniform(-0.05, 0.05), 6),
+                "img_keyword": f"{place} {a + 1} {city_en}",
+            })
+        trip_days.append({"date": f"Day {d + 1}", "city": city_cn, "activities": activities})
+    return {
+        "trip_title": f"{days}日漫游 ({days}-Day Journey)",
+        "trip_subtitle": "山河远阔，人间烟火",
+        "overview": "这是一趟用于基准测试的合成行程，覆盖多座城市与多种玩法，结构与大模型输出完全一致。",
+        "highlights": ["古寺晨钟", "街头美食", "河畔漫步", "城市夜景", "博物馆奇妙夜"],
+        "cover_search": "Kyoto Japan",
+        "days": trip_days,
+    }
@@ -0,0 +1,77 @@
+# --- 紧凑输出格式 ---
+# 输出 token 决定了生成耗时与费用。紧凑格式用单字母键，并把每天、每个活动改为位置数组，
+# 去掉可由下标推出的 date（Day N），坐标固定 4 位小数（约 11 米）。
+# 解码后与原有的详细结构完全一致，generate_html_template 无需任何改动。
+#
+# {"t": 主标题, "s": 副标题, "o": 总览, "h": [亮点...], "c": cover_search,
+#  "d": [[城市, [[时间, 名称, 介绍, 纬度, 经度, img_keyword], ...]], ...]}
+
+COMPACT_FIELD_KEYS = {
+    "t": "trip_title",
+    "s": "trip_subtitle",
+    "o": "overview",
+    "h": "highlights",
+    "c": "cover_search",
+}
+COMPACT_DAYS_KEY = "d"
+ACTIVITY_FIELDS = ("time", "name", "desc", "lat", "lng", "img_keyword")
+COORD_PRECISION = 4
+
+
+def _to_float(value):
+    # 无法解析的坐标保留原值（缺失为 None），交给 planner.is_valid_day 判为无效、触发单日重试，
+    # 与详细格式一致；不能补成 0.0，否则会被当作合法坐标放行
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _round_coord(value):
+    value = _to_float(value)
+    return round(value, COORD_PRECISION) if isinstance(value, float) else value
+
+
+def decode_compact_day(index, raw):
+    if isinstance(raw, dict):
+        # 模型偶尔仍会输出详细格式的一天，原样保留
+        return raw
+    if not isinstance(raw, list):
+        return None
+    city = raw[0] if len(raw) > 0 else ""
+    activities = []
+    for item in (raw[1] if len(raw) > 1 and isinstance(raw[1], list) else []):
+        if not isinstance(item, list):
+            continue
+        act = dict(zip(ACTIVITY_FIELDS, item))
+        act["lat"] = _to_float(act.get("lat"))
+        act["lng"] = _to_float(act.get("lng"))
+        activities.append(act)
+    return {"date": f"Day {index + 1}", "city": city, "activities": activities}
+
+
+def decode_compact(data):
+    if "days" in data and COMPACT_DAYS_KEY not in data:
+        return data
+    decoded = {full: data[short] for short, full in COMPACT_FIELD_KEYS.items() if short in data}
+    decoded["days"] = [decode_compact_day(i, raw) for i, raw in enumerate(data.get(COMPACT_DAYS_KEY, []))]
+    return decoded
+
+
+def encode_compact(data):
+    encoded = {short: data[full] for short, full in COMPACT_FIELD_KEYS.items() if full in data}
+    encoded[COMPACT_DAYS_KEY] = [
+        [day.get("city", ""), [
+            [
+                act.get("time", ""),
+                act.get("name", ""),
+                act.get("desc", ""),
+                _round_coord(act.get("lat")),
+                _round_coord(act.get("lng")),
+                act.get("img_keyword", ""),
+            ]
+            for act in day.get("activities", [])
+        ]]
+        for day in data.get("days", [])
+    ]
+    return encoded
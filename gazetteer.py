@@ -0,0 +1,296 @@
+import argparse
+import bisect
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import time
+import unicodedata
+
+# --- 本地地名索引：离线校验与纠正大模型给出的坐标 ---
+# 大模型给的 lat/lng 常常偏出几公里，甚至干脆是 0.0；逐点在线地理编码又慢又受限速。
+# 这里把 GeoNames 格式的地名数据（城市 + 景点）预先编译成一个紧凑的二进制索引文件，运行时 mmap 只读映射：
+#   空间索引：按 0.1° 网格编号排序的记录数组，二分定位网格后只在邻近网格内找最近点；
+#   名称索引：名称（含别名）归一化后的 64 位哈希有序数组，二分即可按名查点。
+# 解析完行程后，逐个活动按名称在附近找匹配地点：坐标缺失则补全，偏离过远则吸附，同一天相邻两站跳跃过大则标记。
+#
+# 构建：python gazetteer.py build cities15000.txt [poi_extract.txt ...] --output .cache/gazetteer.idx
+
+MAGIC = b"GAZ1"
+CELL_DEGREES = 0.1          # 空间网格边长（度），约 11 公里
+COORD_SCALE = 100000        # 坐标以 1e-5 度整数存储（约 1 米精度）
+EARTH_RADIUS_KM = 6371.0
+# 收录的 GeoNames 要素类别：P 居民点、S 建筑/景点、L 公园/区域、T 山地、H 水体、V 林地
+FEATURE_CLASSES = "PSLTHV"
+_HEADER = struct.Struct("<4sIII")   # magic, 记录数, 名称索引条数, 名称区字节数
+_LNG_CELLS = int(round(360 / CELL_DEGREES))
+
+
+def normalize_name(name):
+    # 全半角统一、小写、去掉空白与标点，使“Kinkaku-ji”“kinkakuji”“金阁寺 ”归为同一键
+    text = unicodedata.normalize("NFKC", name or "").lower()
+    return re.sub(r"[\s\W_]+", "", text)
+
+
+def _name_hash(name):
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _cell(lat, lng):
+    lat_idx = min(int((lat + 90) / CELL_DEGREES), int(round(180 / CELL_DEGREES)) - 1)
+    lng_idx = min(int((lng + 180) / CELL_DEGREES), _LNG_CELLS - 1)
+    return lat_idx * _LNG_CELLS + lng_idx
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _pad(buf):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def build_index(sources, output, feature_classes=FEATURE_CLASSES, min_population=0):
+    # sources：GeoNames 制表符分隔文件（geonameid, name, asciiname, alternatenames, lat, lng, 类别, 代码, 国家 ... 人口 ...）
+    places = []
+    for source in sources:
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < 15 or cols[6] not in feature_classes:
+                    continue
+                population = int(cols[14] or 0)
+                if cols[6] == "P" and population < min_population:
+                    continue
+                try:
+                    lat, lng = float(cols[4]), float(cols[5])
+                except ValueError:
+                    continue
+                names = {cols[1], cols[2], *cols[3].split(",")}
+                places.append((_cell(lat, lng), lat, lng, population, cols[6], cols[1], names))
+    places.sort(key=lambda p: p[0])
+
+    n = len(places)
+    names_blob = bytearray()
+    name_offsets = [0]
+    name_entries = []
+    for idx, (_, _, _, _, _, display, names) in enumerate(places):
+        names_blob.extend(display.encode("utf-8"))
+        name_offsets.append(len(names_blob))
+        for key in {normalize_name(name) for name in names if name}:
+            if key:
+                name_entries.append((_name_hash(key), idx))
+    name_entries.sort()
+
+    out = bytearray(_HEADER.pack(MAGIC, n, len(name_entries), len(names_blob)))
+    _pad(out)
+    out.extend(struct.pack(f"<{n}I", *(p[0] for p in places)))
+    _pad(out)
+    out.extend(struct.pack(f"<{n}i", *(round(p[1] * COORD_SCALE) for p in places)))
+    _pad(out)
+    out.extend(struct.pack(f"<{n}i", *(round(p[2] * COORD_SCALE) for p in places)))
+    _pad(out)
+    out.extend(struct.pack(f"<{n}I", *(min(p[3], 2 ** 32 - 1) for p in places)))
+    _pad(out)
+    out.extend(b"".join(p[4].encode("ascii") for p in places))
+    _pad(out)
+    out.extend(struct.pack(f"<{n + 1}I", *name_offsets))
+    _pad(out)
+    out.extend(names_blob)
+    _pad(out)
+    out.extend(struct.pack(f"<{len(name_entries)}Q", *(h for h, _ in name_entries)))
+    _pad(out)
+    out.extend(struct.pack(f"<{len(name_entries)}I", *(i for _, i in name_entries)))
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(out)
+    os.replace(tmp, output)
+    return {"places": n, "names": len(name_entries), "bytes": len(out)}
+
+
+class Gazetteer:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        self._sections = []
+        magic, n, m, blob_size = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+        self.size = n
+        offset = _HEADER.size + (-_HEADER.size % 8)
+
+        def section(length, fmt=None):
+            nonlocal offset
+            part = view[offset:offset + length]
+            offset += length + (-length % 8)
+            self._sections.append(part)
+            if fmt:
+                part = part.cast(fmt)
+                self._sections.append(part)
+            return part
+
+        # 各列均为零拷贝视图，按需从页缓存读取
+        self._cells = section(4 * n, "I")
+        self._lats = section(4 * n, "i")
+        self._lngs = section(4 * n, "i")
+        self._populations = section(4 * n, "I")
+        self._classes = section(n)
+        self._name_offsets = section(4 * (n + 1), "I")
+        self._names = section(blob_size)
+        self._name_hashes = section(8 * m, "Q")
+        self._name_records = section(4 * m, "I")
+
+    def place(self, idx):
+        start, end = self._name_offsets[idx], self._name_offsets[idx + 1]
+        return {
+            "name": bytes(self._names[start:end]).decode("utf-8"),
+            "lat": self._lats[idx] / COORD_SCALE,
+            "lng": self._lngs[idx] / COORD_SCALE,
+            "population": self._populations[idx],
+            "feature_class": chr(self._classes[idx]),
+        }
+
+    def _cell_range(self, cell):
+        lo = bisect.bisect_left(self._cells, cell)
+        return lo, bisect.bisect_right(self._cells, cell, lo)
+
+    def nearest(self, lat, lng, radius_km=5.0, limit=5):
+        # 在以 (lat, lng) 为中心、覆盖 radius_km 的网格块中找最近的若干地点
+        lat_idx, lng_idx = divmod(_cell(lat, lng), _LNG_CELLS)
+        lat_span = int(radius_km / (111.0 * CELL_DEGREES)) + 1
+        lng_span = int(radius_km / (111.0 * CELL_DEGREES * max(0.05, math.cos(math.radians(lat))))) + 1
+        found = []
+        for di in range(-lat_span, lat_span + 1):
+            for dj in range(-lng_span, lng_span + 1):
+                lo, hi = self._cell_range((lat_idx + di) * _LNG_CELLS + (lng_idx + dj) % _LNG_CELLS)
+                for idx in range(lo, hi):
+                    distance = haversine_km(lat, lng, self._lats[idx] / COORD_SCALE, self._lngs[idx] / COORD_SCALE)
+                    if distance <= radius_km:
+                        found.append((distance, idx))
+        found.sort()
+        return [dict(self.place(idx), distance_km=distance) for distance, idx in found[:limit]]
+
+    def lookup(self, name):
+        # 按名称（含别名）精确查找，返回全部同名地点的记录下标
+        key = normalize_name(name)
+        if not key:
+            return []
+        h = _name_hash(key)
+        lo = bisect.bisect_left(self._name_hashes, h)
+        hi = bisect.bisect_right(self._name_hashes, h, lo)
+        return [self._name_records[i] for i in range(lo, hi)]
+
+    def match(self, names, near=None, radius_km=30.0):
+        # 在候选名称中找地点：给出 near 时取 radius_km 内最近的一个，否则取人口最多的一个
+        best = None
+        for name in names:
+            for idx in self.lookup(name):
+                lat, lng = self._lats[idx] / COORD_SCALE, self._lngs[idx] / COORD_SCALE
+                if near is not None:
+                    score = haversine_km(near[0], near[1], lat, lng)
+                    if score > radius_km:
+                        continue
+                else:
+                    score = -self._populations[idx]
+                if best is None or score < best[0]:
+                    best = (score, idx)
+        return self.place(best[1]) if best else None
+
+    def close(self):
+        # 先释放全部视图，mmap 才能关闭
+        for part in reversed(self._sections):
+            part.release()
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def candidate_names(act):
+    # “金阁寺 (Kinkaku-ji)”拆成中文名与括号内外文名；img_keyword 形如“Kinkaku-ji Kyoto”，再去掉末尾城市名试一次
+    names = [re.sub(r"[（(].*?[)）]", "", act.name).strip()]
+    names.extend(re.findall(r"[（(](.*?)[)）]", act.name))
+    keyword = act.img_keyword.strip()
+    if keyword:
+        names.append(keyword)
+        if " " in keyword:
+            names.append(keyword.rsplit(" ", 1)[0])
+    return [n for n in names if n]
+
+
+def check_itinerary(gazetteer, itinerary, snap_km=1.0, search_km=30.0, max_jump_km=300.0):
+    # itinerary 为 itinerary_model.Itinerary：坐标已由 Itinerary.from_dict 归一为合法范围内的 float（0,0 即缺失），
+    # 字符串坐标（"35.0"、"35.0°N"）不会被误当作缺失。原地修正各活动的坐标，返回统计与告警：
+    #   filled  坐标缺失，以同名地点或当天城市补全
+    #   snapped 同名地点就在附近但偏离超过 snap_km，吸附到该地点
+    #   flagged 同一天相邻两站相距超过 max_jump_km，多半是坐标张冠李戴
+    report = {"checked": 0, "matched": 0, "filled": 0, "snapped": 0, "flagged": []}
+    for day_idx, day in enumerate(itinerary.days):
+        city = gazetteer.match([day.city]) if day.city else None
+        previous = None
+        for act_idx, act in enumerate(day.activities):
+            report["checked"] += 1
+            lat, lng = act.lat, act.lng
+            missing = not act.has_coords
+            anchor = (lat, lng) if not missing else ((city["lat"], city["lng"]) if city else previous)
+            place = gazetteer.match(candidate_names(act), near=anchor, radius_km=search_km)
+            if place is not None:
+                report["matched"] += 1
+                if missing:
+                    lat, lng = place["lat"], place["lng"]
+                    report["filled"] += 1
+                elif haversine_km(lat, lng, place["lat"], place["lng"]) > snap_km:
+                    lat, lng = place["lat"], place["lng"]
+                    report["snapped"] += 1
+            elif missing and anchor is not None:
+                lat, lng = anchor
+                report["filled"] += 1
+            act.lat, act.lng = lat, lng
+
+            if previous is not None and act.has_coords:
+                jump = haversine_km(previous[0], previous[1], lat, lng)
+                if jump > max_jump_km:
+                    report["flagged"].append({"day": day_idx, "activity": act_idx, "jump_km": round(jump, 1)})
+            if act.has_coords:
+                previous = (lat, lng)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地地名索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="由 GeoNames 格式文件编译索引")
+    build.add_argument("sources", nargs="+")
+    build.add_argument("--output", default=os.path.join(".cache", "gazetteer.idx"))
+    build.add_argument("--min-population", type=int, default=0, help="居民点的最小人口")
+    query = sub.add_parser("query", help="按名称或坐标查询")
+    query.add_argument("index")
+    query.add_argument("--name")
+    query.add_argument("--near", type=float, nargs=2, metavar=("LAT", "LNG"))
+    query.add_argument("--radius", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        stats = build_index(args.sources, args.output, min_population=args.min_population)
+        print(f"已写入 {args.output}: {stats}，耗时 {time.perf_counter() - start:.1f}s")
+        return
+    gazetteer = Gazetteer(args.index)
+    if args.name:
+        print(gazetteer.match([args.name], near=tuple(args.near) if args.near else None, radius_km=args.radius))
+    elif args.near:
+        for place in gazetteer.nearest(args.near[0], args.near[1], radius_km=args.radius):
+            print(place)
+
+
+if __name__ == "__main__":
+    main()
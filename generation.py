@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import deque
+
+# --- 生成进度：后台线程与页面主线程之间的事件通知 ---
+# 取代原先 `while thread.is_alive(): time.sleep(3)` 的轮询：
+# 后台线程每写入一个字段、一天或最终结果都会 notify，主线程在 Condition 上等待，
+# 被唤醒后立即渲染；小知识轮换只作为等待超时，从不推迟结果的交付。
+
+
+class GenerationProgress:
+    def __init__(self):
+        self.partial = {"days": {}}      # days 按天序号存放：补生成的天覆盖原位置，而不是追加到末尾
+        self.day_updates = 0            # 新增或替换一天时递增，预览据此判断是否重绘
+        self.data = None
+        self.html = None
+        self.error = None
+        self.version = 0            # 每次状态变化递增，主线程据此判断是否有新内容
+        self.finished_at = None     # 结果就绪的 perf_counter 时间戳，用于度量交付延迟
+        self._cond = threading.Condition()
+
+    def _publish(self, update):
+        with self._cond:
+            update()
+            self.version += 1
+            self._cond.notify_all()
+
+    def touch(self):
+        # 无数据变化、仅通知等待方刷新（如排队位置前移）
+        self._publish(lambda: None)
+
+    def add_field(self, key, value):
+        self._publish(lambda: self.partial.__setitem__(key, value))
+
+    def add_day(self, index, day):
+        def update():
+            self.partial["days"][index] = day
+            self.day_updates += 1
+        self._publish(update)
+
+    def finish(self, data, html=None):
+        def update():
+            self.data = data
+            self.html = html
+            self.finished_at = time.perf_counter()
+        self._publish(update)
+
+    def fail(self, error):
+        def update():
+            self.error = error
+            self.finished_at = time.perf_counter()
+        self._publish(update)
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def wait_for_update(self, seen_version, timeout):
+        # 有新内容或已结束时立即返回 True；超时返回 False（由调用方趁机轮换小知识）
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version != seen_version or self.done, timeout=timeout)
+
+    def delivery_latency_ms(self):
+        # 结果就绪 -> 主线程开始渲染 之间的延迟
+        if self.finished_at is None:
+            return None
+        return (time.perf_counter() - self.finished_at) * 1000
+
+
+# --- 共享生成执行器：并发上限 + 有界排队 + 相同请求合并 ---
+# 所有会话共用一个执行器：同时最多 max_concurrency 个大模型调用，其余按先后排队；
+# 排队已满时立即拒绝；同一键（归一化输入）已在排队或生成中的请求直接共享同一个 GenerationProgress。
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class GenerationExecutor:
+    def __init__(self, max_concurrency=4, max_queue=32):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._pending = deque()   # (key, progress, job)
+        self._inflight = {}       # key -> progress（排队中或生成中）
+        self._running = 0
+        self._cond = threading.Condition()
+        for i in range(max_concurrency):
+            threading.Thread(target=self._work, name=f"generation-{i}", daemon=True).start()
+
+    def submit(self, key, job):
+        # job(progress) 在工作线程中执行，负责调用 progress.add_* / finish / fail
+        with self._cond:
+            progress = self._inflight.get(key)
+            if progress is not None:
+                self.coalesced += 1
+                return progress
+            if len(self._pending) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"generation queue is full ({self.max_queue})")
+            progress = GenerationProgress()
+            self._inflight[key] = progress
+            self._pending.append((key, progress, job))
+            self.submitted += 1
+            self._cond.notify()
+            return progress
+
+    def position(self, progress):
+        # 排队位置：1 表示下一个开始；0 表示已在生成中或已结束
+        with self._cond:
+            for idx, (_, queued, _) in enumerate(self._pending):
+                if queued is progress:
+                    return idx + 1
+        return 0
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                key, progress, job = self._pending.popleft()
+                self._running += 1
+                waiting = [queued for _, queued, _ in self._pending]
+            # 队伍前进了一位，唤醒仍在排队的页面刷新排队位置
+            for queued in waiting:
+                queued.touch()
+            try:
+                job(progress)
+            except Exception as e:
+                progress.fail(str(e))
+            finally:
+                if not progress.done:
+                    progress.fail("generation finished without a result")
+                with self._cond:
+                    self._running -= 1
+                    self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self._running,
+                "queued": len(self._pending),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,375 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from renderer import IMAGE_PROFILES
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # 未安装 Pillow 时原图透传，只保留缓存与合并请求
+    Image = None
+PILLOW_AVAILABLE = Image is not None
+
+# --- 配图缩放代理 ---
+# 页面里的景点照片与封面直接加载维基 800px / 1600px 缩略图或 Bing 原图，一份行程在手机上常常要下 10–30 MB。
+# 本代理提供 /img/<profile>/<width>?u=<原图地址> 端点：原图只回源一次，
+# 按模板 CSS 中卡片与封面的实际尺寸（renderer.IMAGE_PROFILES）裁剪缩放，按浏览器 Accept 头输出 AVIF / WebP / JPEG。
+# 结果以“原图地址哈希 + 尺寸 + 格式”命名落盘，命中时无需读取或回源原图；总字节数有上限，按 LRU 淘汰。
+
+ALLOWED_SOURCE_HOSTS = ("wikimedia.org", "wikipedia.org", "mm.bing.net")   # 只代理这些图源，避免成为开放代理
+MAX_SOURCE_BYTES = 20 * 1024 * 1024     # 原图超过该大小直接拒绝
+OUTPUT_QUALITY = {"avif": 55, "webp": 72, "jpeg": 80}
+OUTPUT_MIME = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+_IMAGE_PATH = re.compile(r"^/img/([a-z]+)/(\d+)$")
+
+
+def _supported_formats():
+    if Image is None:
+        return ()
+    return tuple(fmt for fmt in ("avif", "webp") if features.check(fmt)) + ("jpeg",)
+
+
+def choose_format(accept, formats):
+    # 按 Accept 头协商输出格式；AVIF 体积最小，其次 WebP，JPEG 兜底
+    accept = accept or ""
+    for fmt in formats:
+        if fmt == "jpeg" or OUTPUT_MIME[fmt] in accept:
+            return fmt
+    return None
+
+
+def _sniff_mime(body):
+    if body[:2] == b"\xff\xd8":
+        return "image/jpeg"
+    if body[:4] == b"RIFF" and body[8:12] == b"WEBP":
+        return "image/webp"
+    if body[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return "image/png" if body[:4] == b"\x89PNG" else "image/gif"
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:24]
+
+
+class _Undecodable(Exception):
+    pass
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, timeout=10, formats=None, allowed_hosts=ALLOWED_SOURCE_HOSTS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.formats = _supported_formats() if formats is None else tuple(formats)
+        self.allowed_hosts = allowed_hosts
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_errors = 0
+        self.bytes = 0
+        self._lru = OrderedDict()   # 相对路径 -> 字节数；原图（src/）与缩放结果（out/）共用一条 LRU
+        self._content = {}          # 原图地址哈希 -> 原图内容哈希
+        self._inflight = {}         # 相对路径 -> Future，同一文件并发请求只生成一次
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "src"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "out"), exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        # 启动时按文件修改时间重建 LRU，缓存跨进程重启保留
+        entries = []
+        for sub in ("src", "out"):
+            for name in os.listdir(os.path.join(self.directory, sub)):
+                if name.endswith(".tmp"):
+                    continue
+                rel = f"{sub}/{name}"
+                try:
+                    stat = os.stat(os.path.join(self.directory, rel))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, rel, stat.st_size))
+        for _, rel, size in sorted(entries):
+            self._lru[rel] = size
+            self.bytes += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._lru:
+            rel, size = self._lru.popitem(last=False)
+            self.bytes -= size
+            if rel.startswith("src/"):
+                self._content.pop(rel[4:], None)
+            try:
+                os.remove(os.path.join(self.directory, rel))
+            except OSError:
+                pass
+
+    def _cached(self, rel, produce):
+        # 命中则读盘；未命中时由第一个请求方调用 produce() 生成并落盘，其余并发请求等待同一结果
+        path = os.path.join(self.directory, rel)
+        with self._lock:
+            if rel in self._lru:
+                self._lru.move_to_end(rel)
+                owner = None
+            else:
+                future = self._inflight.get(rel)
+                owner = future is None
+                if owner:
+                    future = self._inflight[rel] = Future()
+        if owner is None:
+            try:
+                with open(path, "rb") as f:
+                    return f.read(), "hit"
+            except OSError:
+                # 文件被外部删除：从索引中去掉，重新生成
+                with self._lock:
+                    size = self._lru.pop(rel, None)
+                    if size is not None:
+                        self.bytes -= size
+                return self._cached(rel, produce)
+        if not owner:
+            return future.result(timeout=self.timeout * 3), "coalesced"
+
+        try:
+            body = produce()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(rel, None)
+            future.set_exception(e)
+            raise
+        # 无论落盘成败，都要结束 Future 并移出 _inflight，否则之后同一文件的请求都会等到超时
+        try:
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(body)
+                os.replace(tmp, path)
+            except OSError:
+                # 磁盘写入失败：结果照常返回，只是不进缓存
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            else:
+                with self._lock:
+                    self._lru[rel] = len(body)
+                    self.bytes += len(body)
+                    self._evict()
+        finally:
+            with self._lock:
+                self._inflight.pop(rel, None)
+            future.set_result(body)
+        return body, "miss"
+
+    def _check_source(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        host = (parsed.hostname or "").lower()
+        if parsed.scheme not in ("http", "https") or not any(
+                host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts):
+            raise PermissionError(f"image host not allowed: {host}")
+
+    def _fetch_upstream(self, url):
+        req = urllib.request.Request(url, headers={"User-Agent": "TravelAgenda/1.0 (image proxy)"})
+        with metrics.STAGE_SECONDS.time(stage="image_fetch"):
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                body = resp.read(MAX_SOURCE_BYTES + 1)
+        if len(body) > MAX_SOURCE_BYTES:
+            raise ValueError("source image too large")
+        return body
+
+    def source(self, url):
+        # 返回 (原图字节, 内容哈希)
+        self._check_source(url)
+        url_key = _url_key(url)
+        try:
+            body, _ = self._cached(f"src/{url_key}", lambda: self._fetch_upstream(url))
+        except ValueError:
+            raise
+        except Exception:
+            with self._lock:
+                self.upstream_errors += 1
+            metrics.IMAGE_REQUESTS.inc(result="error")
+            raise
+        content_key = self._content.get(url_key)
+        if content_key is None:
+            content_key = self._content[url_key] = hashlib.sha256(body).hexdigest()[:24]
+        return body, content_key
+
+    def _transcode(self, body, profile, width, fmt):
+        img = Image.open(io.BytesIO(body))
+        img = ImageOps.exif_transpose(img)
+        aspect = IMAGE_PROFILES[profile]["aspect"]
+        if aspect:
+            # 按卡片比例居中裁剪；原图不够大时不放大
+            target_w = min(width, img.width, int(img.height * aspect))
+            img = ImageOps.fit(img, (target_w, max(1, round(target_w / aspect))), Image.LANCZOS)
+        elif img.width > width:
+            img.thumbnail((width, width * 4), Image.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        if fmt == "avif":
+            img.save(out, "AVIF", quality=OUTPUT_QUALITY["avif"], speed=8)
+        elif fmt == "webp":
+            img.save(out, "WEBP", quality=OUTPUT_QUALITY["webp"], method=4)
+        else:
+            img.save(out, "JPEG", quality=OUTPUT_QUALITY["jpeg"], optimize=True, progressive=True)
+        return out.getvalue()
+
+    def get(self, profile, width, url, accept=""):
+        # 返回 (bytes, mime, etag)；参数非法抛 KeyError / ValueError，图源不在白名单抛 PermissionError
+        spec = IMAGE_PROFILES[profile]
+        if width not in spec["widths"]:
+            raise ValueError("unsupported width")
+        fmt = choose_format(accept, self.formats)
+        if fmt is None:
+            # 未安装 Pillow：原图透传
+            body, content_key = self.source(url)
+            metrics.IMAGE_REQUESTS.inc(result="passthrough")
+            return body, _sniff_mime(body), content_key
+        self._check_source(url)
+        # 缩放结果按原图地址哈希命名：命中时直接读 out/ 下的文件，不再读取（或回源下载）原图
+        name = f"{_url_key(url)}-{profile}-{width}.{fmt}"
+
+        def produce():
+            body, _ = self.source(url)
+            try:
+                with metrics.STAGE_SECONDS.time(stage="image_transcode"):
+                    return self._transcode(body, profile, width, fmt)
+            except OSError as e:
+                raise _Undecodable(str(e)) from e
+
+        try:
+            out, result = self._cached(f"out/{name}", produce)
+        except _Undecodable:
+            # 原图损坏或格式无法识别时透传原图，浏览器仍可能显示
+            body, content_key = self.source(url)
+            metrics.IMAGE_REQUESTS.inc(result="passthrough")
+            return body, _sniff_mime(body), content_key
+        with self._lock:
+            if result == "hit":
+                self.hits += 1
+            elif result == "coalesced":
+                self.coalesced += 1
+            else:
+                self.misses += 1
+        metrics.IMAGE_REQUESTS.inc(result=result)
+        return out, OUTPUT_MIME[fmt], name
+
+    def trip_report(self, image_urls, html=None, accept="image/webp", max_workers=4):
+        # 预先生成一份行程所有配图的默认尺寸（顺带预热缓存），统计页面总重量：
+        # html_bytes 为页面本身，image_bytes 为经代理后的配图，source_bytes 为直连原图时的配图
+        image_urls = image_urls or {}
+        wanted = [("card", url) for url in (image_urls.get("photos") or {}).values() if url]
+        if image_urls.get("cover"):
+            wanted.append(("cover", image_urls["cover"]))
+        wanted = list(dict.fromkeys(wanted))
+
+        def measure(item):
+            profile, url = item
+            source, _ = self.source(url)
+            body, _, _ = self.get(profile, IMAGE_PROFILES[profile]["default"], url, accept)
+            return len(source), len(body)
+
+        source_bytes = image_bytes = failures = 0
+        started = time.time()
+        if wanted:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-report") as pool:
+                futures = [pool.submit(measure, item) for item in wanted]
+                for future in futures:
+                    try:
+                        src_size, out_size = future.result()
+                    except Exception:
+                        failures += 1
+                        continue
+                    source_bytes += src_size
+                    image_bytes += out_size
+        html_bytes = len(html.encode("utf-8")) if html else 0
+        return {
+            "images": len(wanted),
+            "failures": failures,
+            "html_bytes": html_bytes,
+            "image_bytes": image_bytes,
+            "source_bytes": source_bytes,
+            "page_bytes": html_bytes + image_bytes,
+            "saved_ratio": round(1 - image_bytes / source_bytes, 3) if source_bytes else 0.0,
+            "seconds": round(time.time() - started, 3),
+        }
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._lru)
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_errors": self.upstream_errors,
+            "hit_rate": (self.hits + self.coalesced) / total if total else 0.0,
+            "entries": entries,
+            "bytes": self.bytes,
+            "formats": list(self.formats),
+        }
+
+
+def start_image_proxy(cache, port, host="0.0.0.0"):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type, cache_control="no-store", etag=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", cache_control)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            if etag:
+                self.send_header("ETag", f'"{etag}"')
+                # 输出格式随 Accept 头变化，共享缓存需按此区分
+                self.send_header("Vary", "Accept")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/img/stats":
+                self._send(200, json.dumps(cache.stats()).encode("utf-8"), "application/json")
+                return
+            match = _IMAGE_PATH.match(path)
+            url = urllib.parse.parse_qs(query).get("u", [""])[0]
+            if not match or not url:
+                self._send(404, b"not found", "text/plain")
+                return
+            try:
+                body, mime, etag = cache.get(match.group(1), int(match.group(2)), url, self.headers.get("Accept", ""))
+            except (KeyError, ValueError):
+                self._send(404, b"unknown image size", "text/plain")
+                return
+            except PermissionError:
+                self._send(403, b"image host not allowed", "text/plain")
+                return
+            except Exception:
+                # 页面上的 onerror 会退回 Bing 备用图
+                self._send(502, b"upstream error", "text/plain")
+                return
+            if self.headers.get("If-None-Match") == f'"{etag}"':
+                self.send_response(304)
+                self.send_header("ETag", f'"{etag}"')
+                self.end_headers()
+                return
+            self._send(200, body, mime, "public, max-age=604800", etag)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="image-proxy", daemon=True).start()
+    return server
@@ -0,0 +1,157 @@
+import json
+import math
+import re
+import sys
+from dataclasses import dataclass
+
+# --- 行程内部模型 ---
+# 大模型输出经 json.loads 得到的嵌套 dict 在渲染、缓存与导出之间到处以 .get(..., 默认值) 取值，
+# 坐标可能是字符串、缺字段时各处默认值也不一致。这里在解析完成后做唯一一次校验与类型归一：
+# 字符串去空白、坐标转为合法范围内的 float（无法识别记为 0.0，即“缺坐标”）、非法的天与活动直接丢弃，
+# 之后渲染、缓存与导出都只读这份带 __slots__ 的轻量对象；需要落盘或交给旧接口时用 to_dict() 还原成原结构。
+# （显式声明 __slots__ 而非 dataclass(slots=True)，兼容 Python 3.9）
+
+DEFAULT_TITLE = "MY JOURNEY"
+DEFAULT_SUBTITLE = "Travel Itinerary"
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+def _text(value, default=""):
+    if value is None:
+        return default
+    text = value if isinstance(value, str) else str(value)
+    return text.strip() or default
+
+
+def coerce_coordinate(value, limit):
+    # 接受数字或 "35.0116" / "35.0116°N" 这类字符串；超出 ±limit、NaN 或无法识别时返回 0.0
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = _NUMBER.search(_text(value).replace("，", ".").replace(",", "."))
+        if not match:
+            return 0.0
+        number = float(match.group())
+        if re.search(r"[SsWw]\s*$", _text(value)):
+            number = -abs(number)
+    if math.isnan(number) or not -limit <= number <= limit:
+        return 0.0
+    return number
+
+
+@dataclass
+class Activity:
+    __slots__ = ("time", "name", "desc", "lat", "lng", "img_keyword")
+    time: str
+    name: str
+    desc: str
+    lat: float
+    lng: float
+    img_keyword: str
+
+    @classmethod
+    def from_dict(cls, raw):
+        name = _text(raw.get("name"))
+        return cls(
+            time=sys.intern(_text(raw.get("time"))),
+            name=name,
+            desc=_text(raw.get("desc")),
+            lat=coerce_coordinate(raw.get("lat"), 90),
+            lng=coerce_coordinate(raw.get("lng"), 180),
+            img_keyword=_text(raw.get("img_keyword"), name),
+        )
+
+    @property
+    def has_coords(self):
+        return not (self.lat == 0 and self.lng == 0)
+
+    def to_dict(self):
+        return {"time": self.time, "name": self.name, "desc": self.desc,
+                "lat": self.lat, "lng": self.lng, "img_keyword": self.img_keyword}
+
+
+@dataclass
+class Day:
+    __slots__ = ("date", "city", "activities")
+    date: str
+    city: str
+    activities: list
+
+    @classmethod
+    def from_dict(cls, index, raw):
+        activities = raw.get("activities")
+        return cls(
+            date=sys.intern(_text(raw.get("date"), f"Day {index + 1}")),
+            city=sys.intern(_text(raw.get("city"))),
+            activities=[Activity.from_dict(act) for act in activities if isinstance(act, dict)]
+            if isinstance(activities, list) else [],
+        )
+
+    def to_dict(self):
+        return {"date": self.date, "city": self.city, "activities": [act.to_dict() for act in self.activities]}
+
+
+@dataclass
+class Itinerary:
+    __slots__ = ("trip_title", "trip_subtitle", "overview", "highlights", "cover_search", "days")
+    trip_title: str
+    trip_subtitle: str
+    overview: str
+    highlights: tuple
+    cover_search: str
+    days: list
+
+    @classmethod
+    def from_dict(cls, data):
+        # 唯一的校验入口；data 不是 dict 时抛 ValueError
+        if not isinstance(data, dict):
+            raise ValueError("itinerary must be a JSON object")
+        title = _text(data.get("trip_title"), DEFAULT_TITLE)
+        highlights = data.get("highlights")
+        if isinstance(highlights, str):
+            highlights = [highlights]
+        days = data.get("days")
+        return cls(
+            trip_title=title,
+            trip_subtitle=_text(data.get("trip_subtitle"), DEFAULT_SUBTITLE),
+            overview=_text(data.get("overview")),
+            highlights=tuple(_text(h) for h in highlights if _text(h)) if isinstance(highlights, list) else (),
+            cover_search=_text(data.get("cover_search"), title),
+            # 流式解析中无法修复的天以 None 占位，这里一并丢弃
+            days=[Day.from_dict(i, day) for i, day in enumerate(days) if isinstance(day, dict)]
+            if isinstance(days, list) else [],
+        )
+
+    @property
+    def activity_count(self):
+        return sum(len(day.activities) for day in self.days)
+
+    def activities(self):
+        # 依次产出 (day_idx, act_idx, activity)
+        for day_idx, day in enumerate(self.days):
+            for act_idx, act in enumerate(day.activities):
+                yield day_idx, act_idx, act
+
+    def to_dict(self):
+        return {
+            "trip_title": self.trip_title,
+            "trip_subtitle": self.trip_subtitle,
+            "overview": self.overview,
+            "highlights": list(self.highlights),
+            "cover_search": self.cover_search,
+            "days": [day.to_dict() for day in self.days],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+
+def as_itinerary(value):
+    # 渲染、导出等入口统一接受 Itinerary、行程 dict 或 JSON 字符串
+    if isinstance(value, Itinerary):
+        return value
+    if isinstance(value, (str, bytes)):
+        value = json.loads(value)
+    return Itinerary.from_dict(value)
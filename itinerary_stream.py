@@ -0,0 +1,144 @@
+import json
+
+from json_repair import repair_json, strip_fences
+
+# --- 流式 JSON 增量解析器 ---
+# 大模型以流式方式逐段吐出行程 JSON，本解析器边接收边扫描：
+# 顶层字段（trip_title / overview / highlights ...）一旦闭合立即产出，
+# days 数组中的每一天对象一旦闭合也立即产出，无需等待整段 JSON 结束。
+#
+# 产出事件统一为三元组：
+#   ("field", key, value)  顶层字段闭合（days 除外）
+#   ("day", index, day)    days[index] 对象闭合
+#
+# 某一天的 JSON 有瑕疵时先尝试修复；仍无法解析则在 days 中占位 None，保证后续天数的下标不错位。
+#
+# days_key 可改为紧凑格式中的 "d"，此时每一天是位置数组而非对象，同样在闭合时产出。
+
+
+class ItineraryStreamParser:
+    def __init__(self, days_key="days"):
+        self.days_key = days_key
+        self.buffer = ""
+        self.fields = {}
+        self.days = []
+        self.repairs = 0          # 经过修复才解析成功的次数（单天或整体）
+        self._pos = 0
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escape = False
+        self._stack = []
+        self._string_start = -1
+        self._last_string = None
+        self._key = None
+        self._value_start = -1
+        self._day_start = -1
+
+    def feed(self, chunk):
+        if not chunk or self._finished:
+            return []
+        self.buffer += chunk
+        events = []
+        buf = self.buffer
+        i = self._pos
+        n = len(buf)
+
+        while i < n:
+            ch = buf[i]
+
+            # 跳过顶层对象之前的杂质（如 ```json 代码块标记）
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("{")
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._value_start < 0:
+                        # 顶层对象中的字符串且不处于取值阶段，即为键名
+                        self._last_string = buf[self._string_start:i + 1]
+                i += 1
+                continue
+
+            depth = len(self._stack)
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and depth == 1 and self._value_start < 0:
+                try:
+                    self._key = json.loads(self._last_string)
+                except (TypeError, ValueError):
+                    self._key = None
+                self._value_start = i + 1
+            elif ch in "{[":
+                self._stack.append(ch)
+                if depth == 2 and self._stack[1] == "[" and self._key == self.days_key:
+                    self._day_start = i
+            elif ch in "}]":
+                if depth == 1:
+                    # 顶层对象闭合：最后一个字段没有逗号结尾，在此收尾
+                    self._emit_field(buf[self._value_start:i], events)
+                    self._stack.pop()
+                    self._finished = True
+                    i += 1
+                    break
+                self._stack.pop()
+                if depth == 3 and self._day_start >= 0 and self._key == self.days_key:
+                    self._emit_day(buf[self._day_start:i + 1], events)
+                    self._day_start = -1
+            elif ch == "," and depth == 1:
+                self._emit_field(buf[self._value_start:i], events)
+            i += 1
+
+        self._pos = i
+        return events
+
+    def _emit_field(self, raw, events):
+        key = self._key
+        self._key = None
+        self._value_start = -1
+        if key is None or key == self.days_key:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        self.fields[key] = value
+        events.append(("field", key, value))
+
+    def _emit_day(self, raw, events):
+        index = len(self.days)
+        try:
+            day, repaired = repair_json(raw)
+        except ValueError:
+            self.days.append(None)
+            return
+        self.repairs += repaired
+        self.days.append(day)
+        events.append(("day", index, day))
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def result(self):
+        # 优先整体解析（必要时修复）完整文本；仍失败时退回到已增量拼装出的字段与天数
+        try:
+            data, repaired = repair_json(strip_fences(self.buffer))
+            if isinstance(data, dict):
+                self.repairs += repaired
+                return data
+        except ValueError:
+            pass
+        data = dict(self.fields)
+        data[self.days_key] = list(self.days)
+        return data
@@ -0,0 +1,121 @@
+import json
+
+# --- 容错 JSON 修复 ---
+# 大模型输出偶有瑕疵：被截断、尾随逗号、字符串里未转义的引号或换行、JSON 前后夹杂说明文字。
+# 原先 json.loads 一处出错整份行程作废；这里先尝试标准解析，失败时逐字符重写一遍：
+# 丢弃前后杂质、转义内嵌引号与换行、删除尾随逗号、纠正错配的括号；
+# 若文本被截断，则依次回退到最近一个完整的值并补齐括号，尽量保住已经生成好的部分。
+
+MAX_CUT_ATTEMPTS = 64   # 截断时最多回退尝试的断点数
+
+
+def strip_fences(text):
+    return (text or "").replace("```json", "").replace("```", "").strip()
+
+
+def _next_significant(text, i):
+    n = len(text)
+    while i < n and text[i] in " \t\r\n":
+        i += 1
+    return text[i] if i < n else ""
+
+
+def _close(out, stack):
+    # 去掉末尾的空白与悬空逗号，再按栈补齐闭合括号
+    text = "".join(out).rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    return text + "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+
+def _rewrite(text):
+    # 返回按优先级排列的候选文本：完整闭合的结果，或截断时的各个回退断点
+    starts = [pos for pos in (text.find("{"), text.find("[")) if pos >= 0]
+    if not starts:
+        return []
+    out = []
+    stack = []
+    cuts = []          # (输出长度, 当时的括号栈)：每个位置之前都是完整的值
+    in_string = False
+    escape = False
+    i, n = min(starts), len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if escape:
+                out.append(ch)
+                escape = False
+            elif ch == "\\":
+                out.append(ch)
+                escape = True
+            elif ch == '"':
+                following = _next_significant(text, i + 1)
+                if following in ("", ",", "}", "]", ":"):
+                    in_string = False
+                    out.append(ch)
+                    if following != ":":
+                        cuts.append((len(out), tuple(stack)))
+                else:
+                    # 后面紧跟的不是分隔符，视为字符串内部未转义的引号
+                    out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\r":
+                out.append("\\r")
+            elif ch == "\t":
+                out.append("\\t")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            if not stack:
+                break
+            opener = stack.pop()
+            while out and out[-1] in (" ", "\t", "\r", "\n"):
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            # 按栈顶补上正确的闭合括号，顺带纠正错配
+            out.append("}" if opener == "{" else "]")
+            cuts.append((len(out), tuple(stack)))
+            if not stack:
+                # 顶层闭合，之后的说明文字全部丢弃
+                return ["".join(out)]
+        elif ch == ",":
+            cuts.append((len(out), tuple(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+
+    # 走到这里说明文本被截断：先原地补齐，再依次回退到更早的完整值
+    tail = list(out)
+    if in_string:
+        tail.append('"')
+    candidates = [_close(tail, stack)]
+    for length, cut_stack in reversed(cuts[-MAX_CUT_ATTEMPTS:]):
+        candidates.append(_close(out[:length], cut_stack))
+    return candidates
+
+
+def repair_json(text):
+    # 返回 (value, repaired)；修复后仍无法解析时抛出 ValueError
+    content = strip_fences(text)
+    try:
+        return json.loads(content), False
+    except ValueError:
+        pass
+    for candidate in _rewrite(content):
+        try:
+            return json.loads(candidate), True
+        except ValueError:
+            continue
+    raise ValueError("LLM output could not be repaired into JSON")
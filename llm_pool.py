@@ -0,0 +1,289 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import metrics
+from resilience import CircuitBreaker, CircuitOpenError
+
+# --- 多端点对冲请求 ---
+# 单一大模型端点的长尾延迟就是整个应用的长尾延迟。这里把若干 OpenAI 兼容端点（地址 + Key + 模型）组成一个池：
+# 先按配置顺序向首选端点发起请求；若在该端点近期延迟的 p90（首 token 未到按首 token 延迟，已开始输出按总耗时）
+# 之内仍未完成，再向下一个端点发一份备份请求；谁先给出能通过校验的完整行程谁胜出，其余请求立即取消。
+# 某一路报错时不等对冲延迟，直接切换到下一个端点。
+# 每个端点的首 token 与总耗时样本按“请求类型（单次流式 / 骨架扇出）+ 行程天数档位”分开记录在滑动窗口里，
+# 总耗时随天数增长，混在一起时短行程对冲太晚、长行程又会多发整份的重复请求；某一档样本不足时使用默认延迟。
+#
+# 取消：每一路都带一个 threading.Event，生成函数在每个流式分片之间检查它，置位后关闭连接并停止产出；
+# 仍阻塞在建立连接或等待首个分片上的请求无法从外部打断，它所在的后台线程会在下一个分片或客户端超时后退出，
+# 但不会再拖住胜出的那一路。
+# 渐进预览跟随最先产出内容的那一路；若最终由另一路胜出，结果页以胜出者的完整行程为准。
+# 每个端点各有一个熔断器：连续失败后在冷却期内直接跳过该端点；传入 deadline 时，超过整体截止时间即取消全部请求并报超时。
+
+DEFAULT_HEDGE_DELAYS = {"ttft": 6.0, "total": 90.0}   # 样本不足时的对冲延迟（秒）
+LATENCY_WINDOW = 200                                  # 每个端点保留的最近样本数
+MIN_SAMPLES = 20                                      # 少于该样本数时分位数不可靠，使用默认延迟
+TRIP_SIZE_BUCKETS = (3, 7, 14)                        # 行程天数档位上界，超过最后一档归为一档
+DEFAULT_PROFILE = "default"                           # 调用方未给出请求类型时的样本档位
+
+
+def request_profile(mode, days):
+    # mode: "stream" / "fanout"；days 为 planner.estimate_trip_days 的结果，0 表示未识别
+    if not days:
+        return f"{mode}:unknown"
+    upper = next((b for b in TRIP_SIZE_BUCKETS if days <= b), None)
+    return f"{mode}:le{upper}d" if upper else f"{mode}:gt{TRIP_SIZE_BUCKETS[-1]}d"
+
+
+class LatencyTracker:
+    # 分位数只由完整完成的样本计算；被取消的请求只知道“至少耗时这么久”（删失样本），单独保存、不进窗口——
+    # 对冲本身会提前取消慢的一路，把这些下界混进窗口会拉低 p90，让之后的对冲越发越早
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._censored = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def observe_censored(self, seconds):
+        with self._lock:
+            self._censored.append(seconds)
+
+    @property
+    def censored(self):
+        return len(self._censored)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMProvider:
+    def __init__(self, name, client, model_name, breaker):
+        self.name = name
+        self.client = client
+        self.model_name = model_name
+        self.breaker = breaker
+        self.latency = {}               # (profile, "ttft"/"total") -> LatencyTracker
+        self.attempts = 0
+        self.wins = 0
+        self.failures = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def tracker(self, profile, kind):
+        with self._lock:
+            tracker = self.latency.get((profile, kind))
+            if tracker is None:
+                tracker = self.latency[(profile, kind)] = LatencyTracker()
+            return tracker
+
+
+class _Attempt:
+    def __init__(self, provider, role, profile):
+        self.provider = provider
+        self.role = role                # "primary" / "backup"
+        self.profile = profile
+        self.cancel = threading.Event()
+        self.started = time.perf_counter()
+        self.first_event_at = None
+        self.finished = False
+
+
+class ProviderPool:
+    def __init__(self, providers, client_factory, hedge_quantile=0.9, default_delays=None,
+                 min_delay=0.5, max_delay=120.0, max_attempts=2, failure_threshold=5, cooldown_seconds=30.0):
+        # providers: [{"name", "base_url", "api_key", "model"}, ...]，顺序即优先级
+        # client_factory(provider_config) -> OpenAI 兼容客户端，每个端点只创建一次并复用其连接池
+        if not providers:
+            raise ValueError("at least one LLM provider is required")
+        self.providers = [
+            LLMProvider(config.get("name") or config["model"], client_factory(config), config["model"],
+                        CircuitBreaker(f"llm:{config.get('name') or config['model']}", failure_threshold, cooldown_seconds))
+            for config in providers
+        ]
+        self.hedge_quantile = hedge_quantile
+        self.default_delays = dict(DEFAULT_HEDGE_DELAYS, **(default_delays or {}))
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_attempts = max(1, min(max_attempts, len(self.providers)))
+        self.hedged = 0
+        self._lock = threading.Lock()   # 多个会话并发调用 run()，计数器统一加锁
+
+    def _count(self, target, field):
+        with self._lock:
+            setattr(target, field, getattr(target, field) + 1)
+
+    @property
+    def primary(self):
+        return self.providers[0]
+
+    def hedge_delay(self, provider, kind, profile=DEFAULT_PROFILE):
+        tracker = provider.tracker(profile, kind)
+        if len(tracker) < MIN_SAMPLES:
+            return self.default_delays[kind]
+        return min(self.max_delay, max(self.min_delay, tracker.quantile(self.hedge_quantile)))
+
+    def _deadline(self, attempt):
+        # 首 token 未到时按首 token 延迟对冲，已开始输出后按总耗时对冲
+        kind = "ttft" if attempt.first_event_at is None else "total"
+        return attempt.started + self.hedge_delay(attempt.provider, kind, attempt.profile)
+
+    def _drive(self, attempt, make_events, results):
+        provider = attempt.provider
+        try:
+            for event in make_events(provider.client, provider.model_name, attempt.cancel):
+                if attempt.cancel.is_set():
+                    return
+                results.put((attempt, event))
+            if not attempt.cancel.is_set():
+                results.put((attempt, ("error", None, RuntimeError("generation ended without a result"))))
+        except Exception as e:
+            results.put((attempt, ("error", None, e)))
+
+    def _observe(self, attempt, kind, seconds):
+        attempt.provider.tracker(attempt.profile, kind).observe(seconds)
+        metrics.LLM_PROVIDER_SECONDS.observe(seconds, provider=attempt.provider.name, kind=kind, profile=attempt.profile)
+
+    def _launch(self, provider, role, profile, make_events, results):
+        attempt = _Attempt(provider, role, profile)
+        self._count(provider, "attempts")
+        threading.Thread(target=self._drive, args=(attempt, make_events, results),
+                         name=f"llm-{provider.name}", daemon=True).start()
+        return attempt
+
+    def run(self, make_events, validate=None, deadline=None, profile=DEFAULT_PROFILE):
+        # make_events(client, model_name, cancel) 返回与 planner.stream_itinerary 相同的事件生成器；
+        # validate(data) 为假或抛异常时，该路的 done 结果按失败处理。产出胜出者的事件序列。
+        # deadline（resilience.Deadline）到期仍无结果时抛 TimeoutError；所有端点都处于熔断时立即抛 CircuitOpenError；
+        # profile（见 request_profile）决定延迟样本记在哪一档、对冲延迟按哪一档计算
+        results = queue.Queue()
+        remaining = iter(self.providers)
+        attempts = []
+        pending = set()
+        leader = None
+        last_error = None
+        exhausted = False
+
+        def launch(role):
+            nonlocal exhausted
+            if len(attempts) >= self.max_attempts:
+                return None
+            # 跳过熔断中的端点
+            provider = next((p for p in remaining if p.breaker.allow()), None)
+            if provider is None:
+                exhausted = True
+                return None
+            attempt = self._launch(provider, role, profile, make_events, results)
+            attempts.append(attempt)
+            pending.add(attempt)
+            return attempt
+
+        if launch("primary") is None:
+            raise CircuitOpenError("大模型服务暂时不可用，请稍后再试")
+        try:
+            while pending:
+                can_hedge = not exhausted and len(attempts) < self.max_attempts
+                timeout = None
+                if can_hedge:
+                    timeout = max(0.0, self._deadline(attempts[-1]) - time.perf_counter())
+                if deadline is not None:
+                    timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+                try:
+                    attempt, (kind, key, value) = results.get(timeout=timeout)
+                except queue.Empty:
+                    if deadline is not None and deadline.expired:
+                        metrics.DEADLINE_EXCEEDED.inc(stage="llm")
+                        raise TimeoutError(f"行程生成超时（超过 {deadline.seconds:g} 秒），请稍后重试")
+                    self._count(self, "hedged")
+                    metrics.LLM_HEDGE.inc(event="hedged")
+                    launch("backup")
+                    continue
+                if attempt.finished:
+                    continue
+                provider = attempt.provider
+                elapsed = time.perf_counter() - attempt.started
+
+                if kind == "done" and validate is not None:
+                    try:
+                        if not validate(value):
+                            raise ValueError("itinerary failed validation")
+                    except Exception as e:
+                        kind, value = "error", e
+                if kind == "error":
+                    attempt.finished = True
+                    pending.discard(attempt)
+                    self._count(provider, "failures")
+                    provider.breaker.record_failure()
+                    last_error = value
+                    metrics.LLM_HEDGE.inc(event="failed")
+                    # 这一路失败了：不等对冲延迟，立即切换到下一个端点
+                    if not pending and launch("backup") is not None:
+                        metrics.LLM_HEDGE.inc(event="failover")
+                    continue
+
+                if attempt.first_event_at is None:
+                    attempt.first_event_at = time.perf_counter()
+                    self._observe(attempt, "ttft", elapsed)
+                if kind == "done":
+                    attempt.finished = True
+                    self._count(provider, "wins")
+                    provider.breaker.record_success()
+                    self._observe(attempt, "total", elapsed)
+                    metrics.LLM_HEDGE.inc(event=f"{attempt.role}_won")
+                    yield kind, key, value
+                    return
+                # 预览只跟随一路：领先的一路中途失败后不再切换，避免另一路的天数叠加到已展示的预览上
+                if leader is None:
+                    leader = attempt
+                if attempt is leader:
+                    yield kind, key, value
+            raise last_error or RuntimeError("no LLM provider produced an itinerary")
+        finally:
+            # 取消所有未胜出的请求；被取消的一路只知道至少耗时这么久，记为删失样本，不参与对冲延迟的分位数
+            now = time.perf_counter()
+            for attempt in attempts:
+                if not attempt.finished:
+                    attempt.finished = True
+                    attempt.cancel.set()
+                    self._count(attempt.provider, "cancelled")
+                    if attempt.first_event_at is None:
+                        attempt.provider.tracker(attempt.profile, "ttft").observe_censored(now - attempt.started)
+                    attempt.provider.tracker(attempt.profile, "total").observe_censored(now - attempt.started)
+                    metrics.LLM_HEDGE.inc(event="cancelled")
+
+    def stats(self):
+        return {
+            "hedged": self.hedged,
+            "providers": [
+                {
+                    "name": p.name,
+                    "model": p.model_name,
+                    "attempts": p.attempts,
+                    "wins": p.wins,
+                    "failures": p.failures,
+                    "cancelled": p.cancelled,
+                    "breaker": p.breaker.state,
+                    "profiles": {
+                        profile: {
+                            "samples": len(p.tracker(profile, "total")),
+                            "censored": p.tracker(profile, "total").censored,
+                            "ttft_p90_s": p.tracker(profile, "ttft").quantile(0.9),
+                            "total_p90_s": p.tracker(profile, "total").quantile(0.9),
+                            "hedge_delay_ttft_s": self.hedge_delay(p, "ttft", profile),
+                            "hedge_delay_total_s": self.hedge_delay(p, "total", profile),
+                        }
+                        for profile in sorted({profile for profile, _ in list(p.latency)})
+                    },
+                }
+                for p in self.providers
+            ],
+        }
@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 分阶段耗时与体积指标 ---
+# 进程内的轻量指标注册表（无第三方依赖）：按阶段记录直方图，
+# 可通过本地 HTTP 端点以 Prometheus 文本格式导出，也可逐条追加为 JSONL 事件，便于设定 SLO 与发现回归。
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+PAGE_BYTE_BUCKETS = (250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000, 20_000_000, 40_000_000)
+BYTE_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000)
+
+_events_lock = threading.Lock()
+_events_file = None
+
+
+def configure_events(path):
+    # 设置后每次观测都会追加一行 JSON 事件；传 None 关闭
+    global _events_file
+    with _events_lock:
+        if _events_file is not None:
+            _events_file.close()
+        _events_file = open(path, "a", encoding="utf-8") if path else None
+
+
+def _emit_event(metric, labels, value):
+    if _events_file is None:
+        return
+    line = json.dumps({"ts": time.time(), "metric": metric, "labels": labels, "value": value}, ensure_ascii=False)
+    with _events_lock:
+        if _events_file is not None:
+            _events_file.write(line + "\n")
+            _events_file.flush()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [bucket_counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+        _emit_event(self.name, dict(key), value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(float(bound))),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+        _emit_event(self.name, dict(key), value)
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+            value = self._values[key]
+        _emit_event(self.name, dict(key), value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Gauge):
+    # 只增不减的计数，导出类型为 counter
+    kind = "counter"
+
+    def set(self, value, **labels):
+        raise TypeError("counters can only be incremented")
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+STAGE_SECONDS = _register(Histogram(
+    "travel_agenda_stage_seconds",
+    "Per-stage latency of itinerary generation and rendering",
+    LATENCY_BUCKETS, ("stage",)))
+LLM_TOKENS = _register(Histogram(
+    "travel_agenda_llm_tokens",
+    "Prompt/completion token counts reported by the LLM usage field",
+    TOKEN_BUCKETS, ("kind",)))
+HTML_BYTES = _register(Histogram(
+    "travel_agenda_html_bytes",
+    "Size of the rendered itinerary HTML in bytes",
+    BYTE_BUCKETS))
+LLM_RECOVERY = _register(Counter(
+    "travel_agenda_llm_recovery_total",
+    "LLM outputs parsed cleanly, repaired, or with days re-requested individually",
+    ("event",)))
+TILE_REQUESTS = _register(Counter(
+    "travel_agenda_tile_requests_total",
+    "Map tile proxy requests by outcome (hit, miss, coalesced, error)",
+    ("result",)))
+GEO_CORRECTIONS = _register(Counter(
+    "travel_agenda_geo_corrections_total",
+    "Activity coordinates filled or snapped from the local gazetteer, and flagged jumps",
+    ("result",)))
+IMAGE_REQUESTS = _register(Counter(
+    "travel_agenda_image_requests_total",
+    "Image proxy requests by outcome (hit, miss, coalesced, passthrough, error)",
+    ("result",)))
+PAGE_WEIGHT_BYTES = _register(Histogram(
+    "travel_agenda_page_weight_bytes",
+    "Per-trip page weight: proxied images, original images, and html plus proxied images",
+    PAGE_BYTE_BUCKETS, ("part",)))
+LLM_PROVIDER_SECONDS = _register(Histogram(
+    "travel_agenda_llm_provider_seconds",
+    "Per-provider LLM latency (time to first event, and total until a valid itinerary) by request profile",
+    LATENCY_BUCKETS, ("provider", "kind", "profile")))
+LLM_HEDGE = _register(Counter(
+    "travel_agenda_llm_hedge_total",
+    "Hedged LLM requests by event (hedged, failover, failed, cancelled, primary_won, backup_won)",
+    ("event",)))
+UPSTREAM_BREAKER_STATE = _register(Gauge(
+    "travel_agenda_upstream_breaker_state",
+    "Circuit breaker state per upstream (0 closed, 1 open, 2 half-open)",
+    ("upstream",)))
+UPSTREAM_CALLS = _register(Counter(
+    "travel_agenda_upstream_calls_total",
+    "Outbound calls per upstream by outcome (success, failure, rejected by an open breaker)",
+    ("upstream", "result")))
+DEADLINE_EXCEEDED = _register(Counter(
+    "travel_agenda_deadline_exceeded_total",
+    "Request stages cut short by their share of the request deadline",
+    ("stage",)))
+
+POI_LOOKUPS = _register(Counter(
+    "travel_agenda_poi_lookups_total",
+    "Nominatim tile lookups by outcome (queried, failed, dropped_abandoned, dropped_queue_full)",
+    ("result",)))
+RETRIEVAL_EVENTS = _register(Counter(
+    "travel_agenda_retrieval_events_total",
+    "Retrieval sub-requests by event (search_ok, search_failed, page_ok, page_failed, late)",
+    ("event",)))
+RETRIEVAL_PASSAGES = _register(Counter(
+    "travel_agenda_retrieval_passages_total",
+    "Retrieved snippets and page passages by outcome (kept, duplicate, over_budget)",
+    ("result",)))
+
+
+def render_prometheus():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def start_http_server(port, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
@@ -0,0 +1,372 @@
+import argparse
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+from itinerary_model import as_itinerary
+from renderer import FONT_CSS_URL, VENDOR_ASSETS, fallback_cover_url, fallback_photo_url, generate_html_template
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装 Pillow 时图片按原尺寸打包
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# --- 离线行程包导出 ---
+# 默认页面在浏览时才去 CDN 拉字体、Leaflet 与插件，并逐张加载图片；移动网络下首屏慢，断网时连“保存为 PDF”都不完整。
+# 这里在服务端一次性备齐所有资源：前端库取本地 vendor/ 副本（缺失时下载一次并落盘），CSS 压缩并内联其引用的图标，
+# 字体按页面实际用到的字符向 Google Fonts 请求子集，配图由服务端取回、缩放后内联或以内容哈希命名的文件存放。
+# 除地图底图瓦片外，导出的页面打开即用、完全离线。
+
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vendor")
+IMAGE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "bundle_images")
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024   # 缩放后配图缓存的总字节上限，超出按 LRU 淘汰（同 image_proxy）
+BROWSER_USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                      "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")  # Google Fonts 据此返回 woff2
+FONT_SUBSET_CHUNK = 400    # 每次字体子集请求携带的字符数，避免 URL 过长
+COVER_MAX_WIDTH = 1200
+PHOTO_MAX_WIDTH = 640
+JPEG_QUALITY = 78
+# 图片加载失败时的占位图，保证页面不会再回头在线查询
+PLACEHOLDER_IMAGE = "data:image/svg+xml;base64," + base64.b64encode(
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="4" height="3"><rect width="4" height="3" fill="#e8e0d4"/></svg>').decode("ascii")
+# 前端库既没有本地副本又下载不到时，退回 CDN 引用并在页面顶部提示（地图需联网才能显示）
+VENDOR_MISSING_NOTE = "⚠️ 部分地图组件未能打包进离线版，地图需联网才能显示；行程文字与图片不受影响。"
+BUNDLE_FAILED_NOTE = "⚠️ 离线版打包失败，这是在线版页面：地图与图片需联网才能显示。"
+# 加载耗时估算所用的网络画像：(下行带宽 bit/s, 往返时延 s)，与 Lighthouse 的移动端节流参数一致
+NETWORK_PROFILES = {"slow_4g": (1.6e6, 0.15), "fast_4g": (9e6, 0.04)}
+
+
+def _fetch(url, timeout, headers=None):
+    req = urllib.request.Request(url, headers={"User-Agent": BROWSER_USER_AGENT, **(headers or {})})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return resp.read(), resp.headers.get_content_type()
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_html(html):
+    # 只去掉每行的前导缩进与空行：页面内没有 <pre> 与多行模板字符串，不影响渲染与脚本
+    return "\n".join(line.strip() for line in html.splitlines() if line.strip())
+
+
+def _data_uri(body, mime):
+    return f"data:{mime};base64,{base64.b64encode(body).decode('ascii')}"
+
+
+def _sniff_mime(body):
+    if body[:2] == b"\xff\xd8":
+        return "image/jpeg"
+    if body[:4] == b"RIFF" and body[8:12] == b"WEBP":
+        return "image/webp"
+    if body.lstrip()[:1] == b"<":
+        return "image/svg+xml"
+    return "image/png" if body[:4] == b"\x89PNG" else "image/gif"
+
+
+def _unicode_range(chars):
+    return ",".join(f"U+{ord(c):X}" for c in sorted(chars))
+
+
+class OfflineBundler:
+    def __init__(self, vendor_dir=VENDOR_DIR, image_cache_dir=IMAGE_CACHE_DIR, timeout=10,
+                 cover_max_width=COVER_MAX_WIDTH, photo_max_width=PHOTO_MAX_WIDTH, jpeg_quality=JPEG_QUALITY,
+                 image_cache_max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.vendor_dir = vendor_dir
+        self.image_cache_dir = image_cache_dir
+        self.image_cache_max_bytes = image_cache_max_bytes
+        self.timeout = timeout
+        self.cover_max_width = cover_max_width
+        self.photo_max_width = photo_max_width
+        self.jpeg_quality = jpeg_quality
+        self.image_cache_bytes = 0
+        self._image_lru = OrderedDict()   # 缓存文件名 -> 字节数
+        self._image_lock = threading.Lock()
+        self._load_image_index()
+
+    def _load_image_index(self):
+        # 启动时按文件修改时间重建 LRU，缓存跨进程重启保留
+        if not os.path.isdir(self.image_cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.image_cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.image_cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        with self._image_lock:
+            for _, name, size in sorted(entries):
+                self._image_lru[name] = size
+                self.image_cache_bytes += size
+            self._evict_images()
+
+    def _evict_images(self):
+        # 调用方需持有 self._image_lock
+        while self.image_cache_bytes > self.image_cache_max_bytes and self._image_lru:
+            name, size = self._image_lru.popitem(last=False)
+            self.image_cache_bytes -= size
+            try:
+                os.remove(os.path.join(self.image_cache_dir, name))
+            except OSError:
+                pass
+
+    # --- 前端库 ---
+    def _vendor_path(self, url):
+        name = os.path.basename(urllib.parse.urlparse(url).path)
+        return os.path.join(self.vendor_dir, hashlib.sha256(url.encode("utf-8")).hexdigest()[:12] + "-" + name)
+
+    def vendor_asset(self, url):
+        # 优先读本地副本；缺失时下载一次写入 vendor/，之后的导出不再联网
+        path = self._vendor_path(url)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        body, _ = _fetch(url, self.timeout)
+        os.makedirs(self.vendor_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+        return body
+
+    def fetch_vendor(self):
+        # 预先下载全部前端库及其 CSS 引用的图标
+        for kind, url in VENDOR_ASSETS:
+            body = self.vendor_asset(url)
+            if kind == "css":
+                self._inline_css_urls(body.decode("utf-8"), url)
+
+    def _inline_css_urls(self, css, base_url):
+        # 把 CSS 中相对引用的图标（如 layers.png、fullscreen.png）替换为 data URI
+        def replace(match):
+            ref = match.group(1).strip("'\" ")
+            if ref.startswith(("data:", "#")):
+                return match.group(0)
+            target = urllib.parse.urljoin(base_url, ref)
+            mime = "image/svg+xml" if target.endswith(".svg") else "image/png"
+            return f"url({_data_uri(self.vendor_asset(target), mime)})"
+        return re.sub(r"url\(([^)]+)\)", replace, css)
+
+    def vendor_head(self):
+        # 返回 (head_html, 未能内联的资源地址列表)；取不到的资源退回 CDN 引用，不让整个导出失败
+        tags, missing = [], []
+        for kind, url in VENDOR_ASSETS:
+            try:
+                body = self.vendor_asset(url).decode("utf-8")
+                if kind == "css":
+                    body = minify_css(self._inline_css_urls(body, url))
+            except Exception as e:
+                logger.warning("offline bundle: vendor asset %s unavailable, falling back to CDN: %s", url, e)
+                missing.append(url)
+                tags.append(f'<link rel="stylesheet" href="{url}" />' if kind == "css" else f'<script src="{url}"></script>')
+                continue
+            if kind == "css":
+                tags.append(f"<style>{body}</style>")
+            else:
+                # 发行版本身已是压缩后的代码；防止 </script> 字样提前闭合标签
+                body = body.replace("</script", "<\\/script")
+                tags.append(f"<script>{body}</script>")
+        return "\n".join(tags), missing
+
+    # --- 字体子集 ---
+    def font_css(self, text):
+        # 按页面实际出现的字符分批请求子集，每批用 unicode-range 限定，浏览器按字符选用对应的字体文件
+        chars = sorted({c for c in text if not c.isspace()} | {chr(c) for c in range(0x21, 0x7F)})
+        rules = []
+        for start in range(0, len(chars), FONT_SUBSET_CHUNK):
+            chunk = chars[start:start + FONT_SUBSET_CHUNK]
+            url = FONT_CSS_URL + "&text=" + urllib.parse.quote("".join(chunk))
+            css = _fetch(url, self.timeout)[0].decode("utf-8")
+            for rule in re.findall(r"@font-face\s*{[^}]*}", css):
+                font_url = re.search(r"url\(([^)]+)\)", rule)
+                if not font_url:
+                    continue
+                body, _ = _fetch(font_url.group(1), self.timeout)
+                rule = rule.replace(font_url.group(0), f"url({_data_uri(body, 'font/woff2')})")
+                rules.append(rule[:-1].rstrip().rstrip(";") + f";unicode-range:{_unicode_range(chunk)};}}")
+        return minify_css("\n".join(rules))
+
+    # --- 配图 ---
+    def image(self, url, max_width):
+        # 返回 (bytes, mime)；按 地址 + 目标宽度 缓存在磁盘上，重复导出不再下载；总字节数有上限，按 LRU 淘汰
+        key = hashlib.sha256(f"{url}|{max_width}".encode("utf-8")).hexdigest()
+        path = os.path.join(self.image_cache_dir, key)
+        with self._image_lock:
+            cached = key in self._image_lru
+            if cached:
+                self._image_lru.move_to_end(key)
+        if cached:
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+                return body, _sniff_mime(body)
+            except OSError:
+                # 文件被外部删除：从索引中去掉，重新下载
+                with self._image_lock:
+                    size = self._image_lru.pop(key, None)
+                    if size is not None:
+                        self.image_cache_bytes -= size
+        body, mime = _fetch(url, self.timeout)
+        if Image is not None and mime != "image/svg+xml":
+            img = Image.open(io.BytesIO(body))
+            if img.width > max_width:
+                img.thumbnail((max_width, max_width * 4))
+            out = io.BytesIO()
+            if img.mode in ("RGBA", "LA", "P") and mime == "image/png":
+                img.save(out, "PNG", optimize=True)
+                mime = "image/png"
+            else:
+                img.convert("RGB").save(out, "JPEG", quality=self.jpeg_quality, optimize=True, progressive=True)
+                mime = "image/jpeg"
+            body = out.getvalue()
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.image_cache_dir, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+        except OSError:
+            # 磁盘写入失败：图片照常打包，只是不进缓存
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        else:
+            with self._image_lock:
+                self.image_cache_bytes += len(body) - self._image_lru.pop(key, 0)
+                self._image_lru[key] = len(body)
+                self._evict_images()
+        return body, mime
+
+    def build(self, data, image_urls=None, pois=None, map_mode="day", inline_images=True):
+        # 返回 {"html": 页面, "files": {相对路径: 内容}, "report": 体积与耗时}；
+        # inline_images=False 时图片以内容哈希命名存入 files，与页面放在同一目录即可离线打开
+        start = time.perf_counter()
+        image_urls = image_urls or {}
+        photos = image_urls.get("photos", {})
+        data = as_itinerary(data)
+        wanted = {None: (image_urls.get("cover") or fallback_cover_url(data.cover_search), self.cover_max_width)}
+        for _, _, act in data.activities():
+            keyword = act.img_keyword
+            wanted.setdefault(keyword, (photos.get(keyword) or fallback_photo_url(keyword), self.photo_max_width))
+
+        files = {}
+        resolved = {}
+        image_bytes = 0
+        failures = 0
+        for name, (url, max_width) in wanted.items():
+            try:
+                body, mime = self.image(url, max_width)
+            except Exception:
+                resolved[name] = PLACEHOLDER_IMAGE
+                failures += 1
+                continue
+            image_bytes += len(body)
+            if inline_images:
+                resolved[name] = _data_uri(body, mime)
+            else:
+                extension = {"image/jpeg": "jpg", "image/webp": "webp", "image/svg+xml": "svg"}.get(mime, mime.split("/")[-1])
+                filename = f"img/{hashlib.sha256(body).hexdigest()[:16]}.{extension}"
+                files[filename] = body
+                resolved[name] = filename
+        bundle_images = {"cover": resolved.pop(None), "photos": resolved}
+
+        # 先渲染一次拿到页面全部文字，用于字体子集；pois 为 None 时传空，避免页面回头在线查询 Nominatim
+        head, vendor_missing = self.vendor_head()
+        draft = generate_html_template(data, bundle_images, map_mode=map_mode, pois=pois if pois is not None else {},
+                                       head_html=head, fallback_image=PLACEHOLDER_IMAGE)
+        if vendor_missing:
+            draft = mark_online_only(draft)
+        visible_text = re.sub(r"<[^>]+>|data:[^\"')\s]+", "", draft)
+        try:
+            fonts = f"<style>{self.font_css(visible_text)}</style>"
+        except Exception:
+            fonts = ""  # 字体取不到时退回系统字体，页面其余部分不受影响
+        html = minify_html(draft.replace(head, fonts + "\n" + head, 1))
+
+        html_bytes = len(html.encode("utf-8"))
+        report = {
+            "html_bytes": html_bytes,
+            "bundle_bytes": html_bytes + sum(len(body) for body in files.values()),
+            "vendor_bytes": len(head.encode("utf-8")),
+            "font_bytes": len(fonts.encode("utf-8")),
+            "image_bytes": image_bytes,
+            "images": len(wanted),
+            "image_failures": failures,
+            "vendor_missing": vendor_missing,
+            "files": len(files) + 1,
+            "build_seconds": round(time.perf_counter() - start, 3),
+        }
+        # 估算的打开耗时：离线包只需读取本地文件；这里给出同等体积经网络传输（如首次下载）时的参考值
+        report["estimated_load_seconds"] = {
+            profile: round(rtt * report["files"] + report["bundle_bytes"] * 8 / bandwidth, 2)
+            for profile, (bandwidth, rtt) in NETWORK_PROFILES.items()
+        }
+        return {"html": html, "files": files, "report": report}
+
+
+def mark_online_only(html, note=VENDOR_MISSING_NOTE):
+    # 在页面顶部插入“需联网”提示
+    banner = ('<div style="position:fixed;top:0;left:0;right:0;z-index:100001;padding:6px 12px;'
+              f'background:#fff3cd;color:#664d03;font-size:13px;text-align:center;">{note}</div>')
+    return re.sub(r"<body[^>]*>", lambda m: m.group(0) + banner, html, count=1)
+
+
+def write_bundle(bundle, out_dir, filename="index.html"):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as f:
+        f.write(bundle["html"])
+    for rel_path, body in bundle["files"].items():
+        path = os.path.join(out_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+    return os.path.join(out_dir, filename)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导出可离线打开的行程包")
+    parser.add_argument("itinerary", nargs="?", help="行程 JSON 文件")
+    parser.add_argument("--output", default="bundle", help="输出目录")
+    parser.add_argument("--separate-images", action="store_true", help="图片以内容哈希文件存放，而非内联进页面")
+    parser.add_argument("--map-mode", choices=["day", "activity"], default="day")
+    parser.add_argument("--fetch-vendor", action="store_true", help="只下载前端库到 vendor/")
+    args = parser.parse_args(argv)
+
+    bundler = OfflineBundler()
+    if args.fetch_vendor:
+        bundler.fetch_vendor()
+        print(f"前端库已下载到 {bundler.vendor_dir}")
+        return
+    if not args.itinerary:
+        parser.error("需要指定行程 JSON 文件")
+
+    from wiki_images import WikiThumbnailResolver
+
+    with open(args.itinerary, encoding="utf-8") as f:
+        data = json.load(f)
+    bundle = bundler.build(data, WikiThumbnailResolver().resolve_itinerary(data), map_mode=args.map_mode,
+                           inline_images=not args.separate_images)
+    path = write_bundle(bundle, args.output)
+    print(f"已导出 {path}")
+    print(json.dumps(bundle["report"], ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
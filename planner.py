@@ -0,0 +1,381 @@
+import html
+import json
+import re
+import urllib.parse
+import urllib.request
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from compact_schema import COMPACT_DAYS_KEY, COMPACT_FIELD_KEYS, decode_compact, decode_compact_day
+from itinerary_stream import ItineraryStreamParser
+from json_repair import repair_json
+
+# --- 行程生成流水线：攻略检索 + 大模型流式生成 ---
+
+DUCKDUCKGO_HTML_URL = "https://html.duckduckgo.com/html/"
+
+# 修改 SYSTEM_PROMPT 时请同步递增版本号，旧版本生成的缓存行程将自动失效
+SYSTEM_PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = """
+你的主要受众是中国游客。行程表的所有可视文本必须优先使用优美的中文，如果名字有知名的外语，请放在中文后面的括号里。
+请严格只输出 JSON 数据，不要包含 ```json 或其他 markdown 标记。
+输出结构：
+{
+  "trip_title": "主标题(优先中文大气格调，外文放括号。如：京都秘境寻幽 (Kyoto Exploration) )",
+  "trip_subtitle": "副标题(中文，诗意或生动的副标题)",
+  "overview": "行程总览，用2-3句话介绍这趟旅行的整体安排和亮点(中文)",
+  "highlights": ["亮点1", "亮点2", "亮点3", "亮点4", "亮点5"],
+  "days": [
+    {
+      "date": "Day 1",
+      "city": "城市名(中文)",
+      "activities": [
+        { "time": "10:00", "name": "景点名(优先中文，外语可放括号)", "desc": "丰富生动的介绍和游玩建议，不少于50字(中文)", "lat": 0.0, "lng": 0.0, "img_keyword": "必须使用景点全称英文+所在城市名，如 Eiffel Tower Paris" }
+      ]
+    }
+  ]
+}
+注意：
+1. 所有的对外展示标题(trip_title, trip_subtitle)与活动标题(name)优先采用中文。
+2. 保持给后端抓图用的 cover_search 和 img_keyword 为精准的英文。
+3. highlights 至少5条，每条10字以内，中文
+4. img_keyword 必须精准，景点英文全称+城市名，用于Wikipedia搜图
+5. desc 要生动俏皮，可以加网络用语，不要死板，不少于60字
+6. lat/lng 坐标必须准确
+"""
+
+# 紧凑输出格式（见 compact_schema.py）：同样的内容要求，但键名与活动字段改为位置数组，输出 token 大幅减少
+COMPACT_SYSTEM_PROMPT = """
+你的主要受众是中国游客。行程表的所有可视文本必须优先使用优美的中文，如果名字有知名的外语，请放在中文后面的括号里。
+请严格只输出紧凑 JSON 数据（不要换行缩进），不要包含 ```json 或其他 markdown 标记。
+输出结构：
+{"t":"主标题(优先中文大气格调，外文放括号)","s":"副标题(中文，诗意或生动)","o":"行程总览，2-3句话(中文)","h":["亮点1","亮点2","亮点3","亮点4","亮点5"],"c":"封面图检索用的精准英文关键词，如 Kyoto Japan","d":[["城市名(中文)",[["10:00","景点名(优先中文，外语可放括号)","介绍和游玩建议(中文)",35.0116,135.7681,"景点英文全称 城市名"]]]]}
+d 中每个元素是一天：[城市, 活动列表]，天数顺序即 Day 1、Day 2 ...；
+每个活动固定为 6 项数组：[时间, 名称, 介绍, 纬度, 经度, 英文搜图关键词]。
+注意：
+1. 所有的对外展示标题(t, s)与活动名称优先采用中文。
+2. c 与英文搜图关键词必须精准，景点英文全称+城市名，用于Wikipedia搜图
+3. h 至少5条，每条10字以内，中文
+4. 介绍要生动俏皮，可以加网络用语，不要死板，不少于60字
+5. 坐标必须准确，保留4位小数
+"""
+
+
+def scrape_results(search_terms, timeout=6, search_url=DUCKDUCKGO_HTML_URL):
+    # 在向大模型发送请求前，先去全网检索最新的优质攻略（如马蜂窝，穷游，小红书，Tripadvisor）
+    # 构造特定的站内检索词
+    search_query = f"{search_terms} 旅游 攻略 (site:mafengwo.cn OR site:qyer.com OR site:xiaohongshu.com OR site:tripadvisor.com)"
+
+    # 纯原生、无依赖安全搜索方案，兼容所有云部署环境
+    url = search_url + "?q=" + urllib.parse.quote(search_query)
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Android 14)'})
+    with metrics.STAGE_SECONDS.time(stage="ddg_fetch"):
+        html_resp = urllib.request.urlopen(req, timeout=timeout).read().decode('utf-8', errors='ignore')
+
+    # 用原生正则提取搜索结果：[(原始网页地址, 清洗后的摘要纯文本)]，按搜索排名排列
+    with metrics.STAGE_SECONDS.time(stage="snippet_extract"):
+        results = []
+        for attrs, snip in re.findall(r'<a class="result__snippet([^>]*)>(.*?)</a>', html_resp, flags=re.IGNORECASE|re.DOTALL):
+            href = re.search(r'href="([^"]*)"', attrs)
+            results.append((_result_url(href.group(1)) if href else "", html.unescape(re.sub(r'<[^>]+>', '', snip)).strip()))
+        return results
+
+
+def _result_url(href):
+    # DuckDuckGo 的结果链接是 //duckduckgo.com/l/?uddg=<原始地址> 形式的跳转，取出原始地址
+    href = html.unescape(href)
+    if href.startswith("//"):
+        href = "https:" + href
+    target = urllib.parse.parse_qs(urllib.parse.urlparse(href).query).get("uddg")
+    return target[0] if target else href
+
+
+def scrape_snippets(search_terms, timeout=6, search_url=DUCKDUCKGO_HTML_URL):
+    # 取前6条清洗后的纯净摘要文本
+    return [snippet for _, snippet in scrape_results(search_terms, timeout, search_url)[:6]]
+
+
+def build_search_context(snippets):
+    if not snippets:
+        return ""
+    search_context = "\\n\\n【系统附加最新网络参考资讯】\\n以下是来自全网各大旅游平台（小红书/马蜂窝/穷游/TripAdvisor）最新的攻略与旅行建议，请在排版行程以及撰写 desc 时参考这些真实、时效性强的内容，使其更有干货和借鉴意义：\\n"
+    for clean_text in snippets:
+        search_context += f"- 参考摘要：{clean_text}\\n"
+    return search_context
+
+
+def is_valid_day(day):
+    # 一天至少有一个活动，且每个活动都有名称与可解析的坐标
+    if not isinstance(day, dict) or not isinstance(day.get("activities"), list) or not day["activities"]:
+        return False
+    for act in day["activities"]:
+        if not isinstance(act, dict) or not act.get("name"):
+            return False
+        try:
+            float(act.get("lat"))
+            float(act.get("lng"))
+        except (TypeError, ValueError):
+            return False
+    return True
+
+
+def is_valid_itinerary(data):
+    # 至少有一天，且每一天都通过 is_valid_day；对冲请求据此判定哪一路先给出了可用的行程
+    days = data.get("days") if isinstance(data, dict) else None
+    return bool(days) and all(is_valid_day(day) for day in days)
+
+
+def stream_itinerary(client, model_name, prompt_text, search_context="", compact=False, max_workers=4, day_retries=2,
+                     cancel=None):
+    # 以流式方式请求大模型，边接收边解析，逐个产出 ("field"/"day", key, value) 事件，
+    # 最后产出 ("done", None, 完整行程 dict)
+    # compact=True 时要求模型输出紧凑格式，事件与最终结果在产出前已解码为详细结构
+    # 输出有瑕疵时先修复；缺失或损坏的天数按 DAY_PROMPT 单独补生成，只有什么都没解析出来才整体报错
+    # cancel（threading.Event）置位后在下一个分片处关闭连接并停止产出，供对冲请求取消落败的一路
+    user_msg = prompt_text + search_context
+    llm_start = time.perf_counter()
+    stream = client.chat.completions.create(
+        model=model_name,
+        messages=[
+            {"role": "system", "content": COMPACT_SYSTEM_PROMPT if compact else SYSTEM_PROMPT},
+            {"role": "user", "content": user_msg}
+        ],
+        temperature=0.7,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    parser = ItineraryStreamParser(days_key=COMPACT_DAYS_KEY if compact else "days")
+    first_token = True
+    for chunk in stream:
+        if cancel is not None and cancel.is_set():
+            stream.close()
+            return
+        if getattr(chunk, "usage", None):
+            # 开启 include_usage 后，最后一个分片携带整次调用的 token 用量
+            metrics.LLM_TOKENS.observe(chunk.usage.prompt_tokens, kind="prompt")
+            metrics.LLM_TOKENS.observe(chunk.usage.completion_tokens, kind="completion")
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first_token:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - llm_start, stage="llm_ttft")
+            first_token = False
+        for kind, key, value in parser.feed(delta):
+            if compact and kind == "field":
+                if key not in COMPACT_FIELD_KEYS:
+                    continue
+                key = COMPACT_FIELD_KEYS[key]
+            elif compact and kind == "day":
+                value = decode_compact_day(key, value)
+            yield (kind, key, value)
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - llm_start, stage="llm_total")
+
+    with metrics.STAGE_SECONDS.time(stage="json_parse"):
+        data = parser.result()
+        if compact:
+            data = decode_compact(data)
+    if not isinstance(data.get("days"), list) or not (data["days"] or data.get("trip_title")):
+        # 既没有字段也没有任何一天，无从修补，只能让用户重试
+        metrics.LLM_RECOVERY.inc(event="failed")
+        raise ValueError("大模型返回的内容无法解析为行程")
+
+    # 找出需要单独补生成的天：解析失败/结构不全的天、少于用户要求天数的部分，以及被截断时的最后一天
+    days = data["days"]
+    retry = {i for i, day in enumerate(days) if not is_valid_day(day)}
+    retry.update(range(len(days), estimate_trip_days(prompt_text)))
+    if not parser.finished and days:
+        retry.add(len(days) - 1)
+
+    metrics.LLM_RECOVERY.inc(event="repaired" if parser.repairs else "clean")
+    if retry and cancel is not None and cancel.is_set():
+        return
+    if retry:
+        metrics.LLM_RECOVERY.inc(len(retry), event="day_retry")
+        days.extend([None] * (max(retry) + 1 - len(days)))
+        outline = json.dumps({
+            "trip_title": data.get("trip_title", ""),
+            "days": [
+                {"date": f"Day {i + 1}", "city": day.get("city", "") if isinstance(day, dict) else ""}
+                for i, day in enumerate(days)
+            ],
+        }, ensure_ascii=False)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="repair-day") as pool:
+            futures = {
+                pool.submit(_generate_day, client, model_name, prompt_text, outline, i,
+                            days[i] if isinstance(days[i], dict) else {"date": f"Day {i + 1}"}, search_context, day_retries): i
+                for i in sorted(retry)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    days[index] = future.result()
+                except Exception:
+                    metrics.LLM_RECOVERY.inc(event="failed")
+                    raise
+                yield ("day", index, days[index])
+    yield ("done", None, data)
+
+
+# --- 长行程并行生成：先出骨架，再按天并发补全活动 ---
+# 输出 token 是串行生成的，单次调用的耗时随天数线性增长。
+# 长行程先用一次便宜的调用拿到标题、每日城市与亮点等骨架，再把每天的 activities 拆成独立请求并发生成，
+# 最后合并成与 SYSTEM_PROMPT 完全一致的结构；某一天失败只重试这一天。
+
+SKELETON_PROMPT = """
+你的主要受众是中国游客。请先为用户的旅行需求规划一份行程骨架，所有可视文本优先使用优美的中文，知名外语名称放在中文后面的括号里。
+请严格只输出 JSON 数据，不要包含 ```json 或其他 markdown 标记。
+输出结构：
+{
+  "trip_title": "主标题(优先中文大气格调，外文放括号)",
+  "trip_subtitle": "副标题(中文，诗意或生动的副标题)",
+  "overview": "行程总览，用2-3句话介绍这趟旅行的整体安排和亮点(中文)",
+  "highlights": ["亮点1", "亮点2", "亮点3", "亮点4", "亮点5"],
+  "cover_search": "封面图检索用的精准英文关键词，如 Kyoto Japan",
+  "days": [
+    { "date": "Day 1", "city": "城市名(中文)", "theme": "当天主题，10字以内" }
+  ]
+}
+注意：
+1. days 的数量必须与用户要求的天数一致，只给出每天的城市与主题，不要展开具体活动。
+2. highlights 至少5条，每条10字以内，中文
+"""
+
+DAY_PROMPT = """
+你的主要受众是中国游客。下面是一趟旅行的整体骨架，请只为其中指定的一天安排具体活动。所有可视文本优先使用优美的中文，知名外语名称放在中文后面的括号里。
+请严格只输出 JSON 数据，不要包含 ```json 或其他 markdown 标记。
+输出结构：
+{
+  "date": "Day N",
+  "city": "城市名(中文)",
+  "activities": [
+    { "time": "10:00", "name": "景点名(优先中文，外语可放括号)", "desc": "丰富生动的介绍和游玩建议，不少于50字(中文)", "lat": 0.0, "lng": 0.0, "img_keyword": "必须使用景点全称英文+所在城市名，如 Eiffel Tower Paris" }
+  ]
+}
+注意：
+1. 不要与骨架中其他天的安排重复，活动需符合当天的城市与主题。
+2. img_keyword 必须精准，景点英文全称+城市名，用于Wikipedia搜图
+3. desc 要生动俏皮，可以加网络用语，不要死板，不少于60字
+4. lat/lng 坐标必须准确
+"""
+
+_CN_DIGITS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+
+
+_CN_NUMBER = r"[一二两三四五六七八九十]{1,3}"
+_NUMBER = rf"(\d+|{_CN_NUMBER})"
+# 日期（“5月1日”、“五月一号”、“10/1”）先剔除，避免把“1日”当成天数
+_DATE_PATTERN = re.compile(rf"{_NUMBER}\s*月\s*{_NUMBER}\s*[日号]?|\d{{1,2}}/\d{{1,2}}")
+_DAYS_PATTERN = re.compile(rf"{_NUMBER}\s*(?:个?整?天|日游|days?)", re.IGNORECASE)
+_NIGHTS_PATTERN = re.compile(rf"{_NUMBER}\s*(?:晚|夜|nights?)", re.IGNORECASE)
+_WEEKS_PATTERN = re.compile(rf"{_NUMBER}\s*(?:周|个?星期|weeks?)", re.IGNORECASE)
+_BARE_DAYS_PATTERN = re.compile(rf"{_NUMBER}\s*日")
+
+
+def _parse_number(chars):
+    # 阿拉伯数字或不超过九十九的中文数字（“十”、“十二”、“二十”、“二十一”）
+    if chars.isdigit():
+        return int(chars)
+    if "十" not in chars:
+        return _CN_DIGITS[chars[0]]
+    tens, _, ones = chars.partition("十")
+    return (_CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CN_DIGITS.get(ones, 0) if ones else 0)
+
+
+def estimate_trip_days(prompt_text):
+    # 从用户输入中粗略识别天数（“14天”、“十天”、“5日游”、“4晚”、“两周”、“7 days”），识别不到返回 0。
+    # 先去掉日期，再取所有时长中最大的（“5天4晚”取 5，“周末两天，共玩十天”取 10）；
+    # 明确的时长都没有时才把剩下的“N日”当作天数
+    text = _DATE_PATTERN.sub(" ", prompt_text or "")
+    durations = [_parse_number(m.group(1)) for m in _DAYS_PATTERN.finditer(text)]
+    durations += [_parse_number(m.group(1)) + 1 for m in _NIGHTS_PATTERN.finditer(text)]
+    durations += [7 * _parse_number(m.group(1)) for m in _WEEKS_PATTERN.finditer(text)]
+    if not durations:
+        durations = [_parse_number(m.group(1)) for m in _BARE_DAYS_PATTERN.finditer(text)]
+    return max(durations, default=0)
+
+
+def _complete_json(client, model_name, system_prompt, user_msg, stage):
+    # 非流式调用并解析 JSON，同时记录耗时与 token 用量
+    with metrics.STAGE_SECONDS.time(stage=stage):
+        response = client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_msg}
+            ],
+            temperature=0.7
+        )
+    if getattr(response, "usage", None):
+        metrics.LLM_TOKENS.observe(response.usage.prompt_tokens, kind="prompt")
+        metrics.LLM_TOKENS.observe(response.usage.completion_tokens, kind="completion")
+    data, repaired = repair_json(response.choices[0].message.content)
+    if repaired:
+        metrics.LLM_RECOVERY.inc(event="repaired")
+    return data
+
+
+def _generate_day(client, model_name, prompt_text, outline, index, plan, search_context="", day_retries=2):
+    # 按 DAY_PROMPT 单独生成第 index 天，失败只重试这一天
+    user_msg = (
+        f"用户需求：{prompt_text}\n行程骨架：{outline}\n"
+        f"请只安排第 {index + 1} 天（{plan.get('date', f'Day {index + 1}')}，{plan.get('city', '')}，主题：{plan.get('theme', '')}）的活动。"
+        + search_context
+    )
+    last_error = None
+    for _ in range(day_retries + 1):
+        try:
+            day = _complete_json(client, model_name, DAY_PROMPT, user_msg, "llm_day")
+            if not is_valid_day(day):
+                raise ValueError("day response has no valid activities")
+            day["date"] = plan.get("date") or day.get("date") or f"Day {index + 1}"
+            day["city"] = plan.get("city") or day.get("city", "")
+            return day
+        except Exception as e:
+            last_error = e
+    raise RuntimeError(f"第 {index + 1} 天生成失败: {last_error}")
+
+
+def generate_itinerary_fanout(client, model_name, prompt_text, search_context="", max_workers=4, day_retries=2,
+                              cancel=None):
+    # 与 stream_itinerary 产出相同的事件序列：先是骨架字段，随后按天序产出 ("day", i, day)，最后 ("done", None, data)
+    # cancel 置位后不再发起尚未开始的单天请求，已发出的请求结束后即停止产出
+    llm_start = time.perf_counter()
+    skeleton = _complete_json(client, model_name, SKELETON_PROMPT, prompt_text + search_context, "llm_skeleton")
+    day_plans = skeleton.pop("days", [])
+    if cancel is not None and cancel.is_set():
+        return
+    for key, value in skeleton.items():
+        yield ("field", key, value)
+
+    outline = json.dumps(
+        {"trip_title": skeleton.get("trip_title", ""), "days": day_plans},
+        ensure_ascii=False
+    )
+
+    days = [None] * len(day_plans)
+    next_to_emit = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout-day") as pool:
+        futures = {
+            pool.submit(_generate_day, client, model_name, prompt_text, outline, i, day_plans[i],
+                        search_context, day_retries): i
+            for i in range(len(day_plans))
+        }
+        for future in as_completed(futures):
+            if cancel is not None and cancel.is_set():
+                for pending in futures:
+                    pending.cancel()
+                return
+            days[futures[future]] = future.result()
+            # 按天序产出：前面的天全部就绪后再依次放出，保证页面预览顺序稳定
+            while next_to_emit < len(days) and days[next_to_emit] is not None:
+                yield ("day", next_to_emit, days[next_to_emit])
+                next_to_emit += 1
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - llm_start, stage="llm_total")
+
+    data = dict(skeleton)
+    data["days"] = days
+    yield ("done", None, data)
@@ -0,0 +1,247 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+import metrics
+from itinerary_model import as_itinerary
+from resilience import CircuitOpenError
+
+# --- 服务端周边 POI 补全 ---
+# 原先页面为每个活动直接请求 Nominatim，站点一多就违反其 1 次/秒的使用政策，而且每位访客都要重复查询。
+# 这里改为行程解析完成后在服务端统一补全：所有查询排进同一个限速队列（全进程共享），
+# 结果按四舍五入后的经纬度网格缓存并带淘汰，最终 POI 直接写入页面数据。
+# 队列有界且按请求优先：最新一次请求的网格最先查询（同一请求内按天与活动顺序），
+# 每个网格记着仍在等待它的调用方（截止时间 + 可选的取消标记）；轮到它时已无人等待就直接丢弃，不占用限速名额；
+# 队列满时丢弃最旧请求中尚未开始的网格。
+
+NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
+MAX_QUEUED_TILES = 200   # 排队中（尚未开始查询）的网格上限
+POI_QUERY = "tourism OR restaurant OR museum OR temple OR park OR hotel"
+
+
+class LookupAbandoned(Exception):
+    pass
+
+
+class _Pending:
+    def __init__(self, priority):
+        self.future = Future()
+        self.priority = priority     # (-请求序号, 请求内顺序)，越小越先查询
+        self.waiters = []            # [(截止时刻 monotonic, 取消标记 threading.Event 或 None)]
+        self.started = False
+
+    def alive(self, now):
+        return any(now < expires_at and not (cancel is not None and cancel.is_set()) for expires_at, cancel in self.waiters)
+
+
+def tile_key(lat, lng, precision=2):
+    # 0.01° 网格约 1 公里见方，同一网格内的站点共享一次查询结果
+    return (round(float(lat), precision), round(float(lng), precision))
+
+
+class PoiEnricher:
+    def __init__(self, search_url=NOMINATIM_SEARCH_URL, min_interval=1.0, radius=0.015, limit=6,
+                 precision=2, timeout=5, ttl_seconds=7 * 24 * 3600, max_entries=5000, breaker=None,
+                 max_queued=MAX_QUEUED_TILES):
+        self.search_url = search_url
+        self.breaker = breaker       # resilience.CircuitBreaker；熔断期间排队的查询直接失败，页面不再等待
+        self.min_interval = min_interval
+        self.radius = radius
+        self.limit = limit
+        self.precision = precision
+        self.timeout = timeout
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_queued = max_queued
+        self.requests_made = 0
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+        self._cache = OrderedDict()  # tile -> (pois, cached_at)
+        self._inflight = {}          # tile -> _Pending，同一网格排队中只查一次
+        self._heap = []              # [(priority, tile)]，网格优先级提高后旧条目留在堆里，出队时按优先级核对后跳过
+        self._request_seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._worker = threading.Thread(target=self._run, name="poi-enrich", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        # 单一工作线程按 min_interval 节流，保证全进程对上游的请求速率不超过政策上限；
+        # 节流等待结束后才挑选网格，让等待期间新到的请求排到前面
+        last_request = 0.0
+        while True:
+            with self._ready:
+                while not self._heap:
+                    self._ready.wait()
+            wait_for = self.min_interval - (time.monotonic() - last_request)
+            if wait_for > 0:
+                time.sleep(wait_for)
+            with self._lock:
+                tile, pending = self._next_tile()
+            if pending is None:
+                continue
+            if self.breaker is not None and not self.breaker.allow():
+                # 熔断中：不占用限速名额，立即失败
+                self._finish(tile, pending, error=CircuitOpenError("nominatim circuit open"))
+                continue
+            last_request = time.monotonic()
+            try:
+                pois = self._query_tile(tile)
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                self._finish(tile, pending, error=e)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            self._finish(tile, pending, pois=pois)
+
+    def _next_tile(self):
+        # 取出优先级最高且仍有人等待的网格；无人等待的直接丢弃。调用方需持有 self._lock
+        now = time.monotonic()
+        while self._heap:
+            priority, tile = heapq.heappop(self._heap)
+            pending = self._inflight.get(tile)
+            if pending is None or pending.started or pending.priority != priority:
+                continue
+            if not pending.alive(now):
+                self._drop(tile, pending, "abandoned")
+                continue
+            pending.started = True
+            return tile, pending
+        return None, None
+
+    def _drop(self, tile, pending, reason):
+        # 调用方需持有 self._lock
+        del self._inflight[tile]
+        self.dropped += 1
+        metrics.POI_LOOKUPS.inc(result=f"dropped_{reason}")
+        pending.future.set_exception(LookupAbandoned(f"poi lookup for {tile} dropped ({reason})"))
+
+    def _finish(self, tile, pending, pois=None, error=None):
+        with self._lock:
+            self._inflight.pop(tile, None)
+            if error is None:
+                self._cache[tile] = (pois, time.time())
+                self._cache.move_to_end(tile)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        metrics.POI_LOOKUPS.inc(result="failed" if error is not None else "queried")
+        if error is not None:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(pois)
+
+    def _query_tile(self, tile):
+        lat, lng = tile
+        params = {
+            "format": "json",
+            "limit": self.limit,
+            "viewbox": f"{lng - self.radius},{lat + self.radius},{lng + self.radius},{lat - self.radius}",
+            "bounded": 1,
+            "q": POI_QUERY,
+        }
+        url = self.search_url + "?" + urllib.parse.urlencode(params)
+        req = urllib.request.Request(url, headers={"User-Agent": "TravelAgenda/1.0 (itinerary POI enrichment)"})
+        self.requests_made += 1
+        places = json.loads(urllib.request.urlopen(req, timeout=self.timeout).read().decode("utf-8"))
+        return [
+            {"name": p.get("display_name", "").split(",")[0], "lat": float(p["lat"]), "lng": float(p["lon"])}
+            for p in places if "lat" in p and "lon" in p
+        ]
+
+    def _lookup(self, tile, priority, waiter):
+        # 命中缓存返回 (pois, None)，否则返回 (None, Future)；调用方需持有 self._lock
+        entry = self._cache.get(tile)
+        if entry is not None and time.time() - entry[1] < self.ttl_seconds:
+            self._cache.move_to_end(tile)
+            self.hits += 1
+            return entry[0], None
+        self.misses += 1
+        pending = self._inflight.get(tile)
+        if pending is None:
+            self._make_room()
+            pending = _Pending(priority)
+            self._inflight[tile] = pending
+            heapq.heappush(self._heap, (priority, tile))
+        elif not pending.started and priority < pending.priority:
+            # 较新的请求也需要这个网格：提到它的优先级
+            pending.priority = priority
+            heapq.heappush(self._heap, (priority, tile))
+        pending.waiters.append(waiter)
+        self._ready.notify()
+        return None, pending.future
+
+    def _make_room(self):
+        # 队列已满：先清掉无人等待的网格，仍满则丢弃优先级最低（最旧请求）的排队网格。调用方需持有 self._lock
+        queued = [(tile, p) for tile, p in self._inflight.items() if not p.started]
+        if len(queued) < self.max_queued:
+            return
+        now = time.monotonic()
+        for tile, pending in queued:
+            if not pending.alive(now):
+                self._drop(tile, pending, "abandoned")
+        queued = [(tile, p) for tile, p in queued if tile in self._inflight]
+        if len(queued) >= self.max_queued:
+            tile, pending = max(queued, key=lambda item: item[1].priority)
+            self._drop(tile, pending, "queue_full")
+
+    def enrich_itinerary(self, data, deadline_seconds=3.0, cancel=None):
+        # 返回 {(day_idx, act_idx): [poi, ...]}；截止时间内未查到的网格返回空列表。
+        # 截止时间过后（或 cancel 置位后）仍在排队的网格不再查询
+        points = {
+            (day_idx, act_idx): (act.lat, act.lng)
+            for day_idx, act_idx, act in as_itinerary(data).activities()
+            if act.has_coords
+        }
+
+        resolved, pending = {}, {}
+        waiter = (time.monotonic() + deadline_seconds, cancel)
+        request_seq = next(self._request_seq)
+        with self._lock:
+            # 按天与活动顺序排队，页面靠前的卡片先拿到 POI
+            for order, tile in enumerate(dict.fromkeys(tile_key(lat, lng, self.precision) for lat, lng in points.values())):
+                pois, future = self._lookup(tile, (-request_seq, order), waiter)
+                if future is None:
+                    resolved[tile] = pois
+                else:
+                    pending[tile] = future
+        if pending and self.breaker is not None and self.breaker.is_open:
+            # 上游熔断中：未命中缓存的网格直接返回空列表，不等待
+            pending = {}
+        if pending:
+            _, not_done = wait(list(pending.values()), timeout=deadline_seconds)
+            if not_done:
+                metrics.DEADLINE_EXCEEDED.inc(stage="pois")
+            for tile, future in pending.items():
+                try:
+                    resolved[tile] = future.result(timeout=0)
+                except Exception:
+                    resolved[tile] = []
+
+        result = {}
+        for key, (lat, lng) in points.items():
+            pois = resolved.get(tile_key(lat, lng, self.precision), [])
+            # 排除与景点自身几乎重合的结果
+            result[key] = [p for p in pois if abs(p["lat"] - lat) > 0.0005 or abs(p["lng"] - lng) > 0.0005]
+        return result
+
+    def stats(self):
+        with self._lock:
+            size = len(self._cache)
+            inflight = len(self._inflight)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "requests": self.requests_made,
+            "entries": size,
+            "queued": inflight,
+            "dropped": self.dropped,
+        }
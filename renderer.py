@@ -0,0 +1,892 @@
+import json
+import urllib.parse
+
+from itinerary_model import as_itinerary
+
+# --- 页面依赖的外部字体与前端库 ---
+# 默认从 CDN 加载；离线导出（offline_bundle.py）会按同一清单取回本地副本并内联进页面
+FONT_CSS_URL = "https://fonts.googleapis.com/css2?family=Italiana&family=Cinzel:wght@700&family=Noto+Serif+SC:wght@500;700&family=Inter:wght@400;500;600&display=swap"
+VENDOR_ASSETS = [
+    ("css", "https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"),
+    ("js", "https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"),
+    # Leaflet Fullscreen Plugin
+    ("js", "https://api.mapbox.com/mapbox.js/plugins/leaflet-fullscreen/v1.0.1/Leaflet.fullscreen.min.js"),
+    ("css", "https://api.mapbox.com/mapbox.js/plugins/leaflet-fullscreen/v1.0.1/leaflet.fullscreen.css"),
+    # Leaflet MarkerCluster：全程总览图的标记聚合
+    ("css", "https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.css"),
+    ("css", "https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.Default.css"),
+    ("js", "https://unpkg.com/leaflet.markercluster@1.5.3/dist/leaflet.markercluster.js"),
+]
+
+
+def cdn_head_html():
+    tags = [f'<link href="{FONT_CSS_URL}" rel="stylesheet">']
+    for kind, url in VENDOR_ASSETS:
+        tags.append(f'<link rel="stylesheet" href="{url}" />' if kind == "css" else f'<script src="{url}"></script>')
+    return "\n        ".join(tags)
+
+
+# Bing 缩略图：维基未找到配图时的备用图源
+def fallback_cover_url(cover_search):
+    return f"https://tse1.mm.bing.net/th?q={cover_search.replace(' ', '+')}+travel+scenery&w=1080&h=1600&c=7&rs=1&p=0"
+
+
+def fallback_photo_url(wiki_query):
+    return f"https://tse1.mm.bing.net/th?q={wiki_query}+travel&w=600&h=400&c=7&rs=1&p=0"
+
+
+# 懒加载模式下，地图离开视口上下各这么远（相对视口高度）后销毁，释放瓦片与 DOM
+LAZY_TEARDOWN_MARGIN = "300% 0px"
+
+
+# --- 配图尺寸：与下方模板 CSS 保持一致，图片代理（image_proxy.py）按此裁剪缩放 ---
+# 卡片配图 .photo-wrapper 桌面端约 528×220，手机端约 330×180：按较窄的手机端比例 11:6 裁剪，桌面端再由 object-fit 裁去上下
+# 封面 .header-poster 铺满整屏宽度、高度随视口变化，只限宽不裁剪
+IMAGE_PROFILES = {
+    "card": {"widths": (360, 528, 720, 1056), "default": 528, "aspect": 11 / 6,
+             "sizes": "(max-width: 600px) calc(100vw - 44px), 528px"},
+    "cover": {"widths": (640, 1080, 1600), "default": 1080, "aspect": None, "sizes": "100vw"},
+}
+
+
+def proxied_image(proxy_url, profile, source_url):
+    # 返回 (src, srcset)：各宽度的代理地址，浏览器按 sizes 与屏幕像素密度自行挑选
+    query = urllib.parse.quote(source_url, safe="")
+    spec = IMAGE_PROFILES[profile]
+    srcset = ", ".join(f"{proxy_url}/img/{profile}/{w}?u={query} {w}w" for w in spec["widths"])
+    return f"{proxy_url}/img/{profile}/{spec['default']}?u={query}", srcset
+
+
+# --- 核心逻辑：HTML 生成器 ---
+def generate_html_template(json_data, image_urls=None, map_mode="day", pois=None, head_html=None, tile_proxy_url=None,
+                           image_proxy_url=None, lazy_root_margin=None, fallback_image=None):
+    # map_mode: "day" 每天一张地图（编号标记 + 路线）外加全程聚合总览图；"activity" 为旧版每个活动一张小地图
+    # head_html: 替换默认的 CDN 字体与前端库引用（离线导出时传入内联后的版本）
+    # tile_proxy_url: 地图瓦片缓存代理的对外地址（见 tile_proxy.py），为 None 时直连高德 / Google
+    # image_proxy_url: 配图缩放代理的对外地址（见 image_proxy.py），仅对服务端已解析出的配图生效
+    # lazy_root_margin: 如 "600px 0px"，卡片距视口这么近时才加载照片、地图与 POI；为 None 时页面打开即全部加载
+    # fallback_image: 图片加载失败时的替代图（离线导出时传入本地占位图）；为 None 时退回 Bing 缩略图
+    # json_data 可以是 Itinerary、行程 dict 或 JSON 字符串，后两者在此做一次校验与类型归一
+    try:
+        data = as_itinerary(json_data)
+    except ValueError:
+        return "<h3>JSON 解析失败，请重试</h3>"
+
+    trip_title = data.trip_title
+    trip_subtitle = data.trip_subtitle
+    overview = data.overview
+    highlights = data.highlights
+    days_data = data.days
+
+    # 封面图：用 AI 返回的 cover_search 关键词 + 标题哈希种子，确保同一行程始终用同一张图
+    cover_search = data.cover_search.replace(" ", "+")
+    # 封面图关键词：利用 Bing Thumbnail 接口作为绝对备用抓取源，彻底弃用 Unsplash
+    cover_url = fallback_cover_url(cover_search)
+    # 若服务端已批量解析过维基配图（image_urls），则把最终地址直接写进页面，浏览器不再发起任何查询
+    cover_image_url = None
+    if image_urls is not None:
+        cover_image_url = image_urls.get("cover") or cover_url
+    cover_fallback = fallback_image or f"https://tse1.mm.bing.net/th?q={trip_title}+travel&w=1080&h=1600&c=7&rs=1&p=0"
+    cover_srcset = None
+    if cover_image_url and image_proxy_url:
+        cover_image_url, cover_srcset = proxied_image(image_proxy_url, "cover", cover_image_url)
+
+    # 生成日期快捷跳转按钮 HTML
+    nav_buttons_html = ""
+    for i, day in enumerate(days_data):
+        date_label = day.date
+        city_label = day.city
+        nav_buttons_html += f"""<a onclick="document.getElementById('day-{i}').scrollIntoView({{behavior:'smooth', block:'start'}}); return false;" class="nav-pill" href="javascript:void(0)">{date_label}<span class="nav-city">{city_label}</span></a>"""
+
+    # 亮点 HTML
+    highlights_html = ""
+    if highlights:
+        highlights_html = '<div class="highlights-grid">'
+        highlight_icons = ["🏛️", "🍜", "🌸", "🎭", "🛕", "🌊", "🏔️", "🎉", "🎨", "🚂"]
+        for idx, h in enumerate(highlights):
+            icon = highlight_icons[idx % len(highlight_icons)]
+            highlights_html += f'<div class="highlight-chip"><span class="highlight-icon">{icon}</span><span contenteditable="true">{h}</span></div>'
+        highlights_html += '</div>'
+
+    # 生成 HTML
+    html = f"""
+    <!DOCTYPE html>
+    <html lang="zh-CN">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
+        {head_html or cdn_head_html()}
+        <style>
+            :root {{
+                --bg-color: #f0ebe3;
+                --card-bg: #fdfbf7;
+                --primary-dark: #2c2418;
+                --accent-color: #b8860b;
+                --accent-light: #daa520;
+                --text-muted: #7a6e5f;
+                --border-soft: rgba(74, 59, 42, 0.12);
+            }}
+            * {{ box-sizing: border-box; }}
+            body {{ margin: 0; font-family: 'Noto Serif SC', serif; background-color: var(--bg-color); color: var(--primary-dark); overflow-x: clip; }}
+            
+            /* ===== 海报区域 ===== */
+            .header-container {{ position: relative; width: 100%; height: 50vh; min-height: 350px; overflow: hidden; background: #1a1a1a; }}
+            .header-poster {{ width: 100%; height: 100%; object-fit: cover; position: absolute; z-index: 1; opacity: 0; transition: opacity 1s ease; }}
+            .header-poster.loaded {{ opacity: 1; }}
+            .poster-overlay {{ position: absolute; top: 0; left: 0; width: 100%; height: 100%; background: linear-gradient(to bottom, rgba(0,0,0,0.1) 0%, rgba(0,0,0,0) 30%, rgba(0,0,0,0.65) 80%, rgba(0,0,0,0.9) 100%); z-index: 2; }}
+            .header-title-box {{ position: absolute; bottom: 50px; width: 100%; text-align: center; color: #fff; z-index: 5; text-shadow: 0 3px 15px rgba(0,0,0,0.7); }}
+            .main-title {{ font-family: 'Italiana', serif; font-size: 48px; margin: 0; text-transform: uppercase; letter-spacing: 6px; animation: fadeUp 1.2s ease; }}
+            .sub-title {{ font-family: 'Cinzel', serif; font-size: 14px; letter-spacing: 4px; border-top: 1px solid rgba(255,255,255,0.5); display: inline-block; padding-top: 12px; margin-top: 14px; opacity: 0.9; }}
+            @keyframes fadeUp {{ from {{ opacity: 0; transform: translateY(30px); }} to {{ opacity: 1; transform: translateY(0); }} }}
+            
+            /* ===== 顶部固定导航栏 ===== */
+            .sticky-topnav {{
+                position: sticky; top: 0; z-index: 200;
+                background: rgba(240,235,227,0.96);
+                backdrop-filter: blur(8px);
+                -webkit-backdrop-filter: blur(8px);
+                border-bottom: 1px solid var(--border-soft);
+                padding: 10px 16px;
+                display: flex; gap: 8px; align-items: center; justify-content: center;
+                overflow-x: auto; white-space: nowrap;
+                -webkit-overflow-scrolling: touch;
+                scrollbar-width: none;
+            }}
+            .sticky-topnav::-webkit-scrollbar {{ display: none; }}
+            .nav-pill {{
+                display: inline-flex; flex-direction: column; align-items: center; flex-shrink: 0;
+                padding: 6px 14px; border-radius: 20px;
+                background: var(--card-bg); border: 1.5px solid var(--border-soft);
+                color: var(--primary-dark); text-decoration: none; cursor: pointer;
+                font-family: 'Cinzel', serif; font-size: 12px; font-weight: 700;
+                transition: all 0.2s ease; box-shadow: 0 1px 4px rgba(0,0,0,0.05);
+                white-space: nowrap;
+            }}
+            .nav-pill:hover, .nav-pill.active {{
+                background: var(--accent-color); color: #fff;
+                border-color: var(--accent-color); box-shadow: 0 3px 10px rgba(184,134,11,0.3);
+            }}
+            .nav-pill .nav-city {{ font-family: 'Noto Serif SC', serif; font-size: 9px; opacity: 0.7; margin-top: 2px; }}
+            .nav-pill:hover .nav-city, .nav-pill.active .nav-city {{ opacity: 1; }}
+            .nav-divider {{ width: 1px; height: 24px; background: var(--border-soft); flex-shrink: 0; margin: 0 2px; }}
+
+            .overview-label {{ font-family: 'Cinzel', serif; font-size: 11px; letter-spacing: 3px; text-transform: uppercase; color: var(--accent-color); margin-bottom: 8px; }}
+            .overview-text {{ font-size: 15px; line-height: 1.9; color: var(--text-muted); text-align: justify; margin-bottom: 20px; }}
+            
+            .highlights-grid {{ display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 10px; }}
+            .highlight-chip {{
+                display: inline-flex; align-items: center; gap: 6px;
+                background: var(--card-bg); border: 1px solid var(--border-soft);
+                padding: 8px 14px; border-radius: 20px; font-size: 13px;
+                transition: all 0.2s ease;
+            }}
+            .highlight-chip:hover {{ background: #fff8e7; border-color: var(--accent-light); }}
+            .highlight-icon {{ font-size: 16px; }}
+            
+            .section-divider {{ height: 1px; background: linear-gradient(to right, transparent, var(--border-soft), var(--accent-color), var(--border-soft), transparent); margin: 24px 0; }}
+            
+            /* ===== 弹窗模态框 ===== */
+            .modal-overlay {{
+                position: fixed; top: 0; left: 0; width: 100vw; height: 100vh;
+                background: rgba(0,0,0,0.6); backdrop-filter: blur(4px); -webkit-backdrop-filter: blur(4px);
+                z-index: 1000; display: none; align-items: center; justify-content: center;
+                opacity: 0; transition: opacity 0.3s ease;
+            }}
+            .modal-overlay.show {{ display: flex; opacity: 1; }}
+            .overview-modal {{
+                width: 90%; max-width: 600px; max-height: 80vh; overflow-y: auto;
+                background: var(--bg-color); border-radius: 20px; padding: 30px 24px;
+                box-shadow: 0 10px 40px rgba(0,0,0,0.2); position: relative;
+                transform: translateY(20px); transition: transform 0.3s ease;
+            }}
+            .modal-overlay.show .overview-modal {{ transform: translateY(0); }}
+            .close-modal-btn {{
+                position: absolute; top: 16px; right: 16px;
+                background: rgba(0,0,0,0.05); border: none; font-size: 18px; color: var(--text-muted);
+                width: 32px; height: 32px; border-radius: 50%; cursor: pointer;
+                display: flex; align-items: center; justify-content: center; transition: all 0.2s;
+            }}
+            .close-modal-btn:hover {{ background: #ff4d4f; color: #fff; }}
+
+            /* ===== 时间线 ===== */
+            .timeline-container {{ max-width: 640px; margin: 0 auto; padding: 0 16px 60px; }}
+            .day-header {{
+                position: sticky; top: 53px; z-index: 100;
+                background: linear-gradient(to bottom, var(--bg-color) 80%, rgba(240,235,227,0));
+                padding: 18px 0 12px; display: flex; justify-content: space-between; align-items: baseline;
+                margin-bottom: 20px; border-bottom: 2px solid var(--primary-dark);
+            }}
+            .day-num {{ font-family: 'Cinzel', serif; font-size: 24px; font-weight: 800; letter-spacing: 1px; }}
+            .day-city {{ font-family: 'Inter', sans-serif; font-size: 12px; font-weight: 600; letter-spacing: 2px; color: var(--accent-color); text-transform: uppercase; }}
+            
+            .timeline-item {{ position: relative; padding-left: 20px; margin-bottom: 35px; border-left: 2px dashed rgba(74, 59, 42, 0.2); margin-left: 60px; }}
+            .timeline-item::before {{ content: ''; position: absolute; left: -8px; top: 6px; width: 14px; height: 14px; background: var(--accent-light); border-radius: 50%; border: 3px solid var(--bg-color); z-index: 2; }}
+            .time-label {{ position: absolute; left: -65px; top: 3px; width: 45px; text-align: right; font-family: 'Inter', sans-serif; font-size: 13px; font-weight: 700; color: var(--primary-dark); }}
+            
+            .card {{ background: var(--card-bg); border-radius: 12px; box-shadow: 0 4px 20px rgba(0,0,0,0.06); overflow: hidden; margin-top: 8px; transition: transform 0.2s ease, box-shadow 0.2s ease; position: relative; }}
+            .card:hover {{ transform: translateY(-2px); box-shadow: 0 8px 30px rgba(0,0,0,0.1); }}
+            .location-name {{ font-size: 17px; font-weight: bold; margin-bottom: 6px; display: inline-block; padding-right: 30px; }}
+            
+            /* 删除按钮 (大卡片层级) - 轻量优雅 */
+            .delete-btn {{
+                position: absolute; top: 10px; right: 10px; z-index: 600;
+                width: 26px; height: 26px; border-radius: 50%;
+                background: rgba(0,0,0,0.04); border: none;
+                color: #999; font-size: 14px;
+                display: flex; align-items: center; justify-content: center;
+                cursor: pointer; transition: all 0.2s ease; text-decoration: none;
+            }}
+            .delete-btn:hover {{ background: #ff4d4f; color: #fff; transform: scale(1.1); }}
+            
+            /* 删除局部媒体 (地图/图片) */
+            .remove-media-btn {{
+                position: absolute; top: 8px; right: 8px; z-index: 600;
+                width: 22px; height: 22px; border-radius: 50%;
+                background: rgba(0,0,0,0.5); border: none;
+                color: #fff; font-size: 10px; font-weight: normal;
+                display: flex; align-items: center; justify-content: center;
+                cursor: pointer; transition: background 0.2s; backdrop-filter: blur(2px);
+            }}
+            .remove-media-btn:hover {{ background: #ff4d4f; }}
+            
+            /* 地图 */
+            .map-section {{ height: 160px; width: 100%; position: relative; z-index: 1; border-bottom: 2px solid var(--border-soft); }}
+            .nav-to-btn-group {{ position: absolute; bottom: 10px; right: 10px; z-index: 500; display: flex; gap: 6px; }}
+            .nav-btn {{
+                background: rgba(255,255,255,0.9); color: #333; border: 1px solid #ddd;
+                padding: 6px 12px; border-radius: 20px; font-size: 11px; font-weight: 600;
+                cursor: pointer; text-decoration: none; box-shadow: 0 2px 6px rgba(0,0,0,0.15); transition: background 0.2s;
+            }}
+            .nav-btn:hover {{ background: #fff; }}
+            .nav-btn.amap {{ color: #2577e3; border-color: #2577e3; }}
+
+            /* 每日地图 / 全程总览地图 */
+            .day-map {{ height: 260px; width: 100%; position: relative; z-index: 1; border-radius: 12px; overflow: hidden; margin-bottom: 28px; box-shadow: 0 4px 20px rgba(0,0,0,0.06); }}
+            .trip-map {{ height: 300px; width: 100%; position: relative; z-index: 1; border-radius: 12px; overflow: hidden; margin: 24px 0 10px; box-shadow: 0 4px 20px rgba(0,0,0,0.06); }}
+            .map-label {{ font-family: 'Cinzel', serif; font-size: 11px; letter-spacing: 3px; text-transform: uppercase; color: var(--accent-color); margin: 24px 0 8px; }}
+            .stop-marker div {{
+                width: 24px; height: 24px; border-radius: 50%; background: var(--accent-color); color: #fff;
+                border: 2px solid #fff; box-shadow: 0 2px 6px rgba(0,0,0,0.35);
+                font-family: 'Inter', sans-serif; font-size: 12px; font-weight: 700;
+                display: flex; align-items: center; justify-content: center;
+            }}
+            .stop-marker.active div {{ background: #e74c3c; transform: scale(1.25); }}
+            .card-nav {{ display: flex; align-items: center; gap: 6px; padding: 10px 12px; border-bottom: 1px solid var(--border-soft); }}
+            .locate-btn {{
+                margin-right: auto; background: none; border: none; cursor: pointer; padding: 4px 0;
+                font-family: 'Inter', sans-serif; font-size: 12px; font-weight: 600; color: var(--accent-color);
+            }}
+            .card.highlight {{ box-shadow: 0 0 0 2px var(--accent-light), 0 8px 30px rgba(0,0,0,0.1); }}
+            
+            /* 景点照片（留足间距） */
+            .photo-wrapper {{ height: 220px; width: 100%; position: relative; background: linear-gradient(135deg, #e8e0d4, #d4cbbe); overflow: hidden; margin-top: 32px; border-radius: 8px 8px 0 0; border-top: 2px solid var(--border-soft); }}
+            .photo-wrapper img {{ width: 100%; height: 100%; object-fit: cover; opacity: 0; transition: opacity 0.6s ease; }}
+            .photo-wrapper img.loaded {{ opacity: 1; }}
+            .photo-placeholder {{ position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-size: 14px; color: var(--text-muted); }}
+            
+            /* 备注设计 */
+            .remark-box {{ padding: 16px; background: #fff; border-top: 1px solid var(--border-soft); }}
+            .remark-label {{ font-family: 'Cinzel', serif; font-size: 10px; letter-spacing: 2px; color: var(--accent-color); margin-bottom: 6px; display: flex; align-items: center; gap: 4px; }}
+            .remark-text {{ font-size: 14px; line-height: 1.75; color: #555; }}
+            
+            /* 可编辑样式 */
+            [contenteditable="true"]:hover {{ background: rgba(255, 235, 59, 0.15); cursor: text; outline: 1px dashed #ccc; border-radius: 4px; }}
+            [contenteditable="true"]:focus {{ background: rgba(255, 235, 59, 0.25); outline: 2px solid var(--accent-light); border-radius: 4px; }}
+            
+            /* 打印按钮 */
+            .print-btn {{
+                position: fixed; bottom: 24px; right: 24px;
+                background: linear-gradient(135deg, var(--accent-color), var(--accent-light));
+                color: white; border: none; padding: 14px 24px; border-radius: 30px;
+                box-shadow: 0 6px 20px rgba(184,134,11,0.4); z-index: 1000; cursor: pointer;
+                font-weight: bold; font-size: 14px; letter-spacing: 0.5px;
+                transition: transform 0.2s, box-shadow 0.2s;
+            }}
+            .print-btn:hover {{ transform: translateY(-2px); box-shadow: 0 8px 25px rgba(184,134,11,0.5); }}
+            
+            /* 回到顶部 */
+            .top-btn {{
+                position: fixed; bottom: 24px; left: 24px;
+                background: var(--primary-dark); color: #fff; border: none;
+                padding: 12px 16px; border-radius: 50%; font-size: 18px;
+                box-shadow: 0 4px 12px rgba(0,0,0,0.2); z-index: 1000; cursor: pointer;
+                transition: transform 0.2s;
+            }}
+            .top-btn:hover {{ transform: translateY(-3px); }}
+            
+            @media print {{
+                .print-btn, .top-btn, .nav-to-btn, .sticky-topnav, .delete-btn, .remove-media-btn, .locate-btn {{ display: none; }}
+                .header-container {{ height: 45vh; }}
+                body {{ -webkit-print-color-adjust: exact; print-color-adjust: exact; }}
+            }}
+            
+            /* ===== 手机端自适应 (max-width: 600px) ===== */
+            @media (max-width: 600px) {{
+                /* 海报标题变小 */
+                .main-title {{ font-size: 28px; letter-spacing: 3px; }}
+                .sub-title {{ font-size: 11px; letter-spacing: 2px; }}
+                .header-container {{ height: 40vh; min-height: 250px; }}
+                .header-title-box {{ bottom: 30px; }}
+
+                /* 总览區内边距变小 */
+                .overview-section {{ padding: 20px 14px 10px; }}
+                .overview-text {{ font-size: 14px; }}
+                .highlight-chip {{ padding: 6px 10px; font-size: 12px; }}
+                .nav-pill {{ padding: 7px 12px; font-size: 12px; }}
+
+                /* 时间线：小屏上保留时间，使其嵌入行内并可编辑，减小 margin */
+                .timeline-container {{ padding: 0 12px 60px; }}
+                .timeline-item {{ margin-left: 0; padding-left: 18px; }}
+                .time-label {{ position: static; display: inline-block; padding-right: 6px; font-size: 14px; text-align: left; width: auto; color: var(--accent-light); }}
+                .timeline-item::before {{ left: -7px; width: 12px; height: 12px; }}
+                .location-name {{ font-size: 15px; display: inline; }}
+                .day-num {{ font-size: 20px; }}
+
+                /* 地图和图片 */
+                .map-section {{ height: 140px; }}
+                .day-map {{ height: 220px; }}
+                .trip-map {{ height: 240px; }}
+                .photo-wrapper {{ height: 180px; }}
+                .remark-box {{ font-size: 13px; padding: 12px; }}
+
+                /* 导航按钮加大点击区域 */
+                .nav-btn {{ padding: 8px 14px; font-size: 12px; }}
+                
+                /* 打印和回顶按钮移动下方避免遮住内容 */
+                .print-btn {{ bottom: 16px; right: 12px; padding: 10px 16px; font-size: 13px; }}
+                .top-btn {{ bottom: 16px; left: 12px; padding: 10px 13px; font-size: 16px; }}
+            }}
+
+            html {{ scroll-behavior: smooth; scroll-padding-top: 65px; }}
+        </style>
+    </head>
+    <body>
+        <!-- 海报区 -->
+        <div class="header-container">
+            <!-- 动态加载封面：摒弃 Unsplash, 这里用 JS 异步通过 Wiki/Bing 抓取 -->
+            <img id="main-cover-img" src="" class="header-poster" onload="this.classList.add('loaded')" onerror="this.removeAttribute('srcset'); this.src='{cover_fallback}'; this.classList.add('loaded');">
+            <div class="poster-overlay"></div>
+            <div class="header-title-box">
+                <h1 class="main-title" contenteditable="true">{trip_title}</h1>
+                <p class="sub-title" contenteditable="true">{trip_subtitle}</p>
+            </div>
+        </div>
+
+        <!-- 顶部固定快捷导航栏 -->
+        <div class="sticky-topnav">
+            <a class="nav-pill" onclick="openModal('section-overview'); return false;" href="javascript:void(0)">总览<span class="nav-city">Overview</span></a>
+            <a class="nav-pill" onclick="openModal('section-highlights'); return false;" href="javascript:void(0)">亮点<span class="nav-city">Highlights</span></a>
+            <div class="nav-divider"></div>
+            {nav_buttons_html}
+        </div>
+
+        <!-- 弹窗模态框：总览 + 亮点 -->
+        <div class="modal-overlay" id="info-modal" onclick="if(event.target===this) closeModal();">
+            <div class="overview-modal">
+                <button class="close-modal-btn" onclick="closeModal()">✖</button>
+                <div id="section-overview">
+                    <p class="overview-label">✦ Trip Overview</p>
+                    <p class="overview-text" contenteditable="true">{overview}</p>
+                </div>
+                <div class="section-divider"></div>
+                <div id="section-highlights">
+                    <p class="overview-label">✦ Highlights</p>
+                    {highlights_html}
+                </div>
+            </div>
+        </div>
+        
+        <!-- 时间线 -->
+        <div class="timeline-container">
+            <button class="print-btn" onclick="printItinerary()">🖨️ 保存行程 (PDF)</button>
+            <button class="top-btn" onclick="window.scrollTo({{top:0, behavior:'smooth'}})">↑</button>
+    """
+    if map_mode == "day":
+        html += """
+            <p class="map-label">✦ Route Overview</p>
+            <div class="trip-map" id="trip-map"></div>
+        """
+    
+    js_map_data = []
+    map_counter = 0
+
+    for day_idx, day in enumerate(days_data):
+        date = day.date
+        city = day.city.upper()
+        html += f"""<div id="day-{day_idx}" class="day-header"><span class="day-num" contenteditable="true">{date}</span><span class="day-city" contenteditable="true">{city}</span></div>"""
+        if map_mode == "day":
+            html += f"""<div class="day-map" id="day-map-{day_idx}"></div>"""
+        
+        for seq, act in enumerate(day.activities, start=1):
+            map_counter += 1
+            map_id = f"map-{map_counter}"
+            
+            time = act.time
+            name = act.name
+            desc = act.desc
+            lat = act.lat
+            lng = act.lng
+            # Wikipedia 图片 ID（程序详见 JS 部分动态加载）
+            wiki_query = act.img_keyword
+            photo_id = f"photo-{map_id}"
+            fallback_url = fallback_image or fallback_photo_url(wiki_query)
+            photo_url = None
+            if image_urls is not None:
+                photo_url = image_urls.get("photos", {}).get(wiki_query) or fallback_url
+            photo_srcset = None
+            if photo_url and image_proxy_url:
+                photo_url, photo_srcset = proxied_image(image_proxy_url, "card", photo_url)
+            
+            # 导航链接
+            nav_google = f"https://www.google.com/maps/search/?api=1&query={lat},{lng}"
+            nav_amap = f"https://uri.amap.com/navigation?to={lng},{lat},{name}"
+            
+            # 服务端已补全的周边 POI（pois 为 None 时退回浏览器端逐个查询 Nominatim）
+            act_pois = pois.get((day_idx, seq - 1), []) if pois is not None else None
+
+            js_map_data.append({"id": map_id, "lat": lat, "lng": lng, "name": name, "wiki_query": wiki_query, "photo_id": photo_id, "photo_url": photo_url,
+                                "photo_srcset": photo_srcset, "day": day_idx, "seq": seq, "date": date, "pois": act_pois})
+
+            if map_mode == "day":
+                # 每日模式下卡片不再单独建图，只保留定位到当日地图标记的入口与导航链接
+                map_html = f"""
+                    <div class="card-nav">
+                        <button class="locate-btn" onclick="locateStop('{map_id}')">📍 第 {seq} 站 · 地图定位</button>
+                        <a href="{nav_amap}" target="_blank" class="nav-btn amap">高德</a>
+                        <a href="{nav_google}" target="_blank" class="nav-btn">Google</a>
+                    </div>"""
+            else:
+                map_html = f"""
+                    <div class="map-section" id="{map_id}">
+                        <button class="remove-media-btn" title="删除地图" onclick="this.parentElement.remove()">✖</button>
+                        <div class="nav-to-btn-group">
+                            <a href="{nav_amap}" target="_blank" class="nav-btn amap">高德</a>
+                            <a href="{nav_google}" target="_blank" class="nav-btn">Google</a>
+                        </div>
+                    </div>"""
+            
+            html += f"""
+            <div class="timeline-item">
+                <span class="time-label" contenteditable="true">{time}</span>
+                <span class="location-name" contenteditable="true">{name}</span>
+                <div class="card" id="card-{map_id}">
+                    <button class="delete-btn" title="删除此行程" onclick="this.closest('.timeline-item').remove()">✖</button>{map_html}
+                    <div class="photo-wrapper">
+                        <button class="remove-media-btn" title="删除照片" onclick="this.parentElement.remove()">✖</button>
+                        <span class="photo-placeholder">📷 加载中...</span>
+                        <img id="{photo_id}" src="" onload="this.classList.add('loaded'); this.previousElementSibling.style.display='none';" onerror="this.removeAttribute('srcset'); this.src='{fallback_url}'; this.classList.add('loaded'); this.previousElementSibling.style.display='none';">
+                    </div>
+                    <div class="remark-box">
+                        <div class="remark-label">💡 TIPS</div>
+                        <div class="remark-text" contenteditable="true">{desc}</div>
+                    </div>
+                </div>
+            </div>
+            """
+
+    # JS 注入 — 地图 + 附近 POI
+    js_data = json.dumps(js_map_data, ensure_ascii=False)
+    html += f"""
+        </div>
+        <script>
+            const mapPoints = {js_data};
+            const coverSearchQuery = "{cover_search}";
+            const coverImageUrl = {json.dumps(cover_image_url)};
+            const coverSrcset = {json.dumps(cover_srcset)};
+            const imageSizes = {json.dumps({name: spec["sizes"] for name, spec in IMAGE_PROFILES.items()})};
+            const mapMode = "{map_mode}";
+            const fallbackImage = {json.dumps(fallback_image)};
+            const tileProxyUrl = {json.dumps(tile_proxy_url)};
+            const lazyRootMargin = {json.dumps(lazy_root_margin)};
+            const lazyTeardownMargin = "{LAZY_TEARDOWN_MARGIN}";
+            
+            document.addEventListener("DOMContentLoaded", function () {{
+                
+                // --- 1. 动态加载首页大图 (使用 Wikipedia API 或备用 Bing API) ---
+                var coverImgEl = document.getElementById('main-cover-img');
+                var genericFallback = fallbackImage || 'https://tse1.mm.bing.net/th?q=' + encodeURIComponent(coverSearchQuery + " travel scenery") + '&w=1080&h=1600&c=7&rs=1&p=0';
+                if (coverImageUrl) {{
+                    // 服务端已解析好封面地址，直接使用；经图片代理时附带多档宽度的 srcset
+                    if (coverSrcset) {{
+                        coverImgEl.sizes = imageSizes.cover;
+                        coverImgEl.srcset = coverSrcset;
+                    }}
+                    coverImgEl.src = coverImageUrl;
+                }} else {{
+                    fetch('https://en.wikipedia.org/w/api.php?action=query&titles=' + encodeURIComponent(coverSearchQuery.split(' ')[0]) + '&prop=pageimages&format=json&pithumbsize=1600&origin=*')
+                        .then(r => r.json())
+                        .then(d => {{
+                            var pages = d.query.pages;
+                            var page = pages[Object.keys(pages)[0]];
+                            if (page && page.thumbnail) {{
+                                coverImgEl.src = page.thumbnail.source;
+                            }} else {{
+                                // 如果 Wiki 没找到，使用 Bing 缩略图接口 (绝对彻底弃用 Unsplash)
+                                coverImgEl.src = genericFallback;
+                            }}
+                        }}).catch(() => {{ coverImgEl.src = genericFallback; }});
+                }}
+
+
+                // --- 2. 加载行程地图与景点图片 ---
+                // 景点照片与地图解耦：无论哪种地图模式都逐个登记；懒加载模式下卡片接近视口时才真正加载
+                trackFirstDay();
+                mapPoints.forEach(pt => {{
+                        var imgEl = document.getElementById(pt.photo_id);
+                        if (imgEl) lazyRegister(imgEl, function() {{ loadPhoto(pt, imgEl); return true; }}, null);
+                }});
+
+                if (mapMode === 'day') {{
+                    initDayMaps();
+                    return;
+                }}
+
+                // 逐活动模式：每个活动各自一张小地图，滚远后销毁
+                mapPoints.forEach(pt => {{
+                        var el = document.getElementById(pt.id);
+                        if (el) lazyRegister(el, function() {{ return initActivityMap(pt); }}, teardownMap);
+                }});
+            }}); // 结束 DOMContentLoaded
+
+            // ======================================
+            // 视口驱动的懒加载：照片、地图（含瓦片）与周边 POI 在接近视口时才初始化，远离后销毁地图
+            // lazyRootMargin 为 null 或浏览器不支持 IntersectionObserver 时全部立即加载
+            // ======================================
+            var lazyTargets = {{}};   // 元素 id -> {{ init, teardown, state }}
+            var nearObserver = null, farObserver = null;
+
+            function hydrate(id) {{
+                var t = lazyTargets[id];
+                if (!t || t.state) return t ? t.state : null;
+                t.state = t.init() || null;
+                return t.state;
+            }}
+
+            function dehydrate(id) {{
+                var t = lazyTargets[id];
+                if (!t || !t.state || !t.teardown) return;
+                // teardown 返回 false（如地图处于全屏）时保留
+                if (t.teardown(t.state) !== false) t.state = null;
+            }}
+
+            function lazyRegister(el, init, teardown) {{
+                lazyTargets[el.id] = {{ init: init, teardown: teardown, state: null }};
+                if (!lazyRootMargin || !('IntersectionObserver' in window)) {{
+                    hydrate(el.id);
+                    return;
+                }}
+                if (!nearObserver) {{
+                    nearObserver = new IntersectionObserver(function(entries) {{
+                        entries.forEach(e => {{ if (e.isIntersecting) hydrate(e.target.id); }});
+                    }}, {{ rootMargin: lazyRootMargin }});
+                    farObserver = new IntersectionObserver(function(entries) {{
+                        entries.forEach(e => {{ if (!e.isIntersecting) dehydrate(e.target.id); }});
+                    }}, {{ rootMargin: lazyTeardownMargin }});
+                }}
+                nearObserver.observe(el);
+                if (teardown) farObserver.observe(el);
+            }}
+
+            function teardownMap(map) {{
+                if (map.isFullscreen && map.isFullscreen()) return false;
+                Object.keys(stopMarkers).forEach(id => {{
+                    if (stopMarkers[id].map === map) delete stopMarkers[id];
+                }});
+                map.remove();
+            }}
+
+            // 打印前补齐所有尚未加载的照片与地图，等待图片就绪（最多 3 秒）再调起打印
+            function printItinerary() {{
+                Object.keys(lazyTargets).forEach(hydrate);
+                var pending = Array.prototype.filter.call(document.querySelectorAll('.photo-wrapper img'), img => img.src && !img.complete);
+                var waits = pending.map(img => new Promise(resolve => {{
+                    img.addEventListener('load', resolve, {{ once: true }});
+                    img.addEventListener('error', resolve, {{ once: true }});
+                }}));
+                Promise.race([Promise.all(waits), new Promise(resolve => setTimeout(resolve, 3000))])
+                    .then(function() {{ window.print(); }});
+            }}
+
+            // 首日可交互：第一天的照片与地图瓦片全部就绪时打点，可在 Performance 面板或 performance.getEntriesByName 中查看
+            var firstDayPending = 0;
+            function trackFirstDay() {{
+                mapPoints.forEach(pt => {{ if (pt.day === 0 && document.getElementById(pt.photo_id)) firstDayPending++; }});
+                if (mapMode === 'day') {{
+                    if (mapPoints.some(pt => pt.day === 0 && hasCoords(pt)) && document.getElementById('day-map-0')) firstDayPending++;
+                }} else {{
+                    mapPoints.forEach(pt => {{ if (pt.day === 0 && document.getElementById(pt.id)) firstDayPending++; }});
+                }}
+                if (!firstDayPending) markFirstDay();
+            }}
+
+            function firstDaySettled() {{
+                if (firstDayPending > 0 && --firstDayPending === 0) markFirstDay();
+            }}
+
+            function markFirstDay() {{
+                if (!window.performance || !performance.mark) return;
+                performance.mark('itinerary-first-day-interactive');
+                try {{ performance.measure('itinerary-first-day-tti', undefined, 'itinerary-first-day-interactive'); }} catch (e) {{}}
+            }}
+
+            function watchFirstDayMap(map) {{
+                var settled = false;
+                map.eachLayer(function(layer) {{
+                    if (layer instanceof L.TileLayer && !settled) {{
+                        settled = true;
+                        layer.once('load', firstDaySettled);
+                    }}
+                }});
+                if (!settled) firstDaySettled();
+            }}
+
+            // 景点照片：服务端已解析则直接加载（经图片代理时附带 srcset），否则浏览器端查询 Wikipedia
+            function loadPhoto(pt, imgEl) {{
+                if (pt.day === 0) {{
+                    var settled = false;
+                    var done = function() {{ if (!settled) {{ settled = true; firstDaySettled(); }} }};
+                    imgEl.addEventListener('load', done);
+                    imgEl.addEventListener('error', done);
+                }}
+                if (pt.photo_url) {{
+                    // 服务端已批量解析，零查询直接加载
+                    if (pt.photo_srcset) {{
+                        imgEl.sizes = imageSizes.card;
+                        imgEl.srcset = pt.photo_srcset;
+                    }}
+                    imgEl.src = pt.photo_url;
+                    return;
+                }}
+                var fallback = fallbackImage || 'https://tse1.mm.bing.net/th?q=' + encodeURIComponent(pt.wiki_query + " landmark") + '&w=600&h=400&c=7&rs=1&p=0';
+                fetch('https://en.wikipedia.org/w/api.php?action=query&titles=' + encodeURIComponent(pt.wiki_query) + '&prop=pageimages&format=json&pithumbsize=800&origin=*')
+                    .then(function(r) {{ return r.json(); }})
+                    .then(function(d) {{
+                        var pages = d.query.pages;
+                        var page = pages[Object.keys(pages)[0]];
+                        if (page && page.thumbnail) {{
+                            imgEl.src = page.thumbnail.source;
+                        }} else {{
+                            // fallback: 运用 Bing 图片缩略图服务，彻底摆脱 Unsplash
+                            imgEl.src = fallback;
+                        }}
+                    }}).catch(function() {{ imgEl.src = fallback; }});
+            }}
+
+            function initActivityMap(pt) {{
+                var lat = parseFloat(pt.lat);
+                var lng = parseFloat(pt.lng);
+                var map = createBaseMap(pt.id, lat, lng, 14);
+                if (pt.day === 0) watchFirstDayMap(map);
+
+                // 主标记 — 红色
+                var mainIcon = L.divIcon({{
+                    className: 'custom-marker',
+                    html: '<div style="background:#e74c3c;width:14px;height:14px;border-radius:50%;border:3px solid #fff;box-shadow:0 2px 6px rgba(0,0,0,0.4);"></div>',
+                    iconSize: [14, 14],
+                    iconAnchor: [7, 7]
+                }});
+                L.marker([pt.lat, pt.lng], {{icon: mainIcon}}).addTo(map).bindPopup('<b>' + pt.name + '</b>');
+
+                if (pt.pois) {{
+                    // 服务端已补全（或本页此前已查询过）的周边 POI，直接绘制
+                    addPoiMarkers(map, pt.pois);
+                    return map;
+                }}
+
+                // 使用 Nominatim 查询周边 POI；结果记在 pt 上，地图销毁后重建不再重复查询
+                fetch('https://nominatim.openstreetmap.org/search?format=json&limit=6&viewbox=' + 
+                    (pt.lng - 0.015) + ',' + (pt.lat + 0.015) + ',' + (pt.lng + 0.015) + ',' + (pt.lat - 0.015) + 
+                    '&bounded=1&q=tourism+OR+restaurant+OR+museum+OR+temple+OR+park+OR+hotel')
+                .then(res => res.json())
+                .then(places => {{
+                    pt.pois = places
+                        .filter(p => Math.abs(p.lat - pt.lat) > 0.0005 || Math.abs(p.lon - pt.lng) > 0.0005)
+                        .map(p => ({{ name: p.display_name.split(',')[0], lat: parseFloat(p.lat), lng: parseFloat(p.lon) }}));
+                    // 查询返回前地图可能已被销毁
+                    if (lazyTargets[pt.id] && lazyTargets[pt.id].state === map) addPoiMarkers(map, pt.pois);
+                }}).catch(function(){{}});
+                return map;
+            }}
+
+            // ======================================
+            // 地图公共方法：底图选择、每日地图、全程总览聚合地图、卡片与标记联动
+            // ======================================
+            function createBaseMap(elId, lat, lng, zoom) {{
+                // Google Map 全球层源 (更稳定更丰富)
+                var googleUrl = tileProxyUrl ? tileProxyUrl + '/tiles/google/{{z}}/{{x}}/{{y}}' : 'https://mt1.google.com/vt/lyrs=m&x={{x}}&y={{y}}&z={{z}}';
+                var googleLayer = L.tileLayer(googleUrl, {{ maxZoom: 19 }});
+                // 高德地图 HTTPS 兼容版：使用 wprd 子域名，确保能够正常加载显示
+                var amapUrl = tileProxyUrl ? tileProxyUrl + '/tiles/amap/{{z}}/{{x}}/{{y}}' : 'https://wprd01.is.autonavi.com/appmaptile?x={{x}}&y={{y}}&z={{z}}&lang=zh_cn&size=1&scl=1&style=7';
+                var amapLayer = L.tileLayer(amapUrl, {{ maxZoom: 19 }});
+
+                // 智能判断：判定中国大致范围
+                var isChina = (lat > 18.0 && lat < 54.0 && lng > 73.0 && lng < 135.0);
+                var defaultLayer = isChina ? amapLayer : googleLayer;
+
+                var map = L.map(elId, {{
+                    zoomControl: true, scrollWheelZoom: false, attributionControl: false,
+                    fullscreenControl: true,
+                    layers: [defaultLayer]
+                }}).setView([lat, lng], zoom);
+                
+                // 图层控制菜单
+                if (isChina) {{
+                    L.control.layers({{"🗺️ 高德地图(默认)": amapLayer, "🌍 Google地图": googleLayer}}, null, {{position: 'topleft'}}).addTo(map);
+                }} else {{
+                    L.control.layers({{"🌍 Google地图(海外默认)": googleLayer, "🗺️ 高德地图": amapLayer}}, null, {{position: 'topleft'}}).addTo(map);
+                }}
+                
+                L.control.scale({{ position: 'bottomleft', metric: true, imperial: false }}).addTo(map);
+                return map;
+            }}
+
+            // 周边 POI — 蓝色小圆点
+            function addPoiMarkers(map, places) {{
+                places.forEach(p => {{
+                    var poiIcon = L.divIcon({{
+                        className: 'poi-marker',
+                        html: '<div style="background:#3498db;width:8px;height:8px;border-radius:50%;border:2px solid #fff;box-shadow:0 1px 3px rgba(0,0,0,0.3);"></div>',
+                        iconSize: [8, 8],
+                        iconAnchor: [4, 4]
+                    }});
+                    L.marker([p.lat, p.lng], {{icon: poiIcon}}).addTo(map)
+                        .bindPopup('<small>' + p.name + '</small>');
+                }});
+            }}
+
+            function hasCoords(pt) {{
+                var lat = parseFloat(pt.lat), lng = parseFloat(pt.lng);
+                return isFinite(lat) && isFinite(lng) && !(lat === 0 && lng === 0);
+            }}
+
+            function stopIcon(seq, active) {{
+                return L.divIcon({{
+                    className: 'stop-marker' + (active ? ' active' : ''),
+                    html: '<div>' + seq + '</div>',
+                    iconSize: [24, 24],
+                    iconAnchor: [12, 12]
+                }});
+            }}
+
+            var stopMarkers = {{}};   // 活动 id -> {{ map, marker, pt }}
+            var activeStopId = null;
+
+            function initDayMaps() {{
+                var days = {{}};
+                mapPoints.forEach(pt => {{ (days[pt.day] = days[pt.day] || []).push(pt); }});
+                var allLatLngs = [];
+
+                // 每天一张地图：编号标记 + 路线折线，接近视口时创建、滚远后销毁
+                Object.keys(days).forEach(function(dayIdx) {{
+                    var el = document.getElementById('day-map-' + dayIdx);
+                    var pts = days[dayIdx].filter(hasCoords);
+                    if (!el) return;
+                    if (!pts.length) {{ el.remove(); return; }}
+                    pts.forEach(pt => {{ allLatLngs.push({{ latlng: [parseFloat(pt.lat), parseFloat(pt.lng)], pt: pt }}); }});
+                    lazyRegister(el, function() {{ return initDayMap(el, pts); }}, teardownMap);
+                }});
+
+                // 全程总览：所有站点聚合显示
+                var tripEl = document.getElementById('trip-map');
+                if (!tripEl) return;
+                if (!allLatLngs.length) {{ tripEl.remove(); return; }}
+                lazyRegister(tripEl, function() {{ return initTripMap(allLatLngs); }}, teardownMap);
+            }}
+
+            function initDayMap(el, pts) {{
+                var map = createBaseMap(el.id, parseFloat(pts[0].lat), parseFloat(pts[0].lng), 13);
+                var route = [];
+                pts.forEach(pt => {{
+                    var latlng = [parseFloat(pt.lat), parseFloat(pt.lng)];
+                    var marker = L.marker(latlng, {{icon: stopIcon(pt.seq, pt.id === activeStopId)}}).addTo(map)
+                        .bindPopup('<b>' + pt.seq + '. ' + pt.name + '</b>');
+                    marker.on('click', function() {{ focusStop(pt.id, false); }});
+                    stopMarkers[pt.id] = {{ map: map, marker: marker, pt: pt }};
+                    if (pt.pois) addPoiMarkers(map, pt.pois);
+                    route.push(latlng);
+                }});
+                if (route.length > 1) {{
+                    L.polyline(route, {{ color: '#b8860b', weight: 3, opacity: 0.8, dashArray: '6 6' }}).addTo(map);
+                    map.fitBounds(route, {{ padding: [28, 28], maxZoom: 15 }});
+                }}
+                if (pts[0].day === 0) watchFirstDayMap(map);
+                return map;
+            }}
+
+            function initTripMap(allLatLngs) {{
+                var tripMap = createBaseMap('trip-map', allLatLngs[0].latlng[0], allLatLngs[0].latlng[1], 10);
+                var group = L.markerClusterGroup ? L.markerClusterGroup({{ showCoverageOnHover: false, maxClusterRadius: 40 }}) : L.layerGroup();
+                allLatLngs.forEach(item => {{
+                    var m = L.marker(item.latlng, {{icon: stopIcon(item.pt.seq, false)}})
+                        .bindPopup('<b>' + item.pt.date + ' · ' + item.pt.seq + '. ' + item.pt.name + '</b>');
+                    m.on('click', function() {{ focusStop(item.pt.id, true); }});
+                    group.addLayer(m);
+                }});
+                group.addTo(tripMap);
+                if (allLatLngs.length > 1) {{
+                    tripMap.fitBounds(allLatLngs.map(item => item.latlng), {{ padding: [28, 28] }});
+                }}
+                return tripMap;
+            }}
+
+            // 卡片 <-> 地图标记联动：高亮对应标记与卡片，可选滚动到每日地图或卡片
+            function focusStop(ptId, scrollToCard) {{
+                if (!stopMarkers[ptId]) {{
+                    // 所在那天的地图尚未创建（懒加载或已被销毁），先立即创建
+                    var owner = mapPoints.find(p => p.id === ptId);
+                    if (owner) hydrate('day-map-' + owner.day);
+                }}
+                var entry = stopMarkers[ptId];
+                if (activeStopId && stopMarkers[activeStopId]) {{
+                    var prev = stopMarkers[activeStopId];
+                    prev.marker.setIcon(stopIcon(prev.pt.seq, false));
+                }}
+                document.querySelectorAll('.card.highlight').forEach(c => c.classList.remove('highlight'));
+                var card = document.getElementById('card-' + ptId);
+                if (card) card.classList.add('highlight');
+                activeStopId = ptId;
+                if (!entry) return;
+                entry.marker.setIcon(stopIcon(entry.pt.seq, true));
+                if (scrollToCard && card) {{
+                    card.scrollIntoView({{behavior: 'smooth', block: 'center'}});
+                }}
+                entry.map.setView(entry.marker.getLatLng(), Math.max(entry.map.getZoom(), 14));
+                entry.marker.openPopup();
+            }}
+
+            function locateStop(ptId) {{
+                focusStop(ptId, false);
+                var entry = stopMarkers[ptId];
+                if (!entry) return;
+                entry.map.getContainer().scrollIntoView({{behavior: 'smooth', block: 'center'}});
+            }}
+
+            // ======================================
+            // 控制全局弹窗 (必须在全局作用域申明，方可供 HTML onclick 调用)
+            // ======================================
+            function openModal(targetId) {{
+                var modal = document.getElementById('info-modal');
+                if(!modal) return;
+                modal.classList.add('show');
+                setTimeout(function() {{
+                    var target = document.getElementById(targetId);
+                    if(target) target.scrollIntoView({{behavior: 'smooth', block: 'start'}});
+                }}, 100);
+            }}
+            
+            function closeModal() {{
+                var modal = document.getElementById('info-modal');
+                if(modal) modal.classList.remove('show');
+            }}
+
+            // 监听键盘 ESC 关闭弹窗
+            document.addEventListener('keydown', function(event) {{
+                if (event.key === "Escape") {{
+                    closeModal();
+                }}
+            }});
+        </script>
+    </body>
+    </html>
+    """
+    return html
@@ -0,0 +1,116 @@
+import functools
+import threading
+import time
+
+import metrics
+
+# --- 请求截止时间与上游熔断 ---
+# Deadline：一次请求的总截止时间，按阶段（检索、大模型、配图、POI）切分预算，
+# 每个阶段可用的时间取“阶段预算”与“整体剩余时间”中较小者，前面的阶段超时不会把后面的阶段一起拖垮。
+# CircuitBreaker：每个上游（DuckDuckGo、各大模型端点、Wikipedia、Nominatim）一个熔断器，
+# 连续失败达到阈值后打开，冷却期内直接跳过该上游（调用立即抛 CircuitOpenError），
+# 冷却期满放行一次试探请求（半开），成功则关闭，失败则重新打开；状态导出为指标。
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}   # 指标中的状态取值
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds, budgets=None):
+        self.seconds = seconds
+        self.budgets = dict(budgets or {})   # 阶段 -> 预算（秒）；未列出的阶段可用全部剩余时间
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def budget(self, stage):
+        remaining = self.remaining()
+        limit = self.budgets.get(stage)
+        return remaining if limit is None else min(limit, remaining)
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, cooldown_seconds=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = CLOSED
+        self.failures = 0            # 连续失败次数
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+        metrics.UPSTREAM_BREAKER_STATE.set(_STATE_VALUES[CLOSED], upstream=name)
+
+    def _transition(self, state):
+        # 调用方需持有 self._lock
+        if state != self.state:
+            self.state = state
+            metrics.UPSTREAM_BREAKER_STATE.set(_STATE_VALUES[state], upstream=self.name)
+
+    @property
+    def is_open(self):
+        # 处于冷却期内（不放行任何请求）
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.cooldown_seconds
+
+    def allow(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self.opened_at >= self.cooldown_seconds:
+                self._transition(HALF_OPEN)
+                self.probe_started_at = None
+            if self.state == HALF_OPEN:
+                # 半开时同一时刻只放行一个试探请求；试探迟迟没有结果（如被取消）时，冷却期后再放行一个
+                if self.probe_started_at is None or now - self.probe_started_at >= self.cooldown_seconds:
+                    self.probe_started_at = now
+                    return True
+            elif self.state == CLOSED:
+                return True
+            self.rejected += 1
+        metrics.UPSTREAM_CALLS.inc(upstream=self.name, result="rejected")
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._transition(CLOSED)
+        metrics.UPSTREAM_CALLS.inc(upstream=self.name, result="success")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+        metrics.UPSTREAM_CALLS.inc(upstream=self.name, result="failure")
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def wrap(self, fn):
+        @functools.wraps(fn)
+        def guarded(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return guarded
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# --- 行程结果缓存 ---
+# 以“归一化后的用户输入 + 模型名 + System Prompt 版本”为键，
+# 把解析好的行程 dict（以及可选的渲染 HTML）落盘到 SQLite。
+# 支持 TTL 过期、按最近访问时间的 LRU 容量淘汰，以及命中/未命中计数。
+
+
+def normalize_prompt(prompt_text):
+    # 全半角统一、大小写统一、空白折叠、去掉首尾标点，使“京都3天 古建筑 美食”与“京都3天  古建筑 美食。”命中同一条缓存
+    text = unicodedata.normalize("NFKC", prompt_text or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" .,!?;:~。，！？；：、…")
+
+
+class ItineraryCache:
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_entries=500):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS itineraries ("
+            " key TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " html TEXT,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_itineraries_accessed ON itineraries (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(prompt_text, model_name, prompt_version):
+        raw = "\x1f".join([normalize_prompt(prompt_text), model_name, str(prompt_version)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, html, created_at FROM itineraries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM itineraries WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE itineraries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return {"data": json.loads(row[0]), "html": row[1]}
+
+    def put(self, key, data, html=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO itineraries (key, data, html, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(data, ensure_ascii=False), html, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM itineraries WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM itineraries").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM itineraries WHERE key IN "
+                "(SELECT key FROM itineraries ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM itineraries").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": size,
+        }
+
+
+# --- 可分享的行程存储 ---
+# 每次成功生成的行程都以短 ID 落盘（同一份行程总是得到同一个 ID），
+# 打开 ?trip=<id> 时直接从这里读出重新展示，不再检索、也不再调用大模型。
+# 按“最近访问时间”做 TTL 过期，并以条数与总字节数双重上限做 LRU 淘汰。
+
+TRIP_ID_ALPHABET = "23456789abcdefghijkmnpqrstuvwxyz"   # 去掉易混淆的 0/1/l/o
+TRIP_ID_LENGTHS = (8, 12, 16)                          # 极少数前缀冲突时逐级加长
+_TRIP_ID_PATTERN = re.compile(f"^[{TRIP_ID_ALPHABET}]{{{TRIP_ID_LENGTHS[0]},{TRIP_ID_LENGTHS[-1]}}}$")
+
+
+def make_trip_id(payload, length=TRIP_ID_LENGTHS[0]):
+    number = int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest(), "big")
+    chars = []
+    for _ in range(length):
+        number, index = divmod(number, len(TRIP_ID_ALPHABET))
+        chars.append(TRIP_ID_ALPHABET[index])
+    return "".join(chars)
+
+
+class TripStore:
+    def __init__(self, path, ttl_seconds=90 * 24 * 3600, max_entries=5000, max_bytes=500 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trips ("
+            " id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " html TEXT,"
+            " prompt TEXT,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_accessed ON trips (accessed_at)")
+        self._conn.commit()
+
+    def put(self, data, html=None, prompt_text=""):
+        # 返回行程的短 ID；同一份行程重复写入只刷新访问时间与 HTML
+        payload = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        size = len(payload.encode("utf-8")) + len((html or "").encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            for length in TRIP_ID_LENGTHS:
+                trip_id = make_trip_id(payload, length)
+                row = self._conn.execute("SELECT data FROM trips WHERE id = ?", (trip_id,)).fetchone()
+                if row is None or row[0] == payload:
+                    break
+            self._conn.execute(
+                "INSERT INTO trips (id, data, html, prompt, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET html = COALESCE(excluded.html, trips.html),"
+                " size = MAX(excluded.size, trips.size), accessed_at = excluded.accessed_at",
+                (trip_id, payload, html, prompt_text, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+        return trip_id
+
+    def get(self, trip_id):
+        if not trip_id or not _TRIP_ID_PATTERN.match(trip_id):
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, html, prompt, created_at, accessed_at FROM trips WHERE id = ?", (trip_id,)
+            ).fetchone()
+            if row is None or now - row[4] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE trips SET accessed_at = ? WHERE id = ?", (now, trip_id))
+            self._conn.commit()
+            self.hits += 1
+        return {"data": json.loads(row[0]), "html": row[1], "prompt": row[2], "created_at": row[3]}
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM trips WHERE accessed_at < ?", (now - self.ttl_seconds,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM trips").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        victims = []
+        for trip_id, size in self._conn.execute("SELECT id, size FROM trips ORDER BY accessed_at ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((trip_id,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM trips WHERE id = ?", victims)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM trips").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
@@ -0,0 +1,352 @@
+import re
+import threading
+import time
+import unicodedata
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+
+import metrics
+import planner
+from resilience import CircuitOpenError, Deadline
+
+# --- 多路并发检索与正文抽取 ---
+# 原先只发一次 DuckDuckGo 请求、只用前 6 条结果摘要，大模型拿到的参考资料很薄。这里把一次检索拆成多个查询变体
+# （全部目的地总览、目的地 + 兴趣、多城市行程每个城市单独一条），在线程池中并发检索；
+# 可选地对每个变体排名靠前的结果页以有限并发抓取网页、抽取正文段落；
+# 所有摘要与段落统一去重（规范化后完全相同、互相包含或字符 4-gram 高度重合），
+# 按“覆盖的关键词比例 + 搜索排名”打分，在固定 token 预算内装箱。
+# 整个过程受同一个截止时间约束：到期时已返回的结果照常参与排序，未完成的检索与抓取直接丢弃。
+# 熔断器按整次检索记一次结果：任一变体成功即算成功，全部失败或到期无结果才算一次失败。
+#
+# 检索键（search_cache.extract_search_key）已去掉天数，不同天数的同一目的地共享检索结果，
+# 因此“总览”变体以“行程”代替天数。
+
+# 兴趣类关键词：检索键中包含这些词的词项视为兴趣（“古建筑”含“建筑”）
+INTEREST_WORDS = {
+    "美食", "小吃", "购物", "拍照", "摄影", "亲子", "徒步", "登山", "爬山", "博物馆", "美术馆", "温泉", "夜景",
+    "小众", "自然", "海岛", "海边", "沙滩", "潜水", "滑雪", "古镇", "历史", "文化", "建筑", "寺庙", "动漫",
+    "咖啡", "酒吧", "夜市", "演出", "蜜月", "自驾", "骑行", "露营", "赏花", "樱花", "红叶", "穷游", "深度",
+}
+
+# 常见目的地（城市 / 地区）：检索键里的中文不分词（如“成都重庆”、“日本京都”），按最长匹配从词项中找出地名；
+# 只有识别出至少两个不同地名时才为每个地名单独检索。未收录的地名由地名索引（见 gazetteer_place_lookup）补充判断
+KNOWN_CITIES = frozenset("""
+北京 上海 广州 深圳 杭州 苏州 南京 成都 重庆 西安 武汉 长沙 厦门 青岛 大连 天津 昆明 大理 丽江 西双版纳 桂林 阳朔
+三亚 海口 拉萨 林芝 西宁 乌鲁木齐 喀什 伊犁 敦煌 张掖 兰州 银川 呼和浩特 哈尔滨 长春 沈阳 济南 泰山 黄山 婺源 景德镇
+洛阳 开封 郑州 平遥 太原 大同 南昌 福州 泉州 潮州 汕头 珠海 佛山 南宁 贵阳 黔东南 凤凰 张家界 九寨沟 稻城 香格里拉
+宜昌 恩施 扬州 无锡 绍兴 宁波 舟山 千岛湖 莫干山 乌镇 周庄 香港 澳门 台北 台中 台南 高雄 花莲 垦丁
+东京 京都 大阪 奈良 神户 名古屋 北海道 札幌 小樽 函馆 冲绳 福冈 箱根 富士山 横滨 镰仓 金泽 广岛
+首尔 釜山 济州岛 曼谷 清迈 普吉岛 芭提雅 苏梅岛 新加坡 吉隆坡 槟城 兰卡威 巴厘岛 雅加达 河内 胡志明市 岘港 芽庄
+暹粒 吴哥窟 万象 琅勃拉邦 仰光 马尼拉 长滩岛 宿务 马尔代夫 科伦坡 加德满都 新德里 孟买 迪拜 阿布扎比 伊斯坦布尔
+卡帕多奇亚 开罗 卢克索 马拉喀什 开普敦 内罗毕 巴黎 尼斯 里昂 伦敦 爱丁堡 曼彻斯特 罗马 米兰 威尼斯 佛罗伦萨 那不勒斯
+巴塞罗那 马德里 塞维利亚 里斯本 波尔图 柏林 慕尼黑 法兰克福 维也纳 萨尔茨堡 布拉格 布达佩斯 苏黎世 日内瓦 因特拉肯
+卢塞恩 阿姆斯特丹 布鲁塞尔 哥本哈根 斯德哥尔摩 奥斯陆 赫尔辛基 雷克雅未克 莫斯科 圣彼得堡 雅典 圣托里尼 杜布罗夫尼克
+纽约 洛杉矶 旧金山 拉斯维加斯 西雅图 芝加哥 波士顿 华盛顿 迈阿密 夏威夷 温哥华 多伦多 蒙特利尔 墨西哥城 坎昆 悉尼
+墨尔本 布里斯班 黄金海岸 凯恩斯 奥克兰 皇后镇 基督城
+""".split())
+# 国家 / 大区：可作目的地，但与城市同时出现时（“日本京都”）只作为上下文，不单独检索
+KNOWN_REGIONS = frozenset("""
+日本 韩国 泰国 越南 新加坡 马来西亚 印尼 菲律宾 柬埔寨 老挝 缅甸 斯里兰卡 尼泊尔 印度 土耳其 埃及 摩洛哥 南非 肯尼亚
+法国 英国 意大利 西班牙 葡萄牙 德国 奥地利 捷克 匈牙利 瑞士 荷兰 比利时 丹麦 瑞典 挪威 芬兰 冰岛 俄罗斯 希腊 克罗地亚
+美国 加拿大 墨西哥 澳大利亚 新西兰 欧洲 东南亚 北欧 西欧 东欧 南欧 云南 四川 贵州 广西 海南 西藏 新疆 青海 甘肃 内蒙古
+东北 江南 福建 广东 浙江 江苏 山东 山西 湖南 湖北 台湾
+""".split())
+_PLACE_NAMES = sorted(KNOWN_CITIES | KNOWN_REGIONS, key=len, reverse=True)
+# 日期、出发时间与行程偏好之类的词，既不是地名也不是兴趣，不参与检索
+_NOISE_PATTERN = re.compile(r"\d+\s*(月|号|日|天|周|年|人|岁)|[一二两三四五六七八九十]+(个)?(月|周|天)|出发|左右|不想|太累|轻松|预算|游$")
+
+MAX_QUERY_VARIANTS = 5        # 每次检索最多并发的查询变体数
+MAX_CITY_QUERIES = 3          # 多城市行程最多为几个城市单独检索
+PAGES_PER_QUERY = 2           # 每个变体抓取排名前几的结果页
+PAGE_MAX_BYTES = 512 * 1024   # 单个网页最多读取的字节数
+PASSAGE_MIN_CHARS = 40        # 短于该长度的正文块（导航、按钮文字）不算段落
+PASSAGE_MAX_CHARS = 240       # 长段落按句切分到不超过该长度
+PASSAGES_PER_PAGE = 4         # 每个网页最多贡献的段落数，避免一篇长文占满预算
+LINK_DENSITY_LIMIT = 0.5      # 链接文字占比超过该值的块视为导航/目录
+NEAR_DUPLICATE_JACCARD = 0.8  # 字符 4-gram 的 Jaccard 相似度超过该值视为重复
+
+
+def estimate_tokens(text):
+    # 按经验估算：每个中日韩字符约 1 token，其余字符约 4 个 1 token
+    cjk = len(re.findall(r"[\u3000-\u9fff\uff00-\uffef]", text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def find_places(term):
+    # 从左到右按最长匹配找出词项中的已知地名（“东京都”取“东京”，“成都重庆”取“成都”“重庆”）
+    found, i = [], 0
+    while i < len(term):
+        name = next((n for n in _PLACE_NAMES if term.startswith(n, i)), None)
+        if name is None:
+            i += 1
+            continue
+        found.append(name)
+        i += len(name)
+    return found
+
+
+def gazetteer_place_lookup(gazetteer, min_population=50000):
+    # 用本地地名索引判断一个词是否是有一定规模的居民点（GeoNames 要素类 P），供未收录的目的地使用
+    def is_place(name):
+        return len(name) >= 2 and any(
+            place["feature_class"] == "P" and place["population"] >= min_population
+            for place in map(gazetteer.place, gazetteer.lookup(name)))
+    return is_place
+
+
+def classify_terms(search_key, place_lookup=None):
+    # 返回 (目的地词项, 识别出的城市, 识别出的国家/地区, 兴趣词项)；日期、偏好等噪声词丢弃
+    destinations, cities, regions, interests = [], [], [], []
+    for term in search_key.split():
+        places = find_places(term)
+        if not places and place_lookup is not None and not _NOISE_PATTERN.search(term) and place_lookup(term):
+            places = [term]
+        if places:
+            destinations.append(term)
+            cities.extend(p for p in places if p not in KNOWN_REGIONS)
+            regions.extend(p for p in places if p in KNOWN_REGIONS)
+        elif any(word in term for word in INTEREST_WORDS):
+            interests.append(term)
+        elif not _NOISE_PATTERN.search(term) and len(term) >= 2:
+            # 未识别的词：可能是未收录的小众目的地，留在总览查询里，但不单独检索
+            destinations.append(term)
+    return destinations, list(dict.fromkeys(cities)), list(dict.fromkeys(regions)), interests
+
+
+def build_query_variants(search_key, max_variants=MAX_QUERY_VARIANTS, place_lookup=None):
+    # 总览（全部目的地 + “行程”）、目的地 + 兴趣，以及多城市行程每个城市一条（只对识别出的地名）
+    destinations, cities, regions, interests = classify_terms(search_key, place_lookup)
+    if not destinations:
+        destinations, interests = interests, []
+    if not destinations:
+        # 只剩日期、偏好等词（或地名被误判）时退回原检索键整体检索，不至于完全没有参考资料
+        return [search_key] if search_key.strip() else []
+    variants = [" ".join(destinations) + " 行程"]
+    if interests:
+        variants.append(" ".join(destinations + interests))
+    # 城市与国家同时出现时按城市拆分；只有多个国家/地区（“法国 意大利”）时按国家拆分
+    spots = cities or regions
+    if len(spots) > 1:
+        variants.extend(spots[:MAX_CITY_QUERIES])
+    return list(dict.fromkeys(variants))[:max_variants]
+
+
+def ranking_terms(search_key, place_lookup=None):
+    # 打分用的关键词：识别出的地名与兴趣词（噪声词不计入覆盖率）
+    destinations, cities, regions, interests = classify_terms(search_key, place_lookup)
+    return (cities or regions or destinations) + interests
+
+
+# --- 正文抽取 ---
+_SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe", "svg", "button", "select"}
+_BLOCK_TAGS = {"p", "div", "li", "td", "article", "section", "main", "blockquote", "h1", "h2", "h3", "h4", "dd", "br", "tr"}
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;])")
+
+
+class _MainTextParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []        # [(文本, 链接文字占比)]
+        self._skip_depth = 0
+        self._link_depth = 0
+        self._text = []
+        self._link_chars = 0
+
+    def _flush(self):
+        text = re.sub(r"\s+", " ", "".join(self._text)).strip()
+        if text:
+            self.blocks.append((text, self._link_chars / len(text)))
+        self._text = []
+        self._link_chars = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "a":
+            self._link_depth += 1
+        elif tag in _BLOCK_TAGS and not self._skip_depth:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "a":
+            self._link_depth = max(0, self._link_depth - 1)
+        elif tag in _BLOCK_TAGS and not self._skip_depth:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self._text.append(data)
+        if self._link_depth:
+            self._link_chars += len(data.strip())
+
+
+def extract_passages(page_html, max_chars=PASSAGE_MAX_CHARS, min_chars=PASSAGE_MIN_CHARS):
+    # 去掉脚本、导航、页眉页脚等非正文区域，保留足够长、链接占比低的文本块，长块按句切分
+    parser = _MainTextParser()
+    try:
+        parser.feed(page_html)
+        parser.close()
+    except Exception:
+        pass
+    parser._flush()
+    passages = []
+    for text, link_density in parser.blocks:
+        if len(text) < min_chars or link_density > LINK_DENSITY_LIMIT:
+            continue
+        current = ""
+        for sentence in _SENTENCE_END.split(text):
+            if current and len(current) + len(sentence) > max_chars:
+                passages.append(current.strip())
+                current = ""
+            current += sentence
+        current = current.strip()
+        if current:
+            passages.append(current[:max_chars])
+    return [p for p in passages if len(p) >= min_chars]
+
+
+def fetch_page(url, timeout=3.0, max_bytes=PAGE_MAX_BYTES):
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Android 14)'})
+    with metrics.STAGE_SECONDS.time(stage="page_fetch"):
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            content_type = resp.headers.get("Content-Type", "")
+            if "html" not in content_type:
+                raise ValueError(f"not an html page: {content_type}")
+            charset = resp.headers.get_content_charset() or "utf-8"
+            return resp.read(max_bytes).decode(charset, errors="ignore")
+
+
+# --- 去重与排序 ---
+def _normalize(text):
+    return re.sub(r"[\W_]+", "", unicodedata.normalize("NFKC", text).lower())
+
+
+def _shingles(text, size=4):
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+def rank_passages(candidates, terms, token_budget):
+    # candidates: [(文本, 搜索排名)]，排名从 0 开始；按“关键词覆盖比例 + 排名先验”打分，
+    # 去重后按分数从高到低装入 token 预算（放不下的跳过，继续尝试更短的段落）
+    terms = [_normalize(t) for t in terms if _normalize(t)]
+    scored = []
+    for text, rank in candidates:
+        normalized = _normalize(text)
+        if not normalized:
+            continue
+        coverage = sum(1 for t in terms if t in normalized) / len(terms) if terms else 0.0
+        scored.append((2.0 * coverage + 1.0 / (1 + rank), text, normalized))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    kept, kept_norms, used = [], [], 0
+    duplicates = over_budget = 0
+    for _, text, normalized in scored:
+        shingles = _shingles(normalized)
+        if any(normalized in other or other in normalized
+               or len(shingles & other_shingles) / len(shingles | other_shingles) >= NEAR_DUPLICATE_JACCARD
+               for other, other_shingles in kept_norms):
+            duplicates += 1
+            continue
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            over_budget += 1
+            continue
+        kept.append(text)
+        kept_norms.append((normalized, shingles))
+        used += tokens
+    for result, count in (("kept", len(kept)), ("duplicate", duplicates), ("over_budget", over_budget)):
+        if count:
+            metrics.RETRIEVAL_PASSAGES.inc(count, result=result)
+    return kept
+
+
+class ContentRetriever:
+    def __init__(self, search=planner.scrape_results, page_fetcher=fetch_page, fetch_pages=True,
+                 pages_per_query=PAGES_PER_QUERY, page_concurrency=4, token_budget=1200, deadline_seconds=2.0,
+                 page_timeout=3.0, max_variants=MAX_QUERY_VARIANTS, place_lookup=None, breaker=None):
+        # search(query) -> [(网页地址, 摘要)]；page_fetcher(url, timeout) -> 网页 HTML；
+        # place_lookup(name) -> bool 判断未收录的词是否为地名（如 gazetteer_place_lookup），为 None 时只用内置地名表
+        self.place_lookup = place_lookup
+        # resilience.CircuitBreaker；每次检索只记一次结果（任一变体成功即成功），
+        # 以免一个请求的多个变体同时失败就替所有用户打开熔断器
+        self.breaker = breaker
+        self.search = search
+        self.page_fetcher = page_fetcher
+        self.fetch_pages = fetch_pages
+        self.pages_per_query = pages_per_query
+        self.token_budget = token_budget
+        self.deadline_seconds = deadline_seconds
+        self.page_timeout = page_timeout
+        self.max_variants = max_variants
+        self.late = 0                   # 截止时间到期时被丢弃的检索与抓取数
+        self._lock = threading.Lock()
+        self._search_executor = ThreadPoolExecutor(max_workers=max_variants * 2, thread_name_prefix="retrieval-search")
+        self._page_executor = ThreadPoolExecutor(max_workers=page_concurrency, thread_name_prefix="retrieval-page")
+
+    def retrieve(self, search_key, deadline_seconds=None):
+        # 返回排序去重后的参考段落列表；没有任何查询变体成功时抛出异常（由摘要缓存按失败处理，短时间后重试）
+        deadline = Deadline(self.deadline_seconds if deadline_seconds is None else deadline_seconds)
+        start = time.perf_counter()
+        queries = build_query_variants(search_key, self.max_variants, self.place_lookup)
+        if not queries:
+            return []
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} is unavailable (circuit open)")
+        pending = {self._search_executor.submit(self.search, query): ("search", query, 0) for query in queries}
+        candidates, seen_urls = [], set()
+        succeeded, last_error = 0, None
+
+        while pending:
+            done, _ = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                kind, query, rank = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    metrics.RETRIEVAL_EVENTS.inc(event=f"{kind}_failed")
+                    if kind == "search":
+                        last_error = e
+                    continue
+                metrics.RETRIEVAL_EVENTS.inc(event=f"{kind}_ok")
+                if kind == "page":
+                    candidates.extend((text, rank) for text in extract_passages(result)[:PASSAGES_PER_PAGE])
+                    continue
+                succeeded += 1
+                fetched = 0
+                for rank, (url, snippet) in enumerate(result):
+                    if snippet:
+                        candidates.append((snippet, rank))
+                    # 各变体的结果常有重叠，同一网页只抓一次
+                    if (self.fetch_pages and fetched < self.pages_per_query and url.startswith("http")
+                            and url not in seen_urls and deadline.remaining() > 0):
+                        seen_urls.add(url)
+                        fetched += 1
+                        timeout = min(self.page_timeout, deadline.remaining())
+                        pending[self._page_executor.submit(self.page_fetcher, url, timeout)] = ("page", url, rank)
+
+        if pending:
+            # 到期仍未完成的检索与抓取不再等待；尚未开始的直接取消
+            for future in pending:
+                future.cancel()
+            with self._lock:
+                self.late += len(pending)
+            metrics.RETRIEVAL_EVENTS.inc(len(pending), event="late")
+            metrics.DEADLINE_EXCEEDED.inc(stage="retrieval")
+        if self.breaker is not None:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        if not succeeded:
+            raise last_error or TimeoutError(f"no search returned within {deadline.seconds:g}s")
+
+        with metrics.STAGE_SECONDS.time(stage="passage_rank"):
+            passages = rank_passages(candidates, ranking_terms(search_key, self.place_lookup), self.token_budget)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="retrieval")
+        return passages
@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+import planner
+
+# --- 目的地级攻略摘要缓存 ---
+# 同一目的地/关键词组合的 DuckDuckGo 摘要在所有用户之间共享：
+# 新鲜期内直接命中；过了新鲜期但未过最长保留期时先返回旧摘要，同时在后台刷新；
+# 完全未命中时在截止时间内等待抓取，超时则以空摘要放行大模型调用，抓取继续在后台完成并回填缓存。
+
+# 提取关键词时剔除的口语化填充词，使“我想去京都玩3天”与“京都3天”落到同一个键。
+# 只在词项首尾剔除，不在词中替换，以免切坏“埃及”、“和田”、“呼和浩特”这类地名
+_FILLER_PHRASES = sorted([
+    "我想去", "我们想去", "想去", "我要去", "打算去", "计划去", "带爸妈", "带孩子",
+    "喜欢", "想要", "左右", "一下", "还有", "以及",
+], key=len, reverse=True)
+_LEADING_FILLERS = "去"                 # 单字填充词只在词项长于 2 字时从首尾剔除
+_TRAILING_FILLERS = "玩的"
+_SINGLE_FILLERS = set("去玩和的与及")    # 单独成词时直接丢弃
+# 连接词：“还有”“以及”处总是切开；单字“和/与/及”只在两侧都至少 2 字时切开（“古建筑和美食”切，“呼和浩特”不切）
+_CONNECTOR_PHRASES = re.compile(r"还有|以及")
+_CONNECTOR_CHARS = "和与及"
+_DAYS_PATTERN = re.compile(r"\d+\s*(天|日|晚|夜|days?|nights?)|[一二三四五六七八九十两]+\s*(天|日|晚|夜)", re.IGNORECASE)
+_SPLIT_PATTERN = re.compile(r"[\s,，。.!！?？;；:：、/|+()（）\"'“”]+")
+
+
+def _strip_fillers(term):
+    while True:
+        stripped = term
+        for phrase in _FILLER_PHRASES:
+            if stripped.startswith(phrase):
+                stripped = stripped[len(phrase):]
+            if stripped.endswith(phrase):
+                stripped = stripped[:-len(phrase)]
+        if len(stripped) > 2 and stripped[0] in _LEADING_FILLERS:
+            stripped = stripped[1:]
+        if len(stripped) > 2 and stripped[-1] in _TRAILING_FILLERS:
+            stripped = stripped[:-1]
+        if stripped == term:
+            return "" if term in _SINGLE_FILLERS else term
+        term = stripped
+
+
+def _split_connectors(term):
+    parts = []
+    for piece in _CONNECTOR_PHRASES.split(term):
+        start = 0
+        for i, ch in enumerate(piece):
+            if ch in _CONNECTOR_CHARS and i - start >= 2 and len(piece) - i - 1 >= 2:
+                parts.append(piece[start:i])
+                start = i + 1
+        parts.append(piece[start:])
+    return parts
+
+
+def extract_search_key(prompt_text):
+    # 去掉天数后按分隔符切分，逐个词项剔除首尾填充词、按连接词拆开，排序去重得到与语序无关的关键词组合
+    text = unicodedata.normalize("NFKC", prompt_text or "").lower()
+    text = _DAYS_PATTERN.sub(" ", text)
+    terms = set()
+    for token in _SPLIT_PATTERN.split(text):
+        for part in _split_connectors(_strip_fillers(token)):
+            part = _strip_fillers(part)
+            if part:
+                terms.add(part)
+    return " ".join(sorted(terms))
+
+
+class SearchContextCache:
+    def __init__(self, fetcher=planner.scrape_snippets, fresh_seconds=6 * 3600, max_age_seconds=3 * 24 * 3600,
+                 failure_ttl_seconds=60, max_entries=1000, max_workers=4):
+        self.fetcher = fetcher
+        self.fresh_seconds = fresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.deadline_misses = 0
+        self._entries = OrderedDict()  # key -> (snippets, fetched_at, ok)
+        self._inflight = {}            # key -> Future，同一关键词同时只抓取一次
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-refresh")
+
+    def get_snippets(self, prompt_text, deadline_seconds=2.0):
+        key = extract_search_key(prompt_text)
+        if not key:
+            return []
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                snippets, fetched_at, ok = entry
+                age = now - fetched_at
+                fresh_limit = self.fresh_seconds if ok else self.failure_ttl_seconds
+                if age < fresh_limit:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return snippets
+                if ok and age < self.max_age_seconds:
+                    # 过了新鲜期：先用旧摘要，后台静默刷新
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    self._refresh(key)
+                    return snippets
+            self.misses += 1
+            future = self._refresh(key)
+
+        try:
+            return future.result(timeout=deadline_seconds)
+        except FutureTimeout:
+            # 截止时间内未抓到：不再阻塞大模型调用，抓取结果留给后续请求
+            self.deadline_misses += 1
+            metrics.DEADLINE_EXCEEDED.inc(stage="search")
+            return []
+        except Exception:
+            # 抓取失败或上游熔断中（fetcher 立即抛出 CircuitOpenError）：以空摘要放行
+            return []
+
+    def get_context(self, prompt_text, deadline_seconds=2.0):
+        return planner.build_search_context(self.get_snippets(prompt_text, deadline_seconds))
+
+    def _refresh(self, key):
+        # 调用方需持有 self._lock
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._executor.submit(self._fetch, key)
+            self._inflight[key] = future
+        return future
+
+    def _fetch(self, key):
+        try:
+            snippets = self.fetcher(key)
+            ok = True
+        except Exception:
+            snippets, ok = [], False
+        with self._lock:
+            self._inflight.pop(key, None)
+            previous = self._entries.get(key)
+            if ok or previous is None or not previous[2]:
+                self._entries[key] = (snippets, time.time(), ok)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if not ok:
+            raise RuntimeError(f"search fetch failed for {key!r}")
+        return snippets
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+            inflight = len(self._inflight)
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "deadline_misses": self.deadline_misses,
+            "entries": size,
+            "inflight": inflight,
+        }
@@ -0,0 +1,47 @@
+// 页面外壳脚本：由 app.py 的外壳加载器以 <script> 注入宿主页面一次，运行在宿主文档中，不随 rerun 重新执行。
+// 取代原先 setInterval(forceRemoveCloudBadges, 800) 的无限轮询：只挂一个 MutationObserver，
+// Streamlit Cloud 徽章一出现就地隐藏，外壳样式表被移除时立即补回，其余时间不做任何事。
+(function () {
+    if (window.__travelShell) return;
+    window.__travelShell = true;
+
+    const BADGE_SELECTOR = [
+        '[class^="viewerBadge_"]', '[class*="viewerBadge"]',
+        '.stDeployButton', '[data-testid="stAppDeployButton"]',
+        'iframe[src*="badges"]', 'iframe[title="streamlitApp"]',
+    ].join(',');
+    const current = document.currentScript;
+    const cssHref = current ? current.dataset.css : null;
+
+    function ensureStylesheet() {
+        if (!cssHref || document.getElementById('travel-shell-css')) return;
+        const link = document.createElement('link');
+        link.id = 'travel-shell-css';
+        link.rel = 'stylesheet';
+        link.href = cssHref;
+        document.head.appendChild(link);
+    }
+
+    function hideBadge(el) {
+        el.style.setProperty('display', 'none', 'important');
+        el.style.setProperty('visibility', 'hidden', 'important');
+        el.style.setProperty('pointer-events', 'none', 'important');
+    }
+
+    function sweep(node) {
+        if (node.nodeType !== 1) return;
+        if (node.matches(BADGE_SELECTOR)) hideBadge(node);
+        if (node.firstElementChild) node.querySelectorAll(BADGE_SELECTOR).forEach(hideBadge);
+    }
+
+    const observer = new MutationObserver(function (records) {
+        for (const record of records) {
+            for (const node of record.addedNodes) sweep(node);
+            if (record.target === document.head && record.removedNodes.length) ensureStylesheet();
+        }
+    });
+    ensureStylesheet();
+    sweep(document.body);
+    observer.observe(document.head, { childList: true });
+    observer.observe(document.body, { childList: true, subtree: true });
+})();
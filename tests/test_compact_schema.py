@@ -0,0 +1,35 @@
+from compact_schema import decode_compact, decode_compact_day, encode_compact
+from planner import is_valid_day
+
+
+def test_decode_day():
+    day = decode_compact_day(1, ["京都", [["09:00", "清水寺", "介绍", "34.9949", "135.785", "temple"]]])
+    assert day == {"date": "Day 2", "city": "京都", "activities": [
+        {"time": "09:00", "name": "清水寺", "desc": "介绍", "lat": 34.9949, "lng": 135.785, "img_keyword": "temple"}]}
+    assert is_valid_day(day)
+
+
+def test_missing_or_bad_coordinates_fail_validation():
+    # 缺坐标或坐标不可解析时不能补成 0.0，否则单日重试永远不会触发
+    missing = decode_compact_day(0, ["京都", [["09:00", "清水寺", "介绍"]]])
+    assert missing["activities"][0]["lat"] is None
+    assert not is_valid_day(missing)
+    bad = decode_compact_day(0, ["京都", [["09:00", "清水寺", "介绍", "北纬35度", 135.7, "temple"]]])
+    assert bad["activities"][0]["lat"] == "北纬35度"
+    assert not is_valid_day(bad)
+
+
+def test_verbose_day_kept_and_junk_dropped():
+    verbose = {"date": "Day 1", "city": "京都", "activities": []}
+    assert decode_compact_day(0, verbose) is verbose
+    assert decode_compact_day(0, "oops") is None
+
+
+def test_round_trip():
+    data = {"trip_title": "京都", "highlights": ["寺庙"], "days": [
+        {"date": "Day 1", "city": "京都", "activities": [
+            {"time": "09:00", "name": "清水寺", "desc": "介绍", "lat": 34.994856, "lng": 135.78505, "img_keyword": "temple"}]}]}
+    decoded = decode_compact(encode_compact(data))
+    assert decoded["trip_title"] == "京都"
+    assert decoded["days"][0]["activities"][0]["lat"] == 34.9949
+    assert decode_compact(data) is data
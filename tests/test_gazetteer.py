@@ -0,0 +1,47 @@
+import pytest
+
+from gazetteer import Gazetteer, build_index, check_itinerary
+from itinerary_model import Itinerary
+
+
+def _row(gid, name, alt, lat, lng, feature_class, population):
+    return "\t".join(map(str, [gid, name, name, alt, lat, lng, feature_class, "X", "JP",
+                               "", "", "", "", "", population, "", "", "", ""]))
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    source = tmp_path / "places.txt"
+    source.write_text("\n".join([
+        _row(1, "Kyoto", "京都", 35.0116, 135.7681, "P", 1400000),
+        _row(2, "Kiyomizu-dera", "清水寺", 34.9949, 135.7850, "S", 0),
+    ]) + "\n", encoding="utf-8")
+    index = tmp_path / "gazetteer.idx"
+    build_index([str(source)], str(index))
+    gazetteer = Gazetteer(str(index))
+    yield gazetteer
+    gazetteer.close()
+
+
+def _itinerary(lat, lng, name="茶屋"):
+    return Itinerary.from_dict({"days": [{"city": "京都", "activities": [
+        {"name": name, "lat": lat, "lng": lng}]}]})
+
+
+def test_string_coordinates_are_not_treated_as_missing(gazetteer):
+    # 字符串坐标先由 Itinerary.from_dict 归一，再做地名校验，不能被城市中心覆盖
+    itinerary = _itinerary("35.0050°N", "135.7600°E")
+    report = check_itinerary(gazetteer, itinerary)
+    act = itinerary.days[0].activities[0]
+    assert report["filled"] == 0
+    assert (act.lat, act.lng) == (35.005, 135.76)
+
+
+def test_missing_coordinates_filled_and_far_ones_snapped(gazetteer):
+    itinerary = _itinerary(None, "", name="无名小店")
+    assert check_itinerary(gazetteer, itinerary)["filled"] == 1
+    assert (itinerary.days[0].activities[0].lat, itinerary.days[0].activities[0].lng) == (35.0116, 135.7681)
+
+    itinerary = _itinerary(35.02, 135.80, name="清水寺 (Kiyomizu-dera)")
+    assert check_itinerary(gazetteer, itinerary)["snapped"] == 1
+    assert itinerary.days[0].activities[0].lat == 34.9949
@@ -0,0 +1,59 @@
+import pytest
+
+from itinerary_model import DEFAULT_SUBTITLE, DEFAULT_TITLE, Itinerary, as_itinerary, coerce_coordinate
+
+
+@pytest.mark.parametrize("value, limit, expected", [
+    (35.0116, 90, 35.0116),
+    ("35.0116", 90, 35.0116),
+    ("35.0116°N", 90, 35.0116),
+    ("33.9°S", 90, -33.9),
+    ("151.2°W", 180, -151.2),
+    ("35，5", 90, 35.5),
+    (None, 90, 0.0),
+    ("", 90, 0.0),
+    (True, 90, 0.0),
+    (95, 90, 0.0),
+    (float("nan"), 90, 0.0),
+])
+def test_coerce_coordinate(value, limit, expected):
+    assert coerce_coordinate(value, limit) == expected
+
+
+def test_from_dict_normalises_and_drops_invalid_parts():
+    itinerary = Itinerary.from_dict({
+        "trip_title": "  ",
+        "highlights": "寺庙",
+        "days": [
+            {"city": " 京都 ", "activities": [
+                {"name": " 清水寺 ", "lat": "34.99", "lng": "135.78"},
+                "not an activity",
+                {"name": "茶屋"},
+            ]},
+            None,
+            {"date": "第二天", "activities": "oops"},
+        ],
+    })
+    assert itinerary.trip_title == DEFAULT_TITLE
+    assert itinerary.trip_subtitle == DEFAULT_SUBTITLE
+    assert itinerary.cover_search == DEFAULT_TITLE
+    assert itinerary.highlights == ("寺庙",)
+    assert [day.date for day in itinerary.days] == ["Day 1", "第二天"]
+    first, second = itinerary.days[0].activities
+    assert (first.name, first.lat, first.lng, first.img_keyword) == ("清水寺", 34.99, 135.78, "清水寺")
+    assert not second.has_coords
+    assert itinerary.activity_count == 2
+    assert itinerary.days[1].activities == []
+
+
+def test_round_trip_and_as_itinerary():
+    itinerary = Itinerary.from_dict({"trip_title": "京都", "days": [
+        {"date": "Day 1", "city": "京都", "activities": [{"name": "清水寺", "lat": 34.99, "lng": 135.78}]}]})
+    assert Itinerary.from_dict(itinerary.to_dict()) == itinerary
+    assert as_itinerary(itinerary.to_json()) == itinerary
+    assert as_itinerary(itinerary) is itinerary
+
+
+def test_non_object_rejected():
+    with pytest.raises(ValueError):
+        Itinerary.from_dict(["not", "an", "object"])
@@ -0,0 +1,59 @@
+import json
+
+from itinerary_stream import ItineraryStreamParser
+
+ITINERARY = {
+    "trip_title": "京都",
+    "overview": "古都三日",
+    "days": [
+        {"date": "Day 1", "city": "京都", "activities": [{"name": "清水寺", "lat": 34.99, "lng": 135.78}]},
+        {"date": "Day 2", "city": "京都", "activities": [{"name": "金阁寺", "lat": 35.04, "lng": 135.73}]},
+    ],
+    "highlights": ["寺庙"],
+}
+
+
+def _feed(parser, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+def test_fields_and_days_emitted_as_they_close():
+    text = "```json\n" + json.dumps(ITINERARY, ensure_ascii=False) + "\n```"
+    parser = ItineraryStreamParser()
+    events = _feed(parser, text, 7)
+    assert [(kind, key) for kind, key, _ in events] == [
+        ("field", "trip_title"), ("field", "overview"), ("day", 0), ("day", 1), ("field", "highlights")]
+    assert events[3][2]["activities"][0]["name"] == "金阁寺"
+    assert parser.finished
+    assert parser.result() == ITINERARY
+
+
+def test_broken_day_is_repaired_or_kept_as_placeholder():
+    text = ('{"trip_title": "京都", "days": ['
+            '{"city": "京都", "activities": [{"name": "清水寺",}],},'
+            '{"city": "大阪", "activities": [{"name": "大阪城"}]}]}')
+    parser = ItineraryStreamParser()
+    events = _feed(parser, text, 5)
+    days = [value for kind, _, value in events if kind == "day"]
+    assert [day["city"] for day in days] == ["京都", "大阪"]
+    assert parser.repairs >= 1
+
+
+def test_truncated_stream_falls_back_to_parsed_parts():
+    text = json.dumps(ITINERARY, ensure_ascii=False)
+    cut = text.index('"highlights"')
+    parser = ItineraryStreamParser()
+    parser.feed(text[:cut])
+    assert not parser.finished
+    result = parser.result()
+    assert result["trip_title"] == "京都"
+    assert len(result["days"]) == 2
+
+
+def test_compact_days_key():
+    parser = ItineraryStreamParser(days_key="d")
+    events = parser.feed('{"t": "京都", "d": [["京都", [["09:00", "清水寺", "", 34.99, 135.78, ""]]]]}')
+    assert events[1] == ("day", 0, ["京都", [["09:00", "清水寺", "", 34.99, 135.78, ""]]])
@@ -0,0 +1,32 @@
+import pytest
+
+from json_repair import repair_json, strip_fences
+
+
+def test_valid_json_is_not_marked_repaired():
+    assert repair_json('{"a": 1}') == ({"a": 1}, False)
+    assert repair_json('```json\n{"a": 1}\n```') == ({"a": 1}, False)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2,],}', {"a": [1, 2]}),                        # 尾随逗号
+    ('说明文字 {"a": 1} 以上', {"a": 1}),                        # 前后杂质
+    ('{"desc": "他说"好"的"}', {"desc": '他说"好"的'}),            # 未转义的内嵌引号
+    ('{"desc": "第一行\n第二行"}', {"desc": "第一行\n第二行"}),      # 字符串内换行
+    ('{"a": [1, 2}', {"a": [1, 2]}),                            # 错配的括号
+])
+def test_common_defects_are_repaired(text, expected):
+    assert repair_json(text) == (expected, True)
+
+
+def test_truncated_output_keeps_complete_values():
+    data, repaired = repair_json('{"title": "京都", "days": [{"city": "京都"}, {"city": "大')
+    assert repaired
+    assert data["title"] == "京都"
+    assert data["days"][0] == {"city": "京都"}
+
+
+def test_unrepairable_text_raises():
+    with pytest.raises(ValueError):
+        repair_json("no json here")
+    assert strip_fences(None) == ""
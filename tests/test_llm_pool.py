@@ -0,0 +1,20 @@
+from llm_pool import LatencyTracker, request_profile
+
+
+def test_censored_samples_stay_out_of_quantile():
+    tracker = LatencyTracker()
+    for seconds in range(1, 11):
+        tracker.observe(float(seconds))
+    for _ in range(50):
+        # 被对冲提前取消的一路：只是下界，不能拉低 p90
+        tracker.observe_censored(0.5)
+    assert len(tracker) == 10
+    assert tracker.censored == 50
+    assert tracker.quantile(0.9) == 10.0
+
+
+def test_request_profile_buckets():
+    assert request_profile("stream", 0) == "stream:unknown"
+    assert request_profile("stream", 3) == "stream:le3d"
+    assert request_profile("fanout", 10) == "fanout:le14d"
+    assert request_profile("fanout", 30) == "fanout:gt14d"
@@ -0,0 +1,26 @@
+import os
+
+import offline_bundle
+from offline_bundle import OfflineBundler
+
+
+def test_image_cache_is_byte_bounded(tmp_path, monkeypatch):
+    fetched = []
+
+    def fake_fetch(url, timeout, headers=None):
+        fetched.append(url)
+        return b"<svg>" + b"x" * 95, "image/svg+xml"
+
+    monkeypatch.setattr(offline_bundle, "_fetch", fake_fetch)
+    cache_dir = tmp_path / "images"
+    bundler = OfflineBundler(image_cache_dir=str(cache_dir), image_cache_max_bytes=250)
+    for i in range(5):
+        bundler.image(f"https://example.org/{i}.svg", 640)
+    assert bundler.image_cache_bytes <= 250
+    assert len(os.listdir(cache_dir)) == 2
+
+    # 最近用过的仍命中，不再下载；重启后按磁盘文件重建索引
+    bundler.image("https://example.org/4.svg", 640)
+    assert len(fetched) == 5
+    restarted = OfflineBundler(image_cache_dir=str(cache_dir), image_cache_max_bytes=250)
+    assert restarted.image_cache_bytes == 200
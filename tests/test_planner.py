@@ -0,0 +1,31 @@
+import pytest
+
+from planner import estimate_trip_days, is_valid_day
+
+
+@pytest.mark.parametrize("prompt, days", [
+    ("京都14天", 14),
+    ("去云南玩十天", 10),
+    ("成都5日游", 5),
+    ("冲绳4晚", 5),
+    ("欧洲两周", 14),
+    ("Paris 7 days", 7),
+    ("二十一天环游新疆", 21),
+    # 日期不是天数；多个时长取最大
+    ("5月1日出发去云南玩10天", 10),
+    ("五月一号出发，京都3天", 3),
+    ("10/1 出发 大阪 4天", 4),
+    ("5天4晚", 5),
+    ("周末两天，共玩十天", 10),
+    ("大理3日", 3),
+    ("随便逛逛", 0),
+])
+def test_estimate_trip_days(prompt, days):
+    assert estimate_trip_days(prompt) == days
+
+
+def test_is_valid_day():
+    assert is_valid_day({"activities": [{"name": "清水寺", "lat": "34.99", "lng": 135.78}]})
+    assert not is_valid_day({"activities": []})
+    assert not is_valid_day({"activities": [{"name": "清水寺", "lat": None, "lng": 135.78}]})
+    assert not is_valid_day(None)
@@ -0,0 +1,39 @@
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError
+from retrieval import ContentRetriever, build_query_variants
+from search_cache import extract_search_key
+
+
+@pytest.mark.parametrize("prompt, expected", [
+    ("我想去日本京都玩3天，喜欢古建筑和美食", ["日本京都 行程", "日本京都 古建筑 美食"]),
+    ("带爸妈去成都重庆5日游，不想太累", ["成都重庆 行程", "成都", "重庆"]),
+    ("5月出发 去大阪 京都", ["京都 大阪 行程", "京都", "大阪"]),
+    ("我想去埃及玩7天", ["埃及 行程"]),
+    ("去和田玩5天", ["和田 行程"]),
+    ("呼和浩特3日游", ["呼和浩特 行程"]),
+])
+def test_query_variants(prompt, expected):
+    assert build_query_variants(extract_search_key(prompt)) == expected
+
+
+def test_variants_fall_back_to_search_key():
+    # 只剩偏好词时仍然检索，不返回空列表
+    assert build_query_variants("不想太累") == ["不想太累"]
+    assert build_query_variants("") == []
+
+
+def test_breaker_counts_one_failure_per_retrieval():
+    def search(query):
+        raise OSError("upstream down")
+
+    breaker = CircuitBreaker("test-search", failure_threshold=2, cooldown_seconds=60)
+    retriever = ContentRetriever(search=search, fetch_pages=False, deadline_seconds=1.0, breaker=breaker)
+    with pytest.raises(OSError):
+        retriever.retrieve("京都 大阪 奈良 美食")
+    assert breaker.stats()["failures"] == 1
+    assert breaker.state != "open"
+    with pytest.raises(OSError):
+        retriever.retrieve("京都 大阪 奈良 美食")
+    with pytest.raises(CircuitOpenError):
+        retriever.retrieve("京都 大阪 奈良 美食")
@@ -0,0 +1,28 @@
+import pytest
+
+from search_cache import extract_search_key
+
+
+@pytest.mark.parametrize("prompt, key", [
+    # 单字填充词不能切坏地名
+    ("我想去埃及玩7天", "埃及"),
+    ("去和田玩5天", "和田"),
+    ("呼和浩特3日游", "呼和浩特 游"),
+])
+def test_place_names_survive_filler_removal(prompt, key):
+    assert extract_search_key(prompt) == key
+
+
+def test_same_destination_shares_key():
+    assert extract_search_key("我想去京都玩3天") == extract_search_key("京都5天") == "京都"
+
+
+def test_connectors_split_terms():
+    assert extract_search_key("我想去日本京都玩3天，喜欢古建筑和美食") == "古建筑 日本京都 美食"
+    assert extract_search_key("京都和大阪玩5天") == "京都 大阪"
+    assert extract_search_key("成都以及重庆") == "成都 重庆"
+
+
+def test_empty_prompt():
+    assert extract_search_key("") == ""
+    assert extract_search_key(None) == ""
@@ -0,0 +1,240 @@
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+
+# --- 地图瓦片缓存代理 ---
+# 页面上每张 Leaflet 地图都直接向高德 / Google 拉瓦片，热门目的地被每位访客重复下载，延迟与失败也不可控。
+# 本代理提供 /tiles/<provider>/<z>/<x>/<y> 端点，页面的 L.tileLayer 改为指向这里：
+# 瓦片落盘缓存，总字节数有上限；同一瓦片的并发请求只回源一次；按缩放级别区别对待淘汰顺序，
+# 低缩放级别（城市、国家尺度）被大量行程共用，保留得更久，街道级的高缩放瓦片老化得更快。
+
+TILE_PROVIDERS = {
+    "amap": "https://wprd01.is.autonavi.com/appmaptile?x={x}&y={y}&z={z}&lang=zh_cn&size=1&scl=1&style=7",
+    "google": "https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
+}
+MAX_ZOOM = 19
+RETENTION_PIVOT_ZOOM = 12     # 该级别的瓦片按实际闲置时间老化
+ZOOM_AGING_STEP = 2           # 每高出（低于）这么多级，老化速度翻倍（减半）
+_TILE_PATH = re.compile(r"^/tiles/([a-z]+)/(\d+)/(\d+)/(\d+)(?:\.png)?$")
+
+
+def zoom_aging_factor(zoom):
+    return 2 ** ((zoom - RETENTION_PIVOT_ZOOM) / ZOOM_AGING_STEP)
+
+
+class TileCache:
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, providers=None, timeout=8):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.providers = providers or TILE_PROVIDERS
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_errors = 0
+        self.write_errors = 0
+        self.bytes = 0
+        self._lru = {}              # zoom -> OrderedDict(key -> (size, last_access))，每个缩放级别一条 LRU 链
+        self._inflight = {}         # key -> Future，同一瓦片并发请求只回源一次
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        provider, z, x, y = key
+        return os.path.join(self.directory, provider, str(z), str(x), f"{y}.png")
+
+    def _load_index(self):
+        # 启动时按文件修改时间重建 LRU，缓存跨进程重启保留
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".png"):
+                    continue
+                path = os.path.join(root, name)
+                parts = os.path.relpath(path, self.directory).split(os.sep)
+                if len(parts) != 4:
+                    continue
+                try:
+                    key = (parts[0], int(parts[1]), int(parts[2]), int(parts[3][:-4]))
+                    stat = os.stat(path)
+                except (ValueError, OSError):
+                    continue
+                entries.append((stat.st_mtime, key, stat.st_size))
+        for mtime, key, size in sorted(entries):
+            self._lru.setdefault(key[1], OrderedDict())[key] = (size, mtime)
+            self.bytes += size
+        with self._lock:
+            self._evict()
+
+    def _touch(self, key, size):
+        chain = self._lru.setdefault(key[1], OrderedDict())
+        chain[key] = (size, time.time())
+        chain.move_to_end(key)
+
+    def _evict(self):
+        # 超出容量时，在各缩放级别的 LRU 链头中挑“闲置时间 × 老化系数”最大的淘汰
+        now = time.time()
+        while self.bytes > self.max_bytes:
+            victim = None
+            for zoom, chain in self._lru.items():
+                if not chain:
+                    continue
+                key, (size, last_access) = next(iter(chain.items()))
+                score = (now - last_access + 1) * zoom_aging_factor(zoom)
+                if victim is None or score > victim[0]:
+                    victim = (score, key, size)
+            if victim is None:
+                break
+            _, key, size = victim
+            del self._lru[key[1]][key]
+            self.bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _fetch_upstream(self, key):
+        provider, z, x, y = key
+        url = self.providers[provider].format(x=x, y=y, z=z)
+        req = urllib.request.Request(url, headers={"User-Agent": "TravelAgenda/1.0 (tile cache)"})
+        with metrics.STAGE_SECONDS.time(stage="tile_fetch"):
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.read()
+
+    def get(self, provider, z, x, y):
+        # 返回瓦片字节；参数非法抛 KeyError / ValueError，回源失败抛出原异常
+        if provider not in self.providers:
+            raise KeyError(provider)
+        if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError("tile coordinates out of range")
+        key = (provider, z, x, y)
+        path = self._path(key)
+        with self._lock:
+            entry = self._lru.get(z, {}).get(key)
+            if entry is not None:
+                self.hits += 1
+                self._touch(key, entry[0])
+                owner = None
+            else:
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    self.misses += 1
+                    future = self._inflight[key] = Future()
+                else:
+                    self.coalesced += 1
+        if entry is not None:
+            try:
+                with open(path, "rb") as f:
+                    metrics.TILE_REQUESTS.inc(result="hit")
+                    return f.read()
+            except OSError:
+                # 文件被外部删除：从索引中去掉，按未命中重新回源
+                with self._lock:
+                    if self._lru.get(z, {}).pop(key, None) is not None:
+                        self.bytes -= entry[0]
+                return self.get(provider, z, x, y)
+        if not owner:
+            metrics.TILE_REQUESTS.inc(result="coalesced")
+            return future.result(timeout=self.timeout * 2)
+
+        metrics.TILE_REQUESTS.inc(result="miss")
+        try:
+            body = self._fetch_upstream(key)
+        except Exception as e:
+            with self._lock:
+                self.upstream_errors += 1
+                self._inflight.pop(key, None)
+            metrics.TILE_REQUESTS.inc(result="error")
+            future.set_exception(e)
+            raise
+        # 无论落盘成败，都要结束 Future 并移出 _inflight，否则之后同一瓦片的请求都会等到超时
+        try:
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp, "wb") as f:
+                    f.write(body)
+                os.replace(tmp, path)
+            except OSError:
+                # 磁盘写入失败（满了、权限）：瓦片照常返回，只是不进缓存
+                self.write_errors += 1
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            else:
+                with self._lock:
+                    self._touch(key, len(body))
+                    self.bytes += len(body)
+                    self._evict()
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(body)
+        return body
+
+    def stats(self):
+        with self._lock:
+            entries = sum(len(chain) for chain in self._lru.values())
+            by_zoom = {zoom: len(chain) for zoom, chain in sorted(self._lru.items()) if chain}
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_errors": self.upstream_errors,
+            "write_errors": self.write_errors,
+            "hit_rate": (self.hits + self.coalesced) / total if total else 0.0,
+            "entries": entries,
+            "bytes": self.bytes,
+            "entries_by_zoom": by_zoom,
+        }
+
+
+def start_tile_proxy(cache, port, host="0.0.0.0"):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type, cache_control="no-store"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", cache_control)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/tiles/stats":
+                self._send(200, json.dumps(cache.stats()).encode("utf-8"), "application/json")
+                return
+            match = _TILE_PATH.match(path)
+            if not match:
+                self._send(404, b"not found", "text/plain")
+                return
+            provider, z, x, y = match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))
+            try:
+                body = cache.get(provider, z, x, y)
+            except (KeyError, ValueError):
+                self._send(404, b"unknown tile", "text/plain")
+                return
+            except Exception:
+                self._send(502, b"upstream error", "text/plain")
+                return
+            # 浏览器侧也缓存一天，同一访客重复打开不再请求代理
+            self._send(200, body, "image/png", "public, max-age=86400")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="tile-proxy", daemon=True).start()
+    return server
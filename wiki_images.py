@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+import metrics
+from itinerary_model import as_itinerary
+
+# --- 服务端批量解析 Wikipedia 缩略图 ---
+# 原先页面里封面和每个活动各自 fetch 一次 MediaWiki API，十天行程要在手机上发出几十个请求。
+# 这里在服务端收集所有 img_keyword / cover_search，每 50 个标题合并成一次 query 请求，
+# 处理好 normalized 与 redirects 的映射后，把 标题 -> 缩略图 URL 缓存起来，最终地址直接写进页面数据。
+
+WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
+MAX_TITLES_PER_REQUEST = 50  # MediaWiki 对普通客户端的 titles 上限
+COVER_THUMB_SIZE = 1600
+PHOTO_THUMB_SIZE = 800
+
+
+class WikiThumbnailResolver:
+    def __init__(self, api_url=WIKI_API_URL, batch_size=MAX_TITLES_PER_REQUEST, timeout=5,
+                 ttl_seconds=7 * 24 * 3600, max_entries=20000, breaker=None):
+        self.api_url = api_url
+        self.breaker = breaker       # resilience.CircuitBreaker；熔断期间不再请求，直接按未找到处理
+        self.batch_size = min(batch_size, MAX_TITLES_PER_REQUEST)
+        self.timeout = timeout
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.requests_made = 0
+        self._cache = OrderedDict()  # (title, size) -> (url 或 None, cached_at)
+        self._lock = threading.Lock()
+
+    def resolve(self, titles, thumb_size=PHOTO_THUMB_SIZE, deadline_seconds=None):
+        # 返回 {原始标题: 缩略图 URL 或 None}；None 表示维基百科没有对应配图
+        # 给出 deadline_seconds 时所有批次共用这段时间，用完后剩余标题按未找到处理（不写缓存）
+        expires_at = None if deadline_seconds is None else time.monotonic() + deadline_seconds
+        results = {}
+        pending = []
+        now = time.time()
+        with self._lock:
+            for title in dict.fromkeys(t for t in titles if t):
+                entry = self._cache.get((title, thumb_size))
+                if entry is not None and now - entry[1] < self.ttl_seconds:
+                    self._cache.move_to_end((title, thumb_size))
+                    results[title] = entry[0]
+                else:
+                    pending.append(title)
+
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            timeout = self.timeout if expires_at is None else min(self.timeout, expires_at - time.monotonic())
+            if timeout <= 0:
+                # 时间预算用完：剩余批次不再请求
+                metrics.DEADLINE_EXCEEDED.inc(stage="images")
+                for title in pending[start:]:
+                    results[title] = None
+                break
+            try:
+                if self.breaker is not None:
+                    found = self.breaker.call(self._query_batch, batch, thumb_size, timeout)
+                else:
+                    found = self._query_batch(batch, thumb_size, timeout)
+            except Exception:
+                # 网络失败或上游熔断中：不写入缓存，本次按未找到处理，交给 Bing 兜底
+                for title in batch:
+                    results[title] = None
+                continue
+            with self._lock:
+                for title in batch:
+                    url = found.get(title)
+                    results[title] = url
+                    self._cache[(title, thumb_size)] = (url, time.time())
+                    self._cache.move_to_end((title, thumb_size))
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return results
+
+    def _query_batch(self, titles, thumb_size, timeout):
+        params = {
+            "action": "query",
+            "titles": "|".join(titles),
+            "prop": "pageimages",
+            "piprop": "thumbnail",
+            "pithumbsize": thumb_size,
+            "pilimit": MAX_TITLES_PER_REQUEST,
+            "redirects": 1,
+            "format": "json",
+            "formatversion": 2,
+        }
+        url = self.api_url + "?" + urllib.parse.urlencode(params)
+        req = urllib.request.Request(url, headers={"User-Agent": "TravelAgenda/1.0 (itinerary thumbnail resolver)"})
+        self.requests_made += 1
+        payload = json.loads(urllib.request.urlopen(req, timeout=timeout).read().decode("utf-8"))
+        query = payload.get("query", {})
+
+        # 原始标题 -> 规范化标题 -> 重定向目标，逐级映射到最终页面
+        normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+        redirects = {r["from"]: r["to"] for r in query.get("redirects", [])}
+        thumbs = {}
+        for page in query.get("pages", []):
+            if page.get("thumbnail"):
+                thumbs[page["title"]] = page["thumbnail"]["source"]
+
+        found = {}
+        for title in titles:
+            target = normalized.get(title, title)
+            seen = set()
+            while target in redirects and target not in seen:
+                seen.add(target)
+                target = redirects[target]
+            found[title] = thumbs.get(target)
+        return found
+
+    def resolve_itinerary(self, data, deadline_seconds=None):
+        # 一次性解析整趟行程的封面与全部活动配图；deadline_seconds 为封面与活动配图共用的时间预算
+        data = as_itinerary(data)
+        expires_at = None if deadline_seconds is None else time.monotonic() + deadline_seconds
+
+        def budget():
+            return None if expires_at is None else max(0.0, expires_at - time.monotonic())
+
+        cover_title = data.cover_search.split(" ")[0]
+        keywords = [act.img_keyword for _, _, act in data.activities()]
+        cover = self.resolve([cover_title], COVER_THUMB_SIZE, budget()).get(cover_title) if cover_title else None
+        return {"cover": cover, "photos": self.resolve(keywords, PHOTO_THUMB_SIZE, budget())}